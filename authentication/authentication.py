@@ -0,0 +1,45 @@
+from django.db import router
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+# user fields embedded in tokens by ClaimsTokenObtainPairSerializer
+USER_CLAIMS = ['email', 'first_name', 'last_name', 'is_staff']
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication building request.user from the token claims,
+    instead of loading its row from the users table on every request.
+    request.user is a real User whose other fields are deferred :
+    they are loaded from database when read for the first time.
+    Tokens are revoked by User.revoke_tokens(), whose version is cached,
+    and rejected once the user is inactive"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable '
+                               'user identification')
+
+        # tokens given before claims were embedded
+        if any(claim not in validated_token
+               for claim in USER_CLAIMS + ['token_version']):
+            return super().get_user(validated_token)
+
+        if validated_token['token_version'] \
+                != User.get_token_version(user_id):
+            raise AuthenticationFailed('Token has been revoked',
+                                       code='token_revoked')
+
+        claims = {claim: validated_token[claim]
+                  for claim in USER_CLAIMS + ['token_version']}
+        claims['id'] = user_id
+        # from_db expects values in the order of the model fields
+        field_names = [field.attname for field in User._meta.concrete_fields
+                       if field.attname in claims]
+        values = [claims[name] for name in field_names]
+        return User.from_db(router.db_for_read(User), field_names, values)
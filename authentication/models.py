@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.core.cache import caches
+from django.db import models, router
+from django.db.models import F
 
 
 class SoftDeskUserManager(BaseUserManager):
@@ -34,6 +37,8 @@ class SoftDeskUserManager(BaseUserManager):
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     username = None
+    # embedded in JWT, incrementing it revokes every token of the user
+    token_version = models.PositiveIntegerField(default=0)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name']
@@ -42,3 +47,41 @@ class User(AbstractUser):
 
     def __str__(self):
         return f'{self.first_name} {str.upper(self.last_name)}'
+
+    @staticmethod
+    def token_version_key(user_id) -> str:
+        return f'token_version:{user_id}'
+
+    @classmethod
+    def get_token_version(cls, user_id):
+        """return the current token version of a user, from cache
+        or from database on cache miss, None if user doesn't exist
+        or is inactive"""
+        cache = caches[settings.TOKEN_VERSION_CACHE]
+        key = cls.token_version_key(user_id)
+        version = cache.get(key)
+        if version is None:
+            # read from the primary database, a replica may lag
+            version = cls.objects.using(router.db_for_write(cls)) \
+                .filter(pk=user_id, is_active=True) \
+                .values_list('token_version', flat=True).first()
+            if version is not None:
+                cache.set(key, version,
+                          settings.TOKEN_VERSION_CACHE_TIMEOUT)
+        return version
+
+    def save(self, *args, **kwargs):
+        """is_active or token_version may have changed, the cached token
+        version is read again"""
+        super().save(*args, **kwargs)
+        caches[settings.TOKEN_VERSION_CACHE] \
+            .delete(self.token_version_key(self.pk))
+
+    def revoke_tokens(self):
+        """invalidate every token given to this user until now"""
+        User.objects.filter(pk=self.pk) \
+            .update(token_version=F('token_version') + 1)
+        self.refresh_from_db(using=router.db_for_write(User, instance=self),
+                             fields=['token_version'])
+        caches[settings.TOKEN_VERSION_CACHE] \
+            .delete(self.token_version_key(self.pk))
@@ -2,12 +2,14 @@ from rest_framework.serializers import ModelSerializer, EmailField, \
     CharField, ValidationError
 
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.password_validation import validate_password
 
+from restAPI.fieldsets import FieldsetMixin
 from .models import User
 
 
-class RegisterSerializer(ModelSerializer):
+class RegisterSerializer(FieldsetMixin, ModelSerializer):
     email = EmailField(required=True,
                        validators=
                        [UniqueValidator(queryset=User.objects.all())])
@@ -19,7 +21,8 @@ class RegisterSerializer(ModelSerializer):
 
     class Meta:
         model = User
-        fields = '__all__'
+        # token_version is only moved by User.revoke_tokens()
+        exclude = ['token_version']
         extra_kwargs = {
             'first_name': {'required': True},
             'last_name': {'required': True}
@@ -45,7 +48,23 @@ class RegisterSerializer(ModelSerializer):
         return user
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(FieldsetMixin, ModelSerializer):
     class Meta:
         model = User
         fields = ['first_name', 'last_name']
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Embed in tokens what is needed to build request.user
+    without reading the users table (see authentication.py)"""
+
+    @classmethod
+    def get_token(cls, user):
+        # claims of the refresh token are copied in access tokens
+        token = super().get_token(user)
+        token['email'] = user.email
+        token['first_name'] = user.first_name
+        token['last_name'] = user.last_name
+        token['is_staff'] = user.is_staff
+        token['token_version'] = user.token_version
+        return token
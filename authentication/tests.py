@@ -1,3 +1,87 @@
-from django.test import TestCase
+from django.core.cache import caches
+from django.urls import reverse_lazy
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIRequestFactory
 
-# Create your tests here.
+from .authentication import ClaimsJWTAuthentication
+from .models import User
+
+
+class TestClaimsJWTAuthentication(APITestCase):
+    """Class to test building request.user from token claims"""
+    user_to_create = {"first_name": "Emmanuel",
+                      "last_name": "Albisser",
+                      "email": "toto@gmail.com",
+                      "password": "test"}
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(**self.user_to_create)
+
+    def get_token(self) -> str:
+        """log in and return the access token"""
+        response = self.client.post(reverse_lazy('login'),
+                                    data={'email': self.user.email,
+                                          'password': 'test'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()['access']
+
+    @staticmethod
+    def authenticate(token):
+        """authenticate a request carrying the access token"""
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return ClaimsJWTAuthentication().authenticate(Request(request))
+
+    def test_user_from_claims(self):
+        """user is built from claims, without any query once cached"""
+        token = self.get_token()
+        self.authenticate(token)
+
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(token)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(str(user), str(self.user))
+        self.assertFalse(user.is_staff)
+
+        # other fields are loaded when read
+        with self.assertNumQueries(1):
+            self.assertTrue(user.is_active)
+
+    def test_revoke(self):
+        """incrementing token version rejects tokens given before"""
+        token = self.get_token()
+        self.authenticate(token)
+
+        self.user.revoke_tokens()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+        user, _ = self.authenticate(self.get_token())
+        self.assertEqual(user, self.user)
+
+    def test_inactive(self):
+        """tokens of an inactive user are rejected"""
+        token = self.get_token()
+        self.authenticate(token)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_signup_token_version(self):
+        """token version is neither given nor set at signup"""
+        response = self.client.post(reverse_lazy('signup'), data={
+            'email': 'new@gmail.com', 'first_name': 'New',
+            'last_name': 'User', 'password': 'Soft-Desk-2022',
+            'password2': 'Soft-Desk-2022', 'token_version': 5})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('token_version', response.json())
+        self.assertEqual(User.objects.get(email='new@gmail.com')
+                         .token_version, 0)
@@ -2,12 +2,32 @@ from django.contrib import admin
 from .models import Project, Issue, Comment, Contributor
 
 
+# relations shown in the lists are joined in the changelist query,
+# with list_select_related, instead of one query per row
+
+
 class ProjectAdmin(admin.ModelAdmin):
     list_display = ('title', 'type')
 
 
-admin.site.register(Project, ProjectAdmin)
-admin.site.register(Contributor)
-admin.site.register(Issue)
-admin.site.register(Comment)
+class ContributorAdmin(admin.ModelAdmin):
+    # __str__ shows the user and the project
+    list_display = ('__str__', 'role')
+    list_select_related = ('user', 'project')
+
+
+class IssueAdmin(admin.ModelAdmin):
+    list_display = ('title', 'project', 'status', 'author_user',
+                    'assignee_user')
+    list_select_related = ('project', 'author_user', 'assignee_user')
 
+
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'issue', 'author_user')
+    list_select_related = ('issue', 'author_user')
+
+
+admin.site.register(Project, ProjectAdmin)
+admin.site.register(Contributor, ContributorAdmin)
+admin.site.register(Issue, IssueAdmin)
+admin.site.register(Comment, CommentAdmin)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RestapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'restAPI'
+
+    def ready(self):
+        # connect signal receivers
+        from restAPI import signals  # noqa: F401
@@ -0,0 +1,6 @@
+"""Benchmarks of the SoftDesk API
+
+These modules are not collected by `python manage.py test`,
+launch them explicitly, for instance :
+`python manage.py test restAPI.benchmarks.bench_routes`
+"""
@@ -0,0 +1,109 @@
+"""Micro-benchmark of the JSON backends of restAPI/jsonlib.py,
+and of MessagePack against JSON
+
+Renders and parses a serialized list of issues (BENCH_ISSUES, default
+500) with DRF JSONRenderer and with FastJSONRenderer / FastJSONParser
+on each installed backend, and prints their median times.
+Then compares size and times of JSON and MessagePack responses
+of IssuesFromProjectAPIView (when msgpack is installed).
+"""
+import io
+import os
+import statistics
+import time
+from unittest import skipUnless
+
+from django.urls import reverse
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from authentication.models import User
+from restAPI.jsonlib import BACKENDS
+from restAPI.models import Project, Issue
+from restAPI.parsers import FastJSONParser, MessagePackParser
+from restAPI.renderers import FastJSONRenderer, MessagePackRenderer, \
+    msgpack
+from restAPI.serializers import IssueSerializer
+
+NB_ISSUES = int(os.environ.get('BENCH_ISSUES', 500))
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 20))
+
+
+def median_ms(function) -> float:
+    durations = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(durations), 3)
+
+
+class JSONBenchmark(APITestCase):
+    """Compare encoders on the data of an issues list response"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='bench@softdesk.com',
+                                            password='bench',
+                                            first_name='Bench',
+                                            last_name='Mark')
+        cls.project = Project.objects.create(
+            title='Projet',
+            description='Projet de benchmark',
+            type=Project.Type.BACK_END)
+        cls.project.add_contributor(cls.user)
+        Issue.objects.bulk_create(
+            Issue(title=f'Issue {i}',
+                  desc='Issue de benchmark, avec des accents : éèà',
+                  tag=Issue.Type.BUG,
+                  priority=Issue.Priority.MOYENNE,
+                  project=cls.project,
+                  author_user=cls.user,
+                  assignee_user=cls.user)
+            for i in range(NB_ISSUES))
+
+    def test_backends(self):
+        data = {'next': None,
+                'results': IssueSerializer(Issue.objects.all(),
+                                           many=True).data}
+        reference = JSONRenderer().render(data)
+
+        candidates = {'drf': (JSONRenderer(), JSONParser())}
+        for name in BACKENDS:
+            renderer, parser = FastJSONRenderer(), FastJSONParser()
+            renderer.backend = parser.backend = name
+            candidates[name] = (renderer, parser)
+
+        print(f'\n{NB_ISSUES} issues, {len(reference)} bytes')
+        print(f'{"backend":<10}{"render ms":>12}{"parse ms":>12}')
+        for name, (renderer, parser) in candidates.items():
+            content = renderer.render(data)
+            self.assertEqual(content, reference, name)
+
+            render = median_ms(lambda: renderer.render(data))
+            parse = median_ms(lambda: parser.parse(io.BytesIO(content)))
+            print(f'{name:<10}{render:>12}{parse:>12}')
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        """a page of issues, as the API sends it"""
+        self.client.force_authenticate(user=self.user)
+        url = reverse('issues-from-project',
+                      kwargs={'project_id': self.project.id})
+        formats = {'json': (FastJSONRenderer(), FastJSONParser()),
+                   'msgpack': (MessagePackRenderer(), MessagePackParser())}
+
+        print(f'\n{"format":<10}{"bytes":>10}{"render ms":>12}'
+              f'{"parse ms":>12}')
+        for name, (renderer, parser) in formats.items():
+            response = self.client.get(url, data={'page_size': 100},
+                                       HTTP_ACCEPT=renderer.media_type)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), 100)
+
+            render = median_ms(lambda: renderer.render(response.data))
+            parse = median_ms(
+                lambda: parser.parse(io.BytesIO(response.content)))
+            print(f'{name:<10}{len(response.content):>10}'
+                  f'{render:>12}{parse:>12}')
@@ -0,0 +1,367 @@
+"""Query-count and latency budgets for every route of softDesk/urls.py
+
+Seeds a realistic volume of data (can be tuned with BENCH_* environment
+variables), calls each route several times and records its query count,
+p50/p95 latency and peak allocations.
+Each call is computed : cached pages are dropped before it, and routes
+consuming what they write (deletions, additions of users) are given
+new objects, created before the call is measured.
+The run fails when a route goes over the budget stored in budgets.json,
+launch it with BENCH_UPDATE_BUDGETS=1 to store the measured query counts
+as the new budgets.
+"""
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from itertools import count
+from pathlib import Path
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from authentication.models import User
+from restAPI import changes, response_cache, search
+from restAPI.management.commands.rebuild_counters import rebuild_counters
+from restAPI.models import Project, Issue, Comment, Contributor
+from restAPI.views.views import ChangesFromProjectAPIView
+
+BUDGETS_FILE = Path(__file__).resolve().parent / 'budgets.json'
+
+NB_PROJECTS = int(os.environ.get('BENCH_PROJECTS', 2000))
+NB_ISSUES = int(os.environ.get('BENCH_ISSUES', 500))
+NB_COMMENTS = int(os.environ.get('BENCH_COMMENTS', 300))
+NB_USERS = int(os.environ.get('BENCH_USERS', 50))
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 20))
+UPDATE_BUDGETS = os.environ.get('BENCH_UPDATE_BUDGETS') == '1'
+
+
+def percentile(values, percent) -> float:
+    """return the percentile of a list of values, in the same unit"""
+    ordered = sorted(values)
+    index = round(percent / 100 * (len(ordered) - 1))
+    return ordered[index]
+
+
+class RouteBenchmark(APITestCase):
+    """Exercise every route of the API against a seeded database"""
+
+    # numbers of the objects created for the calls
+    numbers = count()
+
+    @classmethod
+    def setUpTestData(cls):
+        # staff for monitoring/
+        cls.user = User.objects.create_user(email='bench@softdesk.com',
+                                            password='bench',
+                                            first_name='Bench',
+                                            last_name='Mark',
+                                            is_staff=True)
+        users = User.objects.bulk_create(
+            User(email=f'user{i}@softdesk.com',
+                 first_name='User', last_name=str(i))
+            for i in range(NB_USERS))
+
+        projects = Project.objects.bulk_create(
+            Project(title=f'Projet {i}',
+                    description='Projet de benchmark',
+                    type=Project.Type.BACK_END)
+            for i in range(NB_PROJECTS))
+        cls.project = projects[0]
+
+        # bench user is the author of every project,
+        # the other users all contribute to the benchmarked one
+        Contributor.objects.bulk_create(
+            Contributor(user=cls.user, project=project,
+                        role=Contributor.Role.author)
+            for project in projects)
+        Contributor.objects.bulk_create(
+            Contributor(user=user, project=cls.project,
+                        role=Contributor.Role.contributor)
+            for user in users)
+
+        issues = Issue.objects.bulk_create(
+            Issue(title=f'Issue {i}',
+                  desc='Issue de benchmark',
+                  tag=Issue.Type.BUG,
+                  priority=Issue.Priority.MOYENNE,
+                  project=cls.project,
+                  author_user=cls.user,
+                  assignee_user=cls.user)
+            for i in range(NB_ISSUES))
+        cls.issue = issues[0]
+        cls.issues = issues
+
+        comments = Comment.objects.bulk_create(
+            Comment(description=f'Commentaire {i}',
+                    author_user=cls.user,
+                    issue=cls.issue)
+            for i in range(NB_COMMENTS))
+        cls.comment = comments[0]
+        cls.user_to_manage = users[0]
+
+        # bulk_create doesn't maintain counters, search index
+        # nor change feed
+        rebuild_counters()
+        search.rebuild()
+        changes.record(issues)
+        changes.record(comments)
+        # a poll of the last seeded changes, with issues and comments
+        # whatever the volumes, and without the changes of the writes
+        cls.changes_limit = min(NB_ISSUES + NB_COMMENTS,
+                                ChangesFromProjectAPIView.default_limit)
+        cls.changes_since = changes.last_change_id(cls.project.id) \
+            - cls.changes_limit
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def new_users(self, number=1) -> list:
+        """users who are not contributors of any project"""
+        return User.objects.bulk_create(
+            User(email=f'new{n}@softdesk.com',
+                 first_name='New', last_name=str(n))
+            for n in (next(self.numbers) for _ in range(number)))
+
+    def new_contributors(self, number=1) -> list:
+        users = self.new_users(number)
+        self.project.add_contributors(users)
+        return users
+
+    def new_issues(self, number=1) -> list:
+        return [Issue.objects.create(title='Issue à supprimer',
+                                     desc='Issue de benchmark',
+                                     tag=Issue.Type.BUG,
+                                     priority=Issue.Priority.MOYENNE,
+                                     project=self.project,
+                                     author_user=self.user,
+                                     assignee_user=self.user)
+                for _ in range(number)]
+
+    def new_project(self) -> Project:
+        project = Project.objects.create(title='Projet à supprimer',
+                                         description='Projet de benchmark',
+                                         type=Project.Type.BACK_END)
+        project.add_contributor(self.user, Contributor.Role.author)
+        return project
+
+    def routes(self) -> dict:
+        """name -> (method, url, data[, format]) of every benchmarked route,
+        url and data may be functions giving them before each call"""
+        project = {'project_id': self.project.id}
+        issue = {**project, 'issue_id': self.issue.id}
+        comment = {**issue, 'comment_id': self.comment.id}
+        project_data = {'title': 'Projet modifié',
+                        'description': 'Projet de benchmark',
+                        'type': Project.Type.BACK_END}
+        issue_data = {'title': 'Issue modifiée',
+                      'desc': 'Issue de benchmark',
+                      'tag': Issue.Type.TASK,
+                      'priority': Issue.Priority.ELEVEE}
+        comment_data = {'description': 'Commentaire de benchmark'}
+
+        def signup_data():
+            number = next(self.numbers)
+            return {'email': f'signup{number}@softdesk.com',
+                    'first_name': 'Sign', 'last_name': str(number),
+                    'password': 'Bench-mark-2022',
+                    'password2': 'Bench-mark-2022'}
+
+        def user_url():
+            return reverse('delete-user-from-project',
+                           kwargs={**project,
+                                   'user_id': self.new_contributors()[0].id})
+
+        def issue_url():
+            return reverse('issue-from-project',
+                           kwargs={**project,
+                                   'issue_id': self.new_issues()[0].id})
+
+        def comment_url():
+            new_comment = Comment.objects.create(
+                description='Commentaire à supprimer',
+                author_user=self.user, issue=self.issue)
+            return reverse('comment-from-issues-from-project',
+                           kwargs={**issue, 'comment_id': new_comment.id})
+
+        def project_url():
+            return reverse('projects-detail',
+                           kwargs={'pk': self.new_project().id})
+
+        return {
+            'signup.post':
+                ('post', reverse('signup'), signup_data),
+            'login.post':
+                ('post', reverse('login'),
+                 {'email': self.user.email, 'password': 'bench'}),
+            'projects-list':
+                ('get', reverse('projects-list'), None),
+            'projects-list.cursor':
+                ('get', reverse('projects-list') + '?cursor=', None),
+            'projects-list.post':
+                ('post', reverse('projects-list'), project_data),
+            'projects-detail':
+                ('get', reverse('projects-detail',
+                                kwargs={'pk': self.project.id}), None),
+            'projects-detail.put':
+                ('put', reverse('projects-detail',
+                                kwargs={'pk': self.project.id}),
+                 project_data),
+            'projects-detail.delete':
+                ('delete', project_url, None),
+            'users-from-project':
+                ('get', reverse('users-from-project', kwargs=project), None),
+            # the user is given as form data
+            'users-from-project.post':
+                ('post', reverse('users-from-project', kwargs=project),
+                 lambda: {'user_id': self.new_users()[0].id}, 'multipart'),
+            'bulk-users-from-project.post':
+                ('post', reverse('bulk-users-from-project', kwargs=project),
+                 lambda: [user.id for user in self.new_users(100)]),
+            'bulk-users-from-project.delete':
+                ('delete', reverse('bulk-users-from-project',
+                                   kwargs=project),
+                 lambda: [user.id for user in self.new_contributors(100)]),
+            'delete-user-from-project.delete':
+                ('delete', user_url, None),
+            'issues-from-project':
+                ('get', reverse('issues-from-project', kwargs=project),
+                 None),
+            'issues-from-project.post':
+                ('post', reverse('issues-from-project', kwargs=project),
+                 issue_data),
+            'bulk-issues-from-project.post':
+                ('post', reverse('bulk-issues-from-project',
+                                 kwargs=project), [issue_data] * 100),
+            'bulk-issues-from-project.patch':
+                ('patch', reverse('bulk-issues-from-project',
+                                  kwargs=project),
+                 [{'id': issue.id, 'status': Issue.Status.ON_GOING}
+                  for issue in self.issues[:100]]),
+            'bulk-issues-from-project.delete':
+                ('delete', reverse('bulk-issues-from-project',
+                                   kwargs=project),
+                 lambda: [issue.id for issue in self.new_issues(20)]),
+            'issue-from-project.put':
+                ('put', reverse('issue-from-project', kwargs=issue),
+                 issue_data),
+            'issue-from-project.delete':
+                ('delete', issue_url, None),
+            'comments-from-issues-from-project':
+                ('get', reverse('comments-from-issues-from-project',
+                                kwargs=issue), None),
+            'comments-from-issues-from-project.post':
+                ('post', reverse('comments-from-issues-from-project',
+                                 kwargs=issue), comment_data),
+            'comment-from-issues-from-project':
+                ('get', reverse('comment-from-issues-from-project',
+                                kwargs=comment), None),
+            'comment-from-issues-from-project.put':
+                ('put', reverse('comment-from-issues-from-project',
+                                kwargs=comment), comment_data),
+            'comment-from-issues-from-project.delete':
+                ('delete', comment_url, None),
+            'export-project':
+                ('get', reverse('export-project', kwargs=project), None),
+            'search-project':
+                ('get', reverse('search-project', kwargs=project)
+                 + '?q=commentaire', None),
+            # a poll reading a full page of changes
+            'changes-from-project':
+                ('get', reverse('changes-from-project', kwargs=project)
+                 + '?since=' + changes.encode_cursor(self.changes_since)
+                 + f'&limit={self.changes_limit}', None),
+            'response-cache-stats':
+                ('get', reverse('response-cache-stats'), None),
+            'async-users-from-project':
+                ('get', reverse('async-users-from-project',
+                                kwargs=project), None),
+            'async-issues-from-project':
+                ('get', reverse('async-issues-from-project',
+                                kwargs=project), None),
+            'async-comments-from-issues-from-project':
+                ('get', reverse('async-comments-from-issues-from-project',
+                                kwargs=issue), None),
+            'async-comment-from-issues-from-project':
+                ('get', reverse('async-comment-from-issues-from-project',
+                                kwargs=comment), None),
+        }
+
+    @staticmethod
+    def prepare(url, data):
+        """return the url and data of the next call, cached pages are
+        dropped so that the call computes its response"""
+        response_cache.get_cache().clear()
+        return (url() if callable(url) else url,
+                data() if callable(data) else data)
+
+    def measure(self, method, url, data, format='json') -> dict:
+        """call a route ITERATIONS times and return its metrics"""
+        def call(path, body):
+            response = getattr(self.client, method)(path, data=body,
+                                                    format=format)
+            # streamed content is only computed while being read
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response
+
+        # warm up, and check the route is working
+        response = call(*self.prepare(url, data))
+        self.assertLess(response.status_code, 400, url)
+
+        arguments = self.prepare(url, data)
+        with CaptureQueriesContext(connection) as queries:
+            call(*arguments)
+        # read it now, the next request will reset connection.queries
+        nb_queries = len(queries)
+
+        arguments = self.prepare(url, data)
+        tracemalloc.start()
+        call(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        durations = []
+        for _ in range(ITERATIONS):
+            arguments = self.prepare(url, data)
+            start = time.perf_counter()
+            call(*arguments)
+            durations.append((time.perf_counter() - start) * 1000)
+
+        return {'queries': nb_queries,
+                'p50_ms': round(statistics.median(durations), 2),
+                'p95_ms': round(percentile(durations, 95), 2),
+                'peak_kib': round(peak / 1024, 1)}
+
+    def test_budgets(self):
+        """every route must stay under its stored budget"""
+        budgets = json.loads(BUDGETS_FILE.read_text())
+        results = {}
+
+        print(f'\n{"route":<42}{"queries":>8}{"p50 ms":>10}'
+              f'{"p95 ms":>10}{"peak KiB":>10}')
+        for name, route in self.routes().items():
+            metrics = results[name] = self.measure(*route)
+            print(f'{name:<42}{metrics["queries"]:>8}'
+                  f'{metrics["p50_ms"]:>10}{metrics["p95_ms"]:>10}'
+                  f'{metrics["peak_kib"]:>10}')
+
+        if UPDATE_BUDGETS:
+            for name, metrics in results.items():
+                budgets.setdefault(name, {})['queries'] = metrics['queries']
+            BUDGETS_FILE.write_text(json.dumps(budgets, indent=4) + '\n')
+            return
+
+        for name, metrics in results.items():
+            with self.subTest(route=name):
+                self.assertIn(name, budgets, 'route has no stored budget')
+                budget = budgets[name]
+                self.assertLessEqual(metrics['queries'], budget['queries'],
+                                     'query budget exceeded')
+                if 'p95_ms' in budget:
+                    self.assertLessEqual(metrics['p95_ms'],
+                                         budget['p95_ms'],
+                                         'latency budget exceeded')
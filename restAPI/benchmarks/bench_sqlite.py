@@ -0,0 +1,145 @@
+"""Concurrency benchmark of SQLite, before and after the tuning of
+softDesk/sqlite_backend
+
+Not a test case : it needs a database file shared by several threads,
+    python restAPI/benchmarks/bench_sqlite.py --readers 8 --writers 4
+
+Writers post comments as the API does in a transaction : they read the
+issue, insert the comment and update the issue counter. Readers read
+the last page of comments of the issue with their count.
+'before' is Django default SQLite (rollback journal, deferred BEGIN),
+'after' applies DEFAULT_PRAGMAS and BEGIN IMMEDIATE.
+Throughputs and 'database is locked' errors of both are printed.
+Only the standard library is used.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from softDesk.sqlite_backend.pragmas import DEFAULT_PRAGMAS, \
+    apply_pragmas  # noqa: E402
+
+CONFIGURATIONS = {
+    'before': {'pragmas': {}, 'begin': 'BEGIN'},
+    'after': {'pragmas': DEFAULT_PRAGMAS, 'begin': 'BEGIN IMMEDIATE'},
+}
+
+
+def create_database(path, nb_comments):
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE issue (id INTEGER PRIMARY KEY,
+                            comment_count INTEGER NOT NULL);
+        CREATE TABLE comment (id INTEGER PRIMARY KEY,
+                              issue_id INTEGER NOT NULL,
+                              description TEXT NOT NULL);
+        CREATE INDEX comment_issue ON comment (issue_id, id);
+        INSERT INTO issue VALUES (1, 0);
+    ''')
+    connection.executemany('INSERT INTO comment (issue_id, description) '
+                           'VALUES (1, ?)',
+                           [(f'Commentaire {i}',) for i in range(nb_comments)])
+    connection.execute('UPDATE issue SET comment_count = ?', (nb_comments,))
+    connection.commit()
+    connection.close()
+
+
+def connect(path, configuration):
+    # autocommit mode, transactions are begun explicitly as Django does
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None,
+                                 check_same_thread=False)
+    apply_pragmas(connection, configuration['pragmas'])
+    return connection
+
+
+def write(connection, configuration):
+    connection.execute(configuration['begin'])
+    try:
+        connection.execute('SELECT comment_count FROM issue WHERE id = 1') \
+            .fetchone()
+        connection.execute('INSERT INTO comment (issue_id, description) '
+                           "VALUES (1, 'Nouveau commentaire')")
+        connection.execute('UPDATE issue SET comment_count = '
+                           'comment_count + 1 WHERE id = 1')
+        connection.execute('COMMIT')
+    except sqlite3.OperationalError:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def read(connection, configuration):
+    connection.execute('SELECT id, description FROM comment '
+                       'WHERE issue_id = 1 ORDER BY id DESC LIMIT 20') \
+        .fetchall()
+    connection.execute('SELECT comment_count FROM issue WHERE id = 1') \
+        .fetchone()
+
+
+def worker(path, configuration, operation, deadline, results):
+    connection = connect(path, configuration)
+    done = errors = 0
+    while time.perf_counter() < deadline:
+        try:
+            operation(connection, configuration)
+            done += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    connection.close()
+    results.append((operation.__name__, done, errors))
+
+
+def run(configuration, options) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'db.sqlite3')
+        create_database(path, options.comments)
+        # journal mode is kept by the database file
+        connect(path, configuration).close()
+
+        results = []
+        deadline = time.perf_counter() + options.duration
+        threads = [threading.Thread(target=worker,
+                                    args=(path, configuration, operation,
+                                          deadline, results))
+                   for operation, number in ((read, options.readers),
+                                             (write, options.writers))
+                   for _ in range(number)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    totals = {}
+    for name, done, errors in results:
+        total = totals.setdefault(name, [0, 0])
+        total[0] += done
+        total[1] += errors
+    return {name: (round(done / options.duration), errors)
+            for name, (done, errors) in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--comments', type=int, default=10000)
+    options = parser.parse_args()
+
+    print(f'{"":<8}{"reads/s":>10}{"errors":>8}{"writes/s":>10}'
+          f'{"errors":>8}')
+    for name, configuration in CONFIGURATIONS.items():
+        result = run(configuration, options)
+        reads, read_errors = result.get('read', (0, 0))
+        writes, write_errors = result.get('write', (0, 0))
+        print(f'{name:<8}{reads:>10}{read_errors:>8}{writes:>10}'
+              f'{write_errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Load test comparing a WSGI and an ASGI server on a list route
+
+Not a test case : it is launched against running servers, for instance
+    gunicorn softDesk.wsgi --workers 2 --bind 127.0.0.1:8000
+    uvicorn softDesk.asgi:application --workers 2 --port 8001
+    python restAPI/benchmarks/load_test.py --token <access token> \
+        --wsgi http://127.0.0.1:8000 --asgi http://127.0.0.1:8001
+
+Sync views are called on the WSGI server and their async/ variants on
+the ASGI one. Each of the --clients concurrent clients sends requests in
+a loop for --duration seconds, and reads responses slowly (--read-delay
+seconds between chunks of --chunk bytes) to simulate slow networks.
+Throughput and latencies of both servers are printed.
+Only the standard library is used.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def fetch(url, token, chunk, read_delay) -> int:
+    """GET url with a new connection, read slowly,
+    return the HTTP status"""
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname,
+                                                   parts.port or 80)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    writer.write(f'GET {path} HTTP/1.1\r\n'
+                 f'Host: {parts.netloc}\r\n'
+                 f'Authorization: Bearer {token}\r\n'
+                 f'Accept: application/json\r\n'
+                 f'Connection: close\r\n\r\n'.encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    while await reader.read(chunk):
+        if read_delay:
+            await asyncio.sleep(read_delay)
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+async def client(url, options, deadline, durations, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            status = await fetch(url, options.token, options.chunk,
+                                 options.read_delay)
+        except OSError:
+            status = None
+        if status == 200:
+            durations.append(time.perf_counter() - start)
+        else:
+            errors.append(status)
+
+
+async def load(url, options) -> dict:
+    durations, errors = [], []
+    deadline = time.perf_counter() + options.duration
+    await asyncio.gather(*(client(url, options, deadline, durations, errors)
+                           for _ in range(options.clients)))
+    durations.sort()
+    return {'requests': len(durations),
+            'errors': len(errors),
+            'rps': round(len(durations) / options.duration, 1),
+            'p50_ms': round(statistics.median(durations) * 1000, 1)
+            if durations else None,
+            'p95_ms': round(durations[int(len(durations) * 0.95)] * 1000, 1)
+            if durations else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--token', required=True,
+                        help='access token of a contributor of the project')
+    parser.add_argument('--wsgi', default='http://127.0.0.1:8000')
+    parser.add_argument('--asgi', default='http://127.0.0.1:8001')
+    parser.add_argument('--route', default='projects/1/issues/',
+                        help='sync route, async/ is prepended for ASGI')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--chunk', type=int, default=1024)
+    parser.add_argument('--read-delay', type=float, default=0.01)
+    options = parser.parse_args()
+
+    targets = {'wsgi': f'{options.wsgi}/{options.route}',
+               'asgi': f'{options.asgi}/async/{options.route}'}
+    print(f'{"server":<8}{"requests":>10}{"errors":>8}{"req/s":>10}'
+          f'{"p50 ms":>10}{"p95 ms":>10}')
+    for name, url in targets.items():
+        result = asyncio.run(load(url, options))
+        print(f'{name:<8}{result["requests"]:>10}{result["errors"]:>8}'
+              f'{result["rps"]:>10}{result["p50_ms"]!s:>10}'
+              f'{result["p95_ms"]!s:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Change feed of a project : every write of a Project, Contributor,
+Issue or Comment appends a Change (see signals.py, bulk writes of
+serializers.py add theirs), as any move of the counters of a project or
+an issue, so that a client only reads what has changed
+since its cursor instead of whole lists.
+Superseded changes and old tombstones are removed by the compact_changes
+command, a cursor older than CHANGE_FEED_RETENTION_DAYS must then
+do a full sync again"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodingError
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from softDesk import routers
+from restAPI.models import Project, Contributor, Issue, Comment, Change
+
+MODELS = {Project: 'project',
+          Contributor: 'contributor',
+          Issue: 'issue',
+          Comment: 'comment'}
+
+
+def project_of_issue(issue_id, using=None):
+    """return the project id of an issue, or an expression giving it"""
+    if using in routers.shard_aliases():
+        # issues of a shard can't be read by the INSERT
+        return Issue.all_objects.using(using).filter(pk=issue_id) \
+            .values_list('project_id', flat=True).first()
+    # read by the INSERT itself, no query for each comment
+    # deleted with its issue, which may be already hidden
+    return Subquery(Issue.all_objects.filter(pk=issue_id)
+                    .values('project_id')[:1])
+
+
+def project_of(instance):
+    """return the project id of an instance, or an expression giving it"""
+    if isinstance(instance, Project):
+        return instance.pk
+    if isinstance(instance, Comment):
+        if Comment.issue.is_cached(instance):
+            return instance.issue.project_id
+        return project_of_issue(instance.issue_id, instance._state.db)
+    return instance.project_id
+
+
+def record(instances, action=Change.Action.UPSERT, project_id=None):
+    """append a change for each instance, with one query,
+    project_id is the project of all of them when it is known"""
+    Change.objects.bulk_create([
+        Change(project_id=project_of(instance) if project_id is None
+               else project_id,
+               model=MODELS[type(instance)],
+               object_id=instance.pk,
+               action=action)
+        for instance in instances])
+
+
+def record_counters(model, pk, using=None):
+    """append a change for a project or an issue whose counters have
+    been moved by update(), they are part of its representation"""
+    project_id = pk if model is Project else project_of_issue(pk, using)
+    record([model(pk=pk)], project_id=project_id)
+
+
+def retention() -> timedelta:
+    return timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS)
+
+
+def encode_cursor(change_id) -> str:
+    """cursor holds its date, to know if changes it needs are still kept"""
+    position = [change_id, timezone.now().timestamp()]
+    return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """return (change id, date) of a cursor, raise ValueError if invalid"""
+    try:
+        change_id, timestamp = json.loads(urlsafe_b64decode(cursor.encode()))
+        return int(change_id), float(timestamp)
+    except (DecodingError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def is_expired(timestamp) -> bool:
+    return timestamp < (timezone.now() - retention()).timestamp()
+
+
+def last_change_id(project_id) -> int:
+    return Change.objects.filter(project_id=project_id) \
+        .order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def changes_since(project_id, change_id, limit):
+    """return the last change of each object of a project changed after
+    change_id (in order of change), the id of the last change read
+    and if there are more changes to read"""
+    rows = list(Change.objects.filter(project_id=project_id,
+                                      id__gt=change_id)
+                .order_by('id')[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for change in rows:
+        # moved at the end, at the place of its last change
+        latest.pop((change.model, change.object_id), None)
+        latest[(change.model, change.object_id)] = change
+    last_id = rows[-1].id if rows else change_id
+    return list(latest.values()), last_id, more
+
+
+def compact(days=None):
+    """delete changes followed by a newer one of the same object,
+    and tombstones older than the retention,
+    return the number of deleted changes"""
+    newer = Change.objects.filter(model=OuterRef('model'),
+                                  object_id=OuterRef('object_id'),
+                                  id__gt=OuterRef('id'))
+    superseded, _ = Change.objects.filter(Exists(newer)).delete()
+
+    period = timedelta(days=days) if days is not None else retention()
+    tombstones, _ = Change.objects.filter(
+        action=Change.Action.DELETE,
+        time__lt=timezone.now() - period).delete()
+    return superseded + tombstones
@@ -0,0 +1,70 @@
+"""Conditional GET : strong ETag and Last-Modified computed from the last
+updated_time of a resource, so that If-None-Match / If-Modified-Since
+get a 304 before anything is serialized.
+A collection only has an ETag, from its last updated_time and its row
+count : a deleted row doesn't move the last updated_time, so
+If-Modified-Since alone would answer a stale 304.
+Relations given by ?expand= are not covered : such a representation
+has no validators"""
+from hashlib import sha1
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from restAPI.fieldsets import requested_fieldset
+
+
+def collection_state(queryset):
+    """return (last updated_time, row count) of a queryset,
+    with one aggregate query"""
+    state = queryset.order_by().aggregate(last=Max('updated_time'),
+                                          count=Count('pk'))
+    return state['last'], state['count']
+
+
+def collection_validators(request, queryset, *parts):
+    """return (etag, None) for a list of the rows of queryset"""
+    if requested_fieldset(request)[1]:
+        return None, None
+    last_modified, count = collection_state(queryset)
+    etag, _ = make_validators(request, last_modified, count, *parts)
+    return etag, None
+
+
+def make_validators(request, last_modified, *parts):
+    """return (etag, last_modified) for a representation, the ETag also
+    depends on the url with its query string and on the media type.
+    Both are None if relations are expanded"""
+    if requested_fieldset(request)[1]:
+        return None, None
+    media_type = getattr(request, 'accepted_media_type', '')
+    seed = ':'.join(str(part) for part in (request.get_full_path(),
+                                            media_type,
+                                            last_modified and
+                                            last_modified.isoformat(),
+                                            *parts))
+    return quote_etag(sha1(seed.encode()).hexdigest()), last_modified
+
+
+def not_modified(request, etag, last_modified):
+    """return a 304 (or 412) response if the client version is still
+    the current one, else None"""
+    if etag is None:
+        return None
+    # HTTP dates have a precision of one second
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request._request,
+                                        etag=etag,
+                                        last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
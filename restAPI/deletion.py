@@ -0,0 +1,184 @@
+"""Deletion of projects and issues in background : a DELETE request only
+marks the row as deleting, which hides it from every view (LiveManager,
+chain queries of the views, search index, cached pages), then a worker
+thread of the process deletes its comments, issues and contributors,
+then the row itself, DELETION_BATCH_SIZE rows per transaction, so that
+the database is never locked by a long cascade.
+Children are deleted without signals, a batch at a time : the counters,
+the version and the search rows of their project were updated when they
+were hidden, only their tombstones and the membership cache are written,
+once for each batch. The project itself is deleted with its signals.
+With DELETION_EAGER, rows are deleted during the request (tests).
+Rows left deleting by a stopped process are deleted by the
+purge_deleted command"""
+import logging
+import queue
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from softDesk import routers
+from restAPI import changes, membership, response_cache, search
+from restAPI.models import Project, Contributor, Issue, Comment, Change
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """a daemon thread running the deletions queued by put(),
+    started on first use"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, function, *args):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run,
+                                               name='deletion', daemon=True)
+                self.thread.start()
+        self.queue.put((function, args))
+
+    def run(self):
+        while True:
+            function, args = self.queue.get()
+            try:
+                function(*args)
+            except Exception:
+                # rows stay deleting, purge_deleted will delete them
+                logger.exception('Deletion in background failed')
+            finally:
+                # connections of this thread aren't closed by requests
+                connections.close_all()
+                self.queue.task_done()
+
+
+worker = Worker()
+
+
+def run_after_commit(using, function, *args):
+    """run function once the transaction of using is committed,
+    in the worker, or now with DELETION_EAGER"""
+    if settings.DELETION_EAGER:
+        function(*args)
+    else:
+        transaction.on_commit(lambda: worker.put(function, *args),
+                              using=using)
+
+
+def delete_project(project: Project):
+    """hide project now and delete it with its issues, comments and
+    contributors in background"""
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        Project.objects.filter(pk=project.pk).update(
+            deleting=True, updated_time=timezone.now())
+        search.remove_project(project.pk)
+        response_cache.bump(project.pk)
+        project.deleting = True
+        run_after_commit(DEFAULT_DB_ALIAS, purge_project, project)
+
+
+def delete_issues(project: Project, issues) -> list:
+    """hide issues of project now, counters of the project included,
+    and delete them with their comments in background.
+    Return the issues hidden, others were already being deleted"""
+    ids = [issue.pk for issue in issues]
+    with routers.atomic(project.shard, DEFAULT_DB_ALIAS):
+        live = Issue.objects.in_shard_of(project).filter(pk__in=ids)
+        statuses = dict(live.values_list('pk', 'status'))
+        if statuses:
+            live.filter(pk__in=list(statuses)).update(deleting=True)
+            Issue.update_project_counters(
+                project.pk,
+                {status: -count for status, count
+                 in Counter(statuses.values()).items()})
+            search.remove_project(project.pk, list(statuses))
+            response_cache.bump(project.pk, project.shard)
+            # the shard transaction is the last one committed
+            run_after_commit(project.shard, purge_issues, project,
+                             list(statuses))
+
+    for issue in issues:
+        issue.deleting = issue.pk in statuses
+    return [issue for issue in issues if issue.deleting]
+
+
+# fields read from the deleted rows, for their side effects
+BATCH_FIELDS = {Contributor: ('id', 'user'),
+                Issue: ('id',),
+                Comment: ('id',)}
+
+
+def delete_in_batches(queryset, project_id, batch_size):
+    """delete the rows of queryset, children of project_id or of its
+    issues being deleted, batch_size at a time in their own transaction,
+    with the same number of queries for any batch"""
+    model = queryset.model
+    while True:
+        with routers.atomic(queryset.db, DEFAULT_DB_ALIAS):
+            rows = list(queryset.order_by('pk')
+                                .only(*BATCH_FIELDS[model])[:batch_size])
+            if not rows:
+                return
+            # sends no signal, unlike delete()
+            model._base_manager.using(queryset.db) \
+                .filter(pk__in=[row.pk for row in rows]) \
+                ._raw_delete(queryset.db)
+            changes.record(rows, Change.Action.DELETE, project_id)
+            if model is Contributor:
+                for contributor in rows:
+                    membership.invalidate(contributor.user_id, project_id)
+
+
+def purge_project(project: Project, batch_size=None):
+    """delete a project being deleted, with its children"""
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    with routers.primary():
+        delete_in_batches(Comment.objects.in_shard_of(project)
+                                         .filter(issue__project=project),
+                          project.pk, batch_size)
+        delete_in_batches(Issue.all_objects.in_shard_of(project)
+                                           .filter(project=project),
+                          project.pk, batch_size)
+        delete_in_batches(Contributor.objects.filter(project=project),
+                          project.pk, batch_size)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            Project.all_objects.filter(pk=project.pk,
+                                       deleting=True).delete()
+
+
+def purge_issues(project: Project, issue_ids, batch_size=None):
+    """delete issues of project being deleted, with their comments"""
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    with routers.primary():
+        delete_in_batches(Comment.objects.in_shard_of(project)
+                                         .filter(issue__in=issue_ids),
+                          project.pk, batch_size)
+        delete_in_batches(Issue.all_objects.in_shard_of(project)
+                                           .filter(pk__in=issue_ids,
+                                                   deleting=True),
+                          project.pk, batch_size)
+
+
+def purge_pending(batch_size=None) -> tuple:
+    """delete the projects and issues left deleting,
+    return their numbers"""
+    with routers.primary():
+        projects = list(Project.all_objects.filter(deleting=True))
+        for project in projects:
+            purge_project(project, batch_size)
+
+        issues = defaultdict(list)
+        for alias in (DEFAULT_DB_ALIAS, *routers.shard_aliases()):
+            for project_id, issue_id in Issue.all_objects.using(alias) \
+                    .filter(deleting=True).values_list('project_id', 'pk'):
+                issues[project_id].append(issue_id)
+        for project_id, issue_ids in issues.items():
+            project = Project.all_objects.get(pk=project_id)
+            purge_issues(project, issue_ids, batch_size)
+    return len(projects), sum(len(ids) for ids in issues.values())
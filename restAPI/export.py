@@ -0,0 +1,38 @@
+from restAPI.models import Project, Issue, Comment, Contributor
+
+# union of the fields of every exported model, for tabular formats
+EXPORT_COLUMNS = ['model', 'id', 'project', 'issue', 'user', 'role',
+                  'title', 'description', 'desc', 'type', 'tag',
+                  'priority', 'status', 'author_user', 'assignee_user',
+                  'created_time']
+
+EXPORTED_FIELDS = {
+    'project': ['id', 'title', 'description', 'type'],
+    'contributor': ['id', 'project', 'user', 'role'],
+    'issue': ['id', 'project', 'title', 'desc', 'tag', 'priority',
+              'status', 'author_user', 'assignee_user', 'created_time'],
+    'comment': ['id', 'issue', 'description', 'author_user',
+                'created_time'],
+}
+
+
+def export_project(project: Project, chunk_size=2000):
+    """Yield a project then its contributors, issues and comments as dicts.
+    Rows are read with a server-side cursor, chunk_size rows at a time,
+    so memory doesn't depend on the size of the project"""
+    querysets = {
+        'project': Project.objects.filter(pk=project.pk),
+        'contributor': Contributor.objects.filter(project=project)
+                                          .order_by('id'),
+        'issue': Issue.objects.in_shard_of(project)
+                              .filter(project=project).order_by('id'),
+        'comment': Comment.objects.in_shard_of(project)
+                                  .filter(issue__project=project,
+                                          issue__deleting=False)
+                                  .order_by('issue', 'id'),
+    }
+
+    for model, queryset in querysets.items():
+        rows = queryset.values(*EXPORTED_FIELDS[model])
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield {'model': model, **row}
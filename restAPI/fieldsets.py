@@ -0,0 +1,143 @@
+"""Sparse fieldsets and expansion of relations, chosen by the client :
+?fields=id,title keeps only these fields of the response,
+?expand=author_user gives the related object instead of its primary key,
+serialized by the serializer given in Meta.expandable.
+Only read requests are concerned, and only the serializer of the response,
+not the nested ones.
+Datetimes are also left as datetime objects for renderers encoding them
+natively (native_datetimes, see MessagePackRenderer)"""
+from django.db.models import Prefetch
+from django.utils.module_loading import import_string
+from rest_framework.fields import DateTimeField
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import ListSerializer, ALL_FIELDS
+
+from restAPI import sharding
+from softDesk import instrumentation
+
+FIELDS_QUERY_PARAM = 'fields'
+EXPAND_QUERY_PARAM = 'expand'
+
+
+def parse_list(value) -> set:
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested_fieldset(request):
+    """return (names of fields or None for all of them, names to expand)"""
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set()
+    params = request.query_params
+    only = parse_list(params[FIELDS_QUERY_PARAM]) \
+        if params.get(FIELDS_QUERY_PARAM) else None
+    expand = parse_list(params.get(EXPAND_QUERY_PARAM, ''))
+    if only is not None:
+        # an expanded field is always given
+        only |= expand
+    return only, expand
+
+
+class FieldsetMixin:
+    """ModelSerializer mixin dropping unrequested fields and expanding
+    relations listed in Meta.expandable (name -> serializer class,
+    or its dotted path)"""
+
+    def is_response_root(self) -> bool:
+        parent = self.parent
+        return parent is None or (isinstance(parent, ListSerializer)
+                                  and parent.parent is None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        renderer = getattr(request, 'accepted_renderer', None)
+        if getattr(renderer, 'native_datetimes', False):
+            for field in fields.values():
+                if isinstance(field, DateTimeField):
+                    field.format = None
+        if not self.is_response_root():
+            return fields
+
+        only, expand = requested_fieldset(request)
+        for name in expand & fields.keys():
+            serializer_class = self.get_expandable().get(name)
+            if serializer_class is not None:
+                fields[name] = serializer_class(
+                    many=isinstance(fields[name], ManyRelatedField),
+                    read_only=True)
+        if only is not None:
+            fields = {name: field for name, field in fields.items()
+                      if name in only}
+        return fields
+
+    def to_representation(self, instance):
+        if not self.is_response_root():
+            return super().to_representation(instance)
+        # timed for Server-Timing, nested serializers are included
+        with instrumentation.phase('serializer'):
+            return super().to_representation(instance)
+
+    @classmethod
+    def get_expandable(cls) -> dict:
+        return {name: import_string(serializer_class)
+                if isinstance(serializer_class, str) else serializer_class
+                for name, serializer_class
+                in getattr(cls.Meta, 'expandable', {}).items()}
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request, keep=()):
+        """load only the columns of the requested fields (and of keep),
+        join or prefetch expanded relations, and only fetch primary keys
+        of the other many relations given"""
+        only, expand = requested_fieldset(request)
+        model = cls.Meta.model
+        serialized = cls.serialized_names()
+        expand &= cls.get_expandable().keys() & serialized
+
+        select_related, prefetch_related = [], []
+        for field in model._meta.get_fields():
+            if only is not None and field.name not in only:
+                continue
+            if field.name in expand:
+                # no join across shards
+                if field.many_to_many or field.one_to_many \
+                        or not sharding.can_join(model, field.related_model):
+                    prefetch_related.append(field.name)
+                else:
+                    select_related.append(field.name)
+            elif field.one_to_many and field.name in serialized:
+                # the primary key list only, and the key joining it back
+                prefetch_related.append(Prefetch(
+                    field.name,
+                    queryset=field.related_model.objects.only(
+                        field.related_model._meta.pk.name,
+                        field.remote_field.name)))
+            elif field.many_to_many and field.name in serialized:
+                prefetch_related.append(Prefetch(
+                    field.name,
+                    queryset=field.related_model.objects.only(
+                        field.related_model._meta.pk.name)))
+
+        if only is not None:
+            concrete = {field.name for field in model._meta.concrete_fields}
+            queryset = queryset.only(
+                model._meta.pk.name, *((only | set(keep)) & concrete))
+        if select_related:
+            # without names, select_related() would join every relation
+            queryset = queryset.select_related(*select_related)
+        return queryset.prefetch_related(*prefetch_related)
+
+    @classmethod
+    def serialized_names(cls) -> set:
+        """names of the fields given by this serializer"""
+        meta = cls.Meta
+        fields = getattr(meta, 'fields', ALL_FIELDS)
+        if fields == ALL_FIELDS:
+            options = meta.model._meta
+            names = {field.name for field
+                     in (*options.fields, *options.many_to_many)}
+            names -= set(getattr(meta, 'exclude', ()))
+        else:
+            names = set(fields)
+        return names | set(cls._declared_fields)
@@ -0,0 +1,65 @@
+"""JSON encoding of the API : orjson when it is installed, stdlib json
+otherwise (or as chosen with the JSON_BACKEND setting).
+Both give the same documents as DRF JSONRenderer : compact, UTF-8,
+datetimes in ISO 8601 with a 'Z' for UTC, choices as their value"""
+import json
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibBackend:
+    name = 'json'
+
+    @staticmethod
+    def dumps(data) -> bytes:
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+                          allow_nan=False,
+                          separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def loads(content):
+        return json.loads(content, parse_constant=StdlibBackend.reject)
+
+    @staticmethod
+    def reject(constant):
+        raise ValueError(f'Out of range float value {constant}')
+
+
+class OrjsonBackend:
+    name = 'orjson'
+    # lazy strings, sets, Decimal... are given to DRF encoder
+    fallback = JSONEncoder().default
+
+    @classmethod
+    def dumps(cls, data) -> bytes:
+        return orjson.dumps(data, default=cls.fallback,
+                            option=orjson.OPT_UTC_Z
+                            | orjson.OPT_NON_STR_KEYS)
+
+    @staticmethod
+    def loads(content):
+        return orjson.loads(content)
+
+
+BACKENDS = {StdlibBackend.name: StdlibBackend}
+if orjson is not None:
+    BACKENDS[OrjsonBackend.name] = OrjsonBackend
+
+
+def get_backend(name=None):
+    """return the backend called name, by default the one of
+    the JSON_BACKEND setting, 'auto' being the fastest installed"""
+    name = name or getattr(settings, 'JSON_BACKEND', 'auto')
+    if name == 'auto':
+        return OrjsonBackend if orjson is not None else StdlibBackend
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'JSON backend {name} is not available, '
+                         f'choose among {", ".join(BACKENDS)}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from restAPI import changes
+
+
+class Command(BaseCommand):
+    help = 'Compact the change feed : remove changes followed by a newer ' \
+           'one of the same object and tombstones older than the retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='retention of tombstones in days, '
+                                 'CHANGE_FEED_RETENTION_DAYS by default')
+
+    def handle(self, *args, **options):
+        deleted = changes.compact(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} changes removed'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from softDesk import profiling
+
+
+class Command(BaseCommand):
+    help = 'List the stored profiles of requests (see PROFILE_DIRECTORY) ' \
+           'and the functions taking the most time over all of them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', default=None,
+                            help='only the profiles of this view class, '
+                                 'ManageCommentsFromIssueFromProjectAPIView')
+        parser.add_argument('--top', type=int, default=20,
+                            help='number of functions given')
+        parser.add_argument('--sort', choices=['own', 'cumulative'],
+                            default='own',
+                            help='time of the function itself, or with '
+                                 'the functions it calls')
+
+    def handle(self, *args, **options):
+        profiles = profiling.load_profiles(options['view'])
+        if not profiles:
+            self.stdout.write('No profile stored')
+            return
+
+        for profile in profiles:
+            self.stdout.write(f'{profile["file"]}  {profile["kind"]:<8} '
+                              f'{profile["method"]} {profile["path"]} '
+                              f'{profile["status"]} '
+                              f'{profile["duration_ms"]:.0f} ms')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\nTop functions of {len(profiles)} profiles (seconds)'))
+        self.stdout.write(f'{"own":>10}{"cumulative":>12}  function')
+        for name, own, cumulative in profiling.top_functions(
+                profiles, options['sort'], options['top']):
+            self.stdout.write(f'{own:>10.3f}{cumulative:>12.3f}  {name}')
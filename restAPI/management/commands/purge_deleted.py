@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from restAPI import deletion
+
+
+class Command(BaseCommand):
+    help = 'Delete the projects and issues left being deleted, ' \
+           'when their deletion in background has been interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='rows deleted per transaction, '
+                                 'DELETION_BATCH_SIZE by default')
+
+    def handle(self, *args, **options):
+        projects, issues = deletion.purge_pending(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{projects} projects and {issues} issues deleted'))
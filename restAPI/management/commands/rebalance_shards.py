@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from softDesk import routers
+from restAPI import sharding
+from restAPI.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Move a project to another shard, or spread the issues and ' \
+           'comments of every project evenly on DATABASE_SHARDS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, default=None,
+                            help='id of the project to move')
+        parser.add_argument('--to', default=None,
+                            help='alias of the database to move it to')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only print the moves')
+
+    def handle(self, *args, **options):
+        shards = routers.shard_aliases()
+        if not shards:
+            raise CommandError('No shard is configured (DATABASE_SHARDS)')
+
+        if options['project'] is not None:
+            if options['to'] not in shards:
+                raise CommandError(f'--to must be one of {", ".join(shards)}')
+            project = Project.objects.filter(pk=options['project']).first()
+            if project is None:
+                raise CommandError(f'Project {options["project"]} not found')
+            moves = [(project.pk, project.shard, options['to'])]
+        else:
+            moves = sharding.rebalance(sharding.project_sizes())
+
+        for project_id, source, target in moves:
+            self.stdout.write(f'project {project_id} : {source} -> {target}')
+            if not options['dry_run']:
+                sharding.move_project(Project.objects.get(pk=project_id),
+                                      target)
+        self.stdout.write(self.style.SUCCESS(f'{len(moves)} projects moved'
+                                             if not options['dry_run'] else
+                                             f'{len(moves)} projects to move'))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from softDesk import routers
+from restAPI.models import Project, Issue, Comment
+
+
+def count_of(queryset, group_by):
+    """subquery counting rows of queryset, correlated on group_by"""
+    return Coalesce(Subquery(queryset.order_by()
+                             .values(group_by)
+                             .annotate(count=Count('pk'))
+                             .values('count')),
+                    Value(0))
+
+
+def rebuild_counters():
+    """recompute every counter in bulk, with one UPDATE per table
+    (and per shard).
+    Last activity of an issue becomes the time of its last comment,
+    or its creation time"""
+    shards = routers.shard_aliases()
+    with routers.atomic(DEFAULT_DB_ALIAS, *shards):
+        Project.objects.update(**{
+            field: count_of(Issue.objects.filter(project=OuterRef('pk'),
+                                                 status=status),
+                            'project')
+            for status, field in Issue.PROJECT_COUNTERS.items()
+        })
+        # issues of shards can't be read by a subquery
+        for alias in shards:
+            counters = {}
+            for project_id, status, count in Issue.objects.using(alias) \
+                    .order_by().values_list('project_id', 'status') \
+                    .annotate(count=Count('pk')):
+                counters.setdefault(project_id, {})[
+                    Issue.PROJECT_COUNTERS[status]] = count
+            for project_id, fields in counters.items():
+                Project.objects.filter(pk=project_id, shard=alias) \
+                    .update(**fields)
+
+        for alias in (DEFAULT_DB_ALIAS, *shards):
+            comments = Comment.objects.filter(issue=OuterRef('pk'))
+            Issue.objects.using(alias).update(
+                comment_count=count_of(comments, 'issue'),
+                last_activity=Coalesce(
+                    Subquery(comments.order_by()
+                             .values('issue')
+                             .annotate(last=Max('created_time'))
+                             .values('last')),
+                    'created_time'))
+
+
+class Command(BaseCommand):
+    help = 'Rebuild issue counters of projects and comment counters ' \
+           'of issues from the database content'
+
+    def handle(self, *args, **options):
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS('Counters rebuilt'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restAPI import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of issues and comments'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full-text search needs SQLite FTS5')
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,71 @@
+"""Cache of the role of users in projects, keyed by (user_id, project_id),
+so that permission checks on hot paths cost no SQL.
+A role is cached with the updated_time of its project, which any change
+of its contributors moves in the same transaction (signals.py) : a role
+is only given back for the project it has been read with, so that a role
+cached by a process, or cached again while it was being changed, is
+never used once the contributors have changed.
+Entries are also dropped by Contributor signals (see signals.py)"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+
+from restAPI.models import Contributor
+
+# cached for a user who isn't a contributor of the project
+NOT_A_CONTRIBUTOR = ''
+
+
+def get_cache():
+    return caches[settings.MEMBERSHIP_CACHE]
+
+
+def cache_key(user_id, project_id) -> str:
+    return f'membership:{user_id}:{project_id}'
+
+
+def get_entry(user_id, project_id):
+    """return the cached (role, updated_time of the project),
+    or None if unknown"""
+    return get_cache().get(cache_key(user_id, project_id))
+
+
+def role_of(entry, project):
+    """return the role of a cached entry, NOT_A_CONTRIBUTOR, or None if
+    unknown or if project has changed since the entry was cached"""
+    if entry is None or entry[1] != project.updated_time:
+        return None
+    return entry[0]
+
+
+def get_cached_role(user_id, project):
+    """return the cached role, NOT_A_CONTRIBUTOR, or None if unknown"""
+    return role_of(get_entry(user_id, project.pk), project)
+
+
+def set_role(user_id, project, role):
+    """cache the role read with project, None meaning user is not
+    a contributor"""
+    get_cache().set(cache_key(user_id, project.pk),
+                    (role or NOT_A_CONTRIBUTOR, project.updated_time))
+
+
+def get_role(user_id, project):
+    """return the role of user in project, None if not a contributor,
+    the database is only read on cache miss"""
+    role = get_cached_role(user_id, project)
+    if role is None:
+        # read from the primary database, a replica may lag
+        role = Contributor.objects.using(router.db_for_write(Contributor)) \
+            .filter(user_id=user_id, project_id=project.pk) \
+            .values_list('role', flat=True).first()
+        set_role(user_id, project, role)
+    return role or None
+
+
+def invalidate(user_id, project_id):
+    """drop the cached role now, and again once the transaction is
+    committed, in case it has been read back in the meantime"""
+    key = cache_key(user_id, project_id)
+    get_cache().delete(key)
+    transaction.on_commit(lambda: get_cache().delete(key))
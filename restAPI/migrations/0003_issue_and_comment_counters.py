@@ -0,0 +1,75 @@
+# Generated by Django 4.1.1 on 2026-10-18 05:27
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, group_by):
+    return Coalesce(Subquery(queryset.order_by()
+                             .values(group_by)
+                             .annotate(count=Count('pk'))
+                             .values('count')),
+                    Value(0))
+
+
+def rebuild_counters(apps, schema_editor):
+    """fill counters of existing rows,
+    frozen copy of the rebuild_counters command"""
+    Project = apps.get_model('restAPI', 'Project')
+    Issue = apps.get_model('restAPI', 'Issue')
+    Comment = apps.get_model('restAPI', 'Comment')
+
+    counters = {'To do': 'todo_issue_count',
+                'On going': 'on_going_issue_count',
+                'Done': 'done_issue_count'}
+    Project.objects.update(**{
+        field: count_of(Issue.objects.filter(project=OuterRef('pk'),
+                                             status=status), 'project')
+        for status, field in counters.items()
+    })
+
+    comments = Comment.objects.filter(issue=OuterRef('pk'))
+    Issue.objects.update(
+        comment_count=count_of(comments, 'issue'),
+        last_activity=Coalesce(Subquery(comments.order_by()
+                                        .values('issue')
+                                        .annotate(last=Max('created_time'))
+                                        .values('last')),
+                               'created_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restAPI', '0002_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='last_activity',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='done_issue_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='on_going_issue_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='todo_issue_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(rebuild_counters, migrations.RunPython.noop),
+    ]
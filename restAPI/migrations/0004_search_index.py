@@ -0,0 +1,46 @@
+from django.db import migrations
+
+CREATE_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS restapi_search USING fts5(
+        title, body, project, issue_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """full-text index of restAPI/search.py, only on SQLite"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Issue = apps.get_model('restAPI', 'Issue')
+    Comment = apps.get_model('restAPI', 'Comment')
+    issues = Issue._meta.db_table
+    comments = Comment._meta.db_table
+
+    schema_editor.execute(CREATE_TABLE)
+    schema_editor.execute(
+        f"INSERT INTO restapi_search(rowid, title, body, project, issue_id) "
+        f"SELECT 2 * id, title, \"desc\", 'p' || project_id, id "
+        f"FROM {issues}")
+    schema_editor.execute(
+        f"INSERT INTO restapi_search(rowid, title, body, project, issue_id) "
+        f"SELECT 2 * c.id + 1, '', c.description, 'p' || i.project_id, "
+        f"c.issue_id FROM {comments} c JOIN {issues} i "
+        f"ON c.issue_id = i.id")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS restapi_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restAPI', '0003_issue_and_comment_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.1 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restAPI', '0006_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='shard',
+            field=models.CharField(default='default', editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.1 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restAPI', '0007_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='deleting',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='deleting',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
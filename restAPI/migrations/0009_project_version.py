@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restAPI', '0008_deletion_in_background'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,8 +1,65 @@
-from django.db import models
-from softDesk import settings
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models, router, \
+    transaction
+from django.db.models import Count, F, Max
+from django.dispatch import Signal
+from django.utils import timezone
+
+from softDesk import routers
 from authentication.models import User
 
 
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet of Issue and Comment, which are stored in the database
+    of their project (Project.shard), see restAPI/sharding.py"""
+
+    def in_shard_of(self, project):
+        """read and write in the database of project"""
+        queryset = self._chain()
+        queryset._add_hints(instance=project)
+        return queryset
+
+    def create(self, **kwargs):
+        """the new object is written in the database of its project,
+        routed from the object itself"""
+        instance = self.model(**kwargs)
+        self._for_write = True
+        instance.save(force_insert=True, using=self._db)
+        return instance
+
+
+def without_counters(instance, kwargs, counters):
+    """save() of an existing row leaves counters, only moved by
+    F-expressions : a stale instance would overwrite them"""
+    if instance._state.adding or kwargs.get('update_fields') is not None:
+        return
+    kwargs['update_fields'] = {
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in counters}
+
+
+class LiveManager(models.Manager):
+    """hides the rows being deleted in background (deleting is set),
+    all_objects still reads them, see restAPI/deletion.py"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleting=False)
+
+
+# sent by Project.add_contributors and Project.remove_contributors
+# (project, contributors, action, using), which write all the rows
+# with one statement and send neither post_save nor post_delete
+contributors_changed = Signal()
+
+# sent by Issue.update_project_counters (sender=Project) and
+# Comment.update_issue_counter (sender=Issue) with (pk, using), which move
+# counters with update() and send no post_save
+counters_changed = Signal()
+
+
 class Contributor(models.Model):
     """Class to make links between users and project,
     Users can have several roles : Author (only one) or Contributor
@@ -31,6 +88,11 @@ class Contributor(models.Model):
 
     class Meta:
         unique_together = ['user', 'project']
+        indexes = [
+            # author of a project (Project.author_user)
+            models.Index(fields=['project', 'role'],
+                         name='contributor_project_role_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} est {self.role} dans {self.project}"
@@ -63,7 +125,24 @@ class Project(models.Model):
         to=settings.AUTH_USER_MODEL,
         through=Contributor
     )
-    objects = models.Manager()  # Only useful for pycharm developing
+    # counters of issues by status, maintained by Issue
+    todo_issue_count = models.PositiveIntegerField(default=0,
+                                                   editable=False)
+    on_going_issue_count = models.PositiveIntegerField(default=0,
+                                                       editable=False)
+    done_issue_count = models.PositiveIntegerField(default=0,
+                                                   editable=False)
+    updated_time = models.DateTimeField(auto_now=True)
+    # incremented on any write of the project, its contributors, issues
+    # and comments, keys its cached pages, see restAPI/response_cache.py
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # database of its issues and comments, see restAPI/sharding.py
+    shard = models.CharField(max_length=32, default=DEFAULT_DB_ALIAS,
+                             editable=False)
+    # set until the project is deleted in background
+    deleting = models.BooleanField(default=False, editable=False)
+    objects = LiveManager()
+    all_objects = models.Manager()
 
     @property
     def author_user(self):
@@ -74,28 +153,98 @@ class Project(models.Model):
     def __str__(self):
         return f'{self.title}'
 
+    def save(self, *args, **kwargs):
+        """a new project goes in the shard holding the fewest projects"""
+        shards = routers.shard_aliases()
+        if self._state.adding and shards and self.shard not in shards:
+            counts = dict(Project.objects.filter(shard__in=shards)
+                          .values_list('shard')
+                          .annotate(count=Count('pk')))
+            self.shard = min(shards, key=lambda alias: counts.get(alias, 0))
+        without_counters(self, kwargs,
+                         {*Issue.PROJECT_COUNTERS.values(), 'version'})
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """issues and comments of a shard are deleted with the project,
+        the cascade only reaches those of its own database"""
+        with routers.atomic(self.shard, DEFAULT_DB_ALIAS):
+            if self.shard != DEFAULT_DB_ALIAS:
+                Issue.all_objects.using(self.shard) \
+                    .filter(project=self).delete()
+            return super().delete(*args, **kwargs)
+
     def add_contributor(self,
                         user: User,
                         role=Contributor.Role.contributor) -> bool:
-        # check if user is not already a contributor
-        if not Contributor.objects.filter(user=user, project=self).exists():
-            contributor = Contributor()
-            contributor.user = user
-            contributor.project = self
-            contributor.role = role
-            contributor.save()
-            return True
-        else:
-            return False
+        """return False if user was already a contributor"""
+        return bool(self.add_contributors([user], role))
 
     def delete_contributor(self,
                            user: User) -> bool:
-        contributor = Contributor.objects.filter(user=user, project=self)
-        if contributor.exists():
-            contributor.delete()
-            return True
-        else:
-            return False
+        """return False if user was not a contributor"""
+        return bool(self.remove_contributors([user]))
+
+    def add_contributors(self, users,
+                         role=Contributor.Role.contributor) -> list:
+        """add users (or their ids) to the project with one INSERT,
+        those already contributors are left unchanged, concurrent adds
+        included (unique_together).
+        Return the Contributor created"""
+        user_ids = list(dict.fromkeys(getattr(user, 'pk', user)
+                                      for user in users))
+        if not user_ids:
+            return []
+        return self.write_contributors(
+            Change.Action.UPSERT,
+            'INSERT INTO {table} ({user}, {project}, {role}) VALUES '
+            + ', '.join(['(%s, %s, %s)'] * len(user_ids))
+            + ' ON CONFLICT ({user}, {project}) DO NOTHING',
+            [value for user_id in user_ids
+             for value in (user_id, self.pk, str(role))])
+
+    def remove_contributors(self, users) -> list:
+        """remove users (or their ids) from the project with one DELETE,
+        return the Contributor removed"""
+        user_ids = list(dict.fromkeys(getattr(user, 'pk', user)
+                                      for user in users))
+        if not user_ids:
+            return []
+        return self.write_contributors(
+            Change.Action.DELETE,
+            'DELETE FROM {table} WHERE {project} = %s AND {user} IN ('
+            + ', '.join(['%s'] * len(user_ids)) + ')',
+            [self.pk, *user_ids])
+
+    def write_contributors(self, action, sql, params) -> list:
+        """run sql on contributors, returning the rows written,
+        and send contributors_changed in the same transaction"""
+        using = router.db_for_write(Contributor)
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        options = Contributor._meta
+        columns = [field.column for field in options.concrete_fields]
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.format(table=quote(options.db_table),
+                               user=quote(options.get_field('user').column),
+                               project=quote(
+                                   options.get_field('project').column),
+                               role=quote(options.get_field('role').column))
+                    + ' RETURNING ' + ', '.join(map(quote, columns)),
+                    params)
+                contributors = [
+                    Contributor.from_db(using,
+                                        [field.attname for field
+                                         in options.concrete_fields],
+                                        row)
+                    for row in cursor.fetchall()]
+            if contributors:
+                contributors_changed.send(sender=Contributor, project=self,
+                                          contributors=contributors,
+                                          action=action, using=using)
+        return contributors
 
 
 class Issue(models.Model):
@@ -120,6 +269,11 @@ class Issue(models.Model):
         ON_GOING = 'On going'
         DONE = 'Done'
 
+    # counter of the project for each status
+    PROJECT_COUNTERS = {Status.TODO: 'todo_issue_count',
+                        Status.ON_GOING: 'on_going_issue_count',
+                        Status.DONE: 'done_issue_count'}
+
     title = models.CharField(max_length=128, verbose_name="Titre")
     desc = models.CharField(max_length=2048, verbose_name="Description")
     tag = models.CharField(verbose_name="tag",
@@ -146,11 +300,80 @@ class Issue(models.Model):
                                       related_name="handled_by"
                                       )
     created_time = models.DateTimeField(auto_now_add=True)
-    objects = models.Manager()  # Only useful for pycharm developing
+    # maintained by Comment
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_activity = models.DateTimeField(null=True, editable=False)
+    updated_time = models.DateTimeField(auto_now=True)
+    # set until the issue is deleted in background
+    deleting = models.BooleanField(default=False, editable=False)
+    objects = LiveManager.from_queryset(ShardedQuerySet)()
+    all_objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # issues of a project by creation (keyset pagination)
+            models.Index(fields=['project', 'created_time', 'id'],
+                         name='issue_project_created_idx'),
+            # triage of the issues of a project
+            models.Index(fields=['project', 'status', 'priority'],
+                         name='issue_project_triage_idx'),
+            # last modification of the issues of a project (ETag)
+            models.Index(fields=['project', 'updated_time'],
+                         name='issue_project_updated_idx'),
+        ]
 
     def __str__(self):
         return f'{self.title}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_saved()
+        return instance
+
+    def remember_saved(self):
+        """remember saved project and status, to move counters when they
+        change (see signals.py)"""
+        self._saved_project_id = self.__dict__.get('project_id')
+        self._saved_status = self.__dict__.get('status')
+
+    def save(self, *args, **kwargs):
+        """save the issue, the counters of its project are updated by
+        signals in the same transaction"""
+        self.last_activity = timezone.now()
+        without_counters(self, kwargs, {'comment_count'})
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'],
+                                       'last_activity', 'updated_time'}
+        IdSequence.assign_ids([self], kwargs)
+
+        using = kwargs.get('using') or router.db_for_write(Issue,
+                                                           instance=self)
+        with routers.atomic(using, DEFAULT_DB_ALIAS):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """delete the issue, the counters of its project are updated by
+        signals in the same transaction"""
+        using = kwargs.get('using') or router.db_for_write(Issue,
+                                                           instance=self)
+        with routers.atomic(using, DEFAULT_DB_ALIAS):
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def update_project_counters(cls, project_id, deltas):
+        """add deltas, a dict status -> number of issues,
+        to the counters of a project with F-expressions"""
+        changes = {}
+        for status, delta in Counter(deltas).items():
+            if delta:
+                field = cls.PROJECT_COUNTERS[status]
+                changes[field] = F(field) + delta
+        if changes and Project.objects.filter(pk=project_id).update(
+                **changes, updated_time=timezone.now()):
+            counters_changed.send(sender=Project, pk=project_id,
+                                  using=DEFAULT_DB_ALIAS)
+
 
 class Comment(models.Model):
     """Comment are created by users to comment Issues,
@@ -160,7 +383,138 @@ class Comment(models.Model):
                                     on_delete=models.CASCADE)
     issue = models.ForeignKey(to=Issue, on_delete=models.CASCADE)
     created_time = models.DateTimeField(auto_now_add=True)
-    objects = models.Manager()  # Only useful for pycharm developing
+    updated_time = models.DateTimeField(auto_now=True)
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # comments of an issue by creation (keyset pagination)
+            models.Index(fields=['issue', 'created_time', 'id'],
+                         name='comment_issue_created_idx'),
+            # last modification of the comments of an issue (ETag)
+            models.Index(fields=['issue', 'updated_time'],
+                         name='comment_issue_updated_idx'),
+        ]
 
     def __str__(self):
         return f'Comment n°{self.id}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_saved()
+        return instance
+
+    def remember_saved(self):
+        """remember saved issue, to move counters when it changes
+        (see signals.py)"""
+        self._saved_issue_id = self.__dict__.get('issue_id')
+
+    def save(self, *args, **kwargs):
+        """save the comment, the counter and last activity of its issue
+        are updated by signals in the same transaction"""
+        IdSequence.assign_ids([self], kwargs)
+        # the issue is in the same database
+        using = kwargs.get('using') or router.db_for_write(Comment,
+                                                           instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    @staticmethod
+    def update_issue_counter(issue_id, delta, using=None):
+        """add delta to the comment counter of an issue
+        with an F-expression, and touch its last activity"""
+        now = timezone.now()
+        if Issue.objects.db_manager(using).filter(pk=issue_id).update(
+                comment_count=F('comment_count') + delta,
+                last_activity=now,
+                updated_time=now):
+            counters_changed.send(sender=Issue, pk=issue_id, using=using)
+
+
+class Change(models.Model):
+    """Append-only log of the changes of the objects of a project,
+    read by the change feed of a project.
+    Written by signals of Project, Contributor, Issue and Comment,
+    a deletion is logged as a tombstone"""
+
+    class Action(models.TextChoices):
+        UPSERT = 'upsert'
+        DELETE = 'delete'
+
+    # not a foreign key : changes survive the deletion of the project
+    project_id = models.BigIntegerField(null=True)
+    model = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    action = models.CharField(choices=Action.choices, max_length=8)
+    time = models.DateTimeField(auto_now_add=True)
+    objects = models.Manager()  # Only useful for pycharm developing
+
+    class Meta:
+        indexes = [
+            # changes of a project since a cursor
+            models.Index(fields=['project_id', 'id'],
+                         name='change_project_idx'),
+            # older changes of the same object (compaction)
+            models.Index(fields=['model', 'object_id', 'id'],
+                         name='change_object_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.action} {self.model} n°{self.object_id}'
+
+
+class IdSequence(models.Model):
+    """Last id given to the rows of a sharded model (Issue, Comment) :
+    ids must be unique across shards, they are given to urls, to the
+    search index and to the change feed.
+    Each process reserves SHARD_ID_BLOCK ids at a time"""
+    name = models.CharField(max_length=64, primary_key=True)
+    last_id = models.BigIntegerField()
+    objects = models.Manager()  # Only useful for pycharm developing
+
+    # ids reserved by this process and not given yet, by name
+    reserved = {}
+    lock = threading.Lock()
+
+    def __str__(self):
+        return f'{self.name} : {self.last_id}'
+
+    @classmethod
+    def assign_ids(cls, instances, save_kwargs=None):
+        """give an id to new instances, when shards are used.
+        save_kwargs of a single save are made to insert directly"""
+        new = [instance for instance in instances if instance.pk is None]
+        if not new or not routers.shard_aliases():
+            return
+        for instance, pk in zip(new, cls.next_ids(type(new[0]), len(new))):
+            instance.pk = pk
+        if save_kwargs is not None:
+            save_kwargs['force_insert'] = True
+
+    @classmethod
+    def next_ids(cls, model, count) -> list:
+        name = model._meta.label_lower
+        with cls.lock:
+            ids = cls.reserved.get(name, range(0))
+            if len(ids) < count:
+                ids = [*ids, *cls.reserve(model, max(count - len(ids),
+                                                     settings.SHARD_ID_BLOCK))]
+            cls.reserved[name] = ids[count:]
+            return list(ids[:count])
+
+    @classmethod
+    def reserve(cls, model, count) -> range:
+        """reserve count ids in the main database"""
+        name = model._meta.label_lower
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            if not cls.objects.filter(name=name) \
+                    .update(last_id=F('last_id') + count):
+                # first ids follow those already given in every database
+                last_ids = [model._base_manager.using(alias)
+                            .aggregate(last=Max('pk'))['last'] or 0
+                            for alias in (DEFAULT_DB_ALIAS,
+                                          *routers.shard_aliases())]
+                cls.objects.create(name=name, last_id=max(last_ids) + count)
+            last_id = cls.objects.get(name=name).last_id
+        return range(last_id - count + 1, last_id + 1)
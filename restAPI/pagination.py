@@ -0,0 +1,123 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodingError
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+# integers of SQLite are signed on 64 bits
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+
+class KeysetPagination(BasePagination):
+    """Pagination on an ordering key, (created_time, id) by default.
+    The client receives an opaque cursor pointing after the last row of
+    the page, so fetching any page costs the same, whatever its depth.
+    A view can change the key with an `ordering` attribute,
+    its last field must be unique"""
+    ordering = ('created_time', 'id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request,
+                                                     view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views"""
+        return self.set_page([row async for row
+                              in self.page_queryset(queryset, request,
+                                                    view)])
+
+    def page_queryset(self, queryset, request, view=None):
+        """return the rows of the page, and one more row
+        telling if there is a next page"""
+        self.request = request
+        self.ordering = getattr(view, 'ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data) -> dict:
+        return {'next': self.get_next_link(),
+                'results': data}
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [getattr(last, field) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(position))
+
+    def after(self, position) -> Q:
+        """filter rows placed after position in the ordering :
+        a >= x AND ((a > x) OR (a = x AND b > y) OR ...), the bound on
+        the first field lets the database seek in the index instead of
+        reading it from the start"""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            equals = {name: value for name, value
+                      in zip(self.ordering[:index], position)}
+            condition |= Q(**equals, **{f'{field}__gt': position[index]})
+        if len(self.ordering) > 1:
+            condition &= Q(**{f'{self.ordering[0]}__gte': position[0]})
+        return condition
+
+    @staticmethod
+    def encode_cursor(position) -> str:
+        values = [value.isoformat() if isinstance(value, datetime)
+                  else value for value in position]
+        encoded = urlsafe_b64encode(json.dumps(values).encode())
+        return encoded.decode()
+
+    def decode_cursor(self, request):
+        """return the position given by the cursor, None for first page"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode()))
+        except (DecodingError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) \
+                or len(position) != len(self.ordering) \
+                or any(isinstance(value, int)
+                       and not MIN_INTEGER <= value <= MAX_INTEGER
+                       for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position
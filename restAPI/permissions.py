@@ -1,10 +1,13 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from restAPI import membership
+from restAPI.models import Contributor
+
 
 class IsOwnerOrReadOnly(BasePermission):
     """
     Object-level permission to only allow owners of an object to edit it.
-    Assumes the model instance has an `owner` attribute.
+    Assumes the model instance is a Project.
     USED ONLY on projects views for now
     """
 
@@ -14,5 +17,7 @@ class IsOwnerOrReadOnly(BasePermission):
         if request.method in SAFE_METHODS:
             return True
 
-        # Instance must have an attribute named `owner`.
-        return obj.author_user == request.user
+        # request.user must be the author of the project,
+        # the role is read from membership cache
+        role = membership.get_role(request.user.pk, obj)
+        return role == Contributor.Role.author
@@ -0,0 +1,105 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from restAPI import jsonlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding with the fastest installed backend
+    (see jsonlib.py), indented output is left to DRF"""
+    backend = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+
+        content = jsonlib.get_backend(self.backend).dumps(data)
+        # as DRF, escape separators that are not valid in javascript
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028') \
+                .replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Render MessagePack (needs msgpack package),
+    datetimes are encoded with the timestamp extension type,
+    serializers give them as datetime objects (native_datetimes)"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    native_datetimes = True
+    # lazy strings, Decimal, UUID... as in JSON
+    fallback = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, datetime=True, default=self.fallback)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Render one JSON document per line,
+    stream() encodes rows lazily for a StreamingHttpResponse"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(self.stream(rows)).encode(self.charset)
+
+    @staticmethod
+    def stream(rows, columns=None):
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder,
+                             ensure_ascii=False) + '\n'
+
+
+class Echo:
+    """File-like object giving back what is written in it,
+    to use csv.writer on a stream"""
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+class CSVRenderer(BaseRenderer):
+    """Render rows as CSV with the header given by `columns`,
+    stream() encodes rows lazily for a StreamingHttpResponse"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    columns = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        columns = self.columns or (list(rows[0].keys()) if rows else [])
+        return ''.join(self.stream(rows, columns)).encode(self.charset)
+
+    def stream(self, rows, columns=None):
+        writer = csv.DictWriter(Echo(),
+                                fieldnames=columns or self.columns,
+                                extrasaction='ignore')
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
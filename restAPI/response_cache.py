@@ -0,0 +1,137 @@
+"""Cache of rendered list pages (projects of a user, issues and comments
+of a project), so that a page is computed once for all the contributors
+of a project : their membership is checked apart, before the cache is
+read (GenericAPIViewForSoftDesk.initial).
+A page is keyed by the version of its project, the url with its query
+string (page, ?fields=) and the media type, the page of the projects of
+a user by the user and the versions of their projects.
+The version of a project (Project.version) is incremented on any write
+of the project or of its contributors, issues and comments (signals.py,
+and bulk writes of serializers.py and deletion.py), in the transaction
+of the write : every process reads it with the project, older pages are
+never read again and leave the cache, a bounded LRU of each process.
+Pages with expanded relations (?expand=author_user) are not cached,
+users are written without a new version of their projects, nor pages of
+the browsable API (text/html), which show the user logged in.
+Hits and misses are counted by process, see statistics()"""
+import threading
+from collections import Counter
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.http import HttpResponse
+
+from restAPI import conditional
+from restAPI.fieldsets import requested_fieldset
+from restAPI.models import Project, Issue, Comment
+
+HEADER = 'X-Cache'
+
+counters = Counter()
+lock = threading.Lock()
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE]
+
+
+# formats of renderers showing the user of the request
+PER_USER_FORMATS = {'api'}
+
+
+def is_cacheable(request) -> bool:
+    renderer = getattr(request, 'accepted_renderer', None)
+    if getattr(renderer, 'format', None) in PER_USER_FORMATS:
+        return False
+    return not requested_fieldset(request)[1]
+
+
+def get_versions(project_ids) -> dict:
+    """return project id -> version"""
+    return dict(Project.all_objects.filter(pk__in=project_ids)
+                .values_list('pk', 'version'))
+
+
+def bump(project_id, using=None):
+    """give a new version to project in the transaction of the write, and
+    again once the transaction of using (a shard) is committed, in case
+    a page has been cached from the shard in between"""
+    def increment():
+        Project.all_objects.filter(pk=project_id) \
+            .update(version=F('version') + 1)
+
+    increment()
+    if using not in (None, DEFAULT_DB_ALIAS):
+        transaction.on_commit(increment, using=using)
+
+
+def project_of(instance):
+    """project id of a Project, Contributor, Issue or Comment"""
+    if isinstance(instance, Project):
+        return instance.pk
+    if isinstance(instance, Comment):
+        if Comment.issue.is_cached(instance):
+            return instance.issue.project_id
+        # the issue may be being deleted, in the same database
+        return Issue.all_objects.using(instance._state.db) \
+            .filter(pk=instance.issue_id) \
+            .values_list('project_id', flat=True).first()
+    return instance.project_id
+
+
+def page_key(request, *parts) -> str:
+    seed = ':'.join(str(part) for part in (
+        request.get_full_path(),
+        getattr(request, 'accepted_media_type', ''),
+        *parts))
+    return f'page:{sha1(seed.encode()).hexdigest()}'
+
+
+def count(name):
+    with lock:
+        counters[name] += 1
+
+
+def statistics() -> dict:
+    with lock:
+        hits, misses = counters['hits'], counters['misses']
+    return {'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4)
+            if hits + misses else None}
+
+
+def get_response(request, key):
+    """return the cached page of key, or a 304 if the client has it,
+    None if it isn't cached"""
+    entry = get_cache().get(key)
+    if entry is None:
+        count('misses')
+        return None
+    count('hits')
+    response = conditional.not_modified(request, entry['etag'],
+                                        entry['last_modified'])
+    if response is None:
+        response = HttpResponse(entry['content'],
+                                content_type=entry['content_type'])
+        conditional.set_validators(response, entry['etag'],
+                                   entry['last_modified'])
+    response[HEADER] = 'HIT'
+    return response
+
+
+def store_on_render(response, key, etag, last_modified):
+    """cache response once rendered, if it is a 200"""
+    def store(rendered):
+        if rendered.status_code == 200:
+            get_cache().set(key, {'content': rendered.content,
+                                  'content_type': rendered['Content-Type'],
+                                  'etag': etag,
+                                  'last_modified': last_modified})
+
+    response[HEADER] = 'MISS'
+    response.add_post_render_callback(store)
+    return response
@@ -0,0 +1,145 @@
+"""Full-text search over issues and comments, with a SQLite FTS5 table.
+Rows are kept in sync by Issue and Comment signals (see signals.py),
+rowid of an issue is 2 * id, rowid of a comment is 2 * id + 1.
+The project column holds 'p<project_id>' so that matching is scoped
+to a project by the full-text index itself"""
+import re
+
+from django.db import connection, connections, transaction
+
+from softDesk import routers
+from restAPI.models import Issue, Comment
+
+TABLE = 'restapi_search'
+# found words are marked by control characters, which texts don't hold,
+# then given between brackets
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+
+def is_available() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def issue_row(issue: Issue):
+    return (2 * issue.id, issue.title, issue.desc,
+            f'p{issue.project_id}', issue.id)
+
+
+def comment_row(comment: Comment, project_id):
+    return (2 * comment.id + 1, '', comment.description,
+            f'p{project_id}', comment.issue_id)
+
+
+def _replace(rows):
+    if not rows or not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                           [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {TABLE}'
+                           f'(rowid, title, body, project, issue_id) '
+                           f'VALUES (%s, %s, %s, %s, %s)', rows)
+
+
+def _remove(rowids):
+    if not rowids or not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                           [(rowid,) for rowid in rowids])
+
+
+def index_issues(issues):
+    _replace([issue_row(issue) for issue in issues])
+
+
+def index_comments(comments, project_id):
+    _replace([comment_row(comment, project_id) for comment in comments])
+
+
+def remove_issues(issue_ids):
+    _remove([2 * issue_id for issue_id in issue_ids])
+
+
+def remove_comments(comment_ids):
+    _remove([2 * comment_id + 1 for comment_id in comment_ids])
+
+
+def remove_project(project_id, issue_ids=None):
+    """remove the rows of a project, or of some of its issues with their
+    comments, found by the index of the project column, in one query"""
+    if not is_available() or issue_ids is not None and not issue_ids:
+        return
+    sql = f'DELETE FROM {TABLE} WHERE {TABLE} MATCH %s'
+    params = [f'project : "p{project_id}"']
+    if issue_ids is not None:
+        sql += f' AND issue_id IN ({", ".join(["%s"] * len(issue_ids))})'
+        params += issue_ids
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+# issues being deleted are not indexed
+ISSUE_ROWS = "SELECT 2 * id, title, \"desc\", 'p' || project_id, id " \
+             "FROM {issues} WHERE NOT deleting"
+COMMENT_ROWS = "SELECT 2 * c.id + 1, '', c.description, " \
+               "'p' || i.project_id, c.issue_id " \
+               "FROM {comments} c JOIN {issues} i ON c.issue_id = i.id " \
+               "WHERE NOT i.deleting"
+
+
+def rebuild(chunk_size=2000):
+    """fill the whole index again from issues and comments tables,
+    those of shards are read chunk_size rows at a time"""
+    tables = {'issues': Issue._meta.db_table,
+              'comments': Comment._meta.db_table}
+    insert = f'INSERT INTO {TABLE}(rowid, title, body, project, issue_id) '
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        for rows in (ISSUE_ROWS, COMMENT_ROWS):
+            cursor.execute(insert + rows.format(**tables))
+
+        for alias in routers.shard_aliases():
+            with connections[alias].cursor() as shard_cursor:
+                for rows in (ISSUE_ROWS, COMMENT_ROWS):
+                    shard_cursor.execute(rows.format(**tables))
+                    while chunk := shard_cursor.fetchmany(chunk_size):
+                        cursor.executemany(
+                            insert + 'VALUES (%s, %s, %s, %s, %s)', chunk)
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+
+
+def to_match_expression(query: str, project_id):
+    """turn free text into an FTS5 expression matching all of its words
+    in title or body of the project, None if there is no word"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"' for word in words)
+    return f'project : "p{project_id}" AND {{title body}} : ({terms})'
+
+
+def search(query: str, project_id, limit=20):
+    """return best matches of query in a project, as dicts"""
+    expression = to_match_expression(query, project_id)
+    if expression is None or not is_available():
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT rowid, issue_id, "
+                       f"snippet({TABLE}, 0, %s, %s, '…', 12), "
+                       f"snippet({TABLE}, 1, %s, %s, '…', 12), "
+                       f"bm25({TABLE}, 2.0, 1.0, 0.0, 0.0) AS score "
+                       f"FROM {TABLE} WHERE {TABLE} MATCH %s "
+                       f"ORDER BY score LIMIT %s",
+                       [MATCH_START, MATCH_END] * 2 + [expression, limit])
+        rows = cursor.fetchall()
+
+    # snippet of the title if words have been found in it
+    return [{'type': 'comment' if rowid % 2 else 'issue',
+             'id': rowid // 2,
+             'issue': issue_id,
+             'snippet': (title if MATCH_START in title else body)
+             .replace(MATCH_START, '[').replace(MATCH_END, ']'),
+             'score': score}
+            for rowid, issue_id, title, body, score in rows]
@@ -1,20 +1,32 @@
-from rest_framework.serializers import ModelSerializer, PrimaryKeyRelatedField
+from collections import Counter
 
-from .models import Project, Issue, Comment, Contributor
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from rest_framework.serializers import ModelSerializer, \
+    PrimaryKeyRelatedField, ListSerializer
 
+from authentication.serializers import UserSerializer
+from softDesk import routers
+from . import changes, response_cache, search
+from .fieldsets import FieldsetMixin
+from .models import Project, Issue, Comment, Contributor, IdSequence
 
-class ProjectListSerializer(ModelSerializer):
+
+class ProjectListSerializer(FieldsetMixin, ModelSerializer):
     class Meta:
         model = Project
-        fields = ['id', 'title', 'type']
+        fields = ['id', 'title', 'type', 'todo_issue_count',
+                  'on_going_issue_count', 'done_issue_count']
 
 
-class ProjectDetailSerializer(ModelSerializer):
+class ProjectDetailSerializer(FieldsetMixin, ModelSerializer):
     issues = PrimaryKeyRelatedField(many=True, read_only=True)
 
     class Meta:
         model = Project
-        fields = '__all__'
+        exclude = ['shard', 'version', 'deleting']
+        expandable = {'issues': 'restAPI.serializers.IssueSerializer',
+                      'contributors': UserSerializer}
 
     def create(self, validated_data):
         instance: Project = super().create(validated_data)
@@ -23,10 +35,86 @@ class ProjectDetailSerializer(ModelSerializer):
         return instance
 
 
-class IssueSerializer(ModelSerializer):
+class ProjectChangeSerializer(FieldsetMixin, ModelSerializer):
+    """project in the change feed, without its related lists"""
+    class Meta:
+        model = Project
+        exclude = ['contributors', 'shard', 'version', 'deleting']
+
+
+class ContributorSerializer(FieldsetMixin, ModelSerializer):
+    class Meta:
+        model = Contributor
+        fields = ['id', 'user', 'project', 'role']
+        expandable = {'user': UserSerializer}
+
+
+class IssueListSerializer(ListSerializer):
+    """Write a list of issues with one query per operation
+    instead of one per issue"""
+
+    def create(self, validated_data):
+        user = self.context['user']
+        project = self.context['project']
+        # as IssueSerializer.create, the context wins over the item
+        issues = [Issue(**{**attrs,
+                           'author_user': user,
+                           'assignee_user': user,
+                           'project': project,
+                           'last_activity': timezone.now()})
+                  for attrs in validated_data]
+        IdSequence.assign_ids(issues)
+
+        with routers.atomic(project.shard, DEFAULT_DB_ALIAS):
+            issues = Issue.objects.in_shard_of(project).bulk_create(issues)
+            Issue.update_project_counters(
+                project.id, Counter(issue.status for issue in issues))
+            # bulk_create sends no signal
+            search.index_issues(issues)
+            changes.record(issues)
+            response_cache.bump(project.id, project.shard)
+        return issues
+
+    def update(self, instances, validated_data):
+        """instances and validated_data are given in the same order"""
+        # bulk_update doesn't call pre_save, auto_now is done here
+        fields = {'last_activity', 'updated_time'}
+        deltas = Counter()
+        now = timezone.now()
+
+        for issue, attrs in zip(instances, validated_data):
+            if 'status' in attrs and attrs['status'] != issue.status:
+                deltas[issue.status] -= 1
+                deltas[attrs['status']] += 1
+            for field, value in attrs.items():
+                setattr(issue, field, value)
+            issue.last_activity = now
+            issue.updated_time = now
+            fields.update(attrs)
+
+        project = self.context['project']
+        with routers.atomic(project.shard, DEFAULT_DB_ALIAS):
+            Issue.objects.in_shard_of(project).bulk_update(instances, fields)
+            Issue.update_project_counters(project.id, deltas)
+            # bulk_update sends no signal
+            search.index_issues(instances)
+            changes.record(instances)
+            response_cache.bump(project.id, project.shard)
+        return instances
+
+
+class IssueSerializer(FieldsetMixin, ModelSerializer):
     class Meta:
         model = Issue
-        fields = '__all__'
+        exclude = ['deleting']
+        list_serializer_class = IssueListSerializer
+        expandable = {'author_user': UserSerializer,
+                      'assignee_user': UserSerializer,
+                      'project': ProjectListSerializer}
+        # given by the context on creation, an issue never changes
+        # of project nor of author (counters, permissions)
+        read_only_fields = ['project', 'author_user']
+        extra_kwargs = {'assignee_user': {'required': False}}
 
     def create(self, validated_data):
         validated_data['author_user'] = self.context['user']
@@ -35,10 +123,12 @@ class IssueSerializer(ModelSerializer):
         return super().create(validated_data)
 
 
-class CommentSerializer(ModelSerializer):
+class CommentSerializer(FieldsetMixin, ModelSerializer):
     class Meta:
         model = Comment
         fields = '__all__'
+        expandable = {'author_user': UserSerializer,
+                      'issue': IssueSerializer}
 
     def create(self, validated_data):
         validated_data['author_user'] = self.context['user']
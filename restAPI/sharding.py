@@ -0,0 +1,175 @@
+"""Sharding of issues and comments by project : the issues of a project
+and their comments are stored in the database named by Project.shard,
+one of DATABASE_SHARD_ALIASES, or 'default' for projects created
+before shards were added. Projects, contributors and users stay in the
+default database.
+
+ShardRouter finds the shard from the instance given as hint : a project
+(project.issues, Issue.objects.in_shard_of(project)), or an issue or
+comment (read from its shard, or new with its project or issue).
+Without hint, issues and comments are read from 'default', so every
+query on them goes through a project.
+Ids of issues and comments are given by IdSequence, unique across shards.
+move_project() and rebalance() are used by the rebalance_shards command"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Sum
+
+from softDesk import routers
+from restAPI.models import Project, Issue, Comment
+
+SHARDED_MODELS = (Issue, Comment)
+
+
+def is_enabled() -> bool:
+    return bool(routers.shard_aliases())
+
+
+def shard_of(instance):
+    """database of the issues and comments of a project,
+    or of an issue or a comment, None if it can't be told"""
+    if isinstance(instance, Project):
+        return instance.shard
+    if not instance._state.adding:
+        # read or saved there, replicas of 'default' are not shards
+        return instance._state.db if instance._state.db \
+            in routers.shard_aliases() else DEFAULT_DB_ALIAS
+    if isinstance(instance, Issue):
+        if Issue.project.is_cached(instance):
+            return instance.project.shard
+        return Project.objects.filter(pk=instance.project_id) \
+            .values_list('shard', flat=True).first()
+    if isinstance(instance, Comment) and Comment.issue.is_cached(instance):
+        return shard_of(instance.issue)
+    return None
+
+
+def can_join(model, related_model) -> bool:
+    """sharded models can only be joined together"""
+    return not is_enabled() \
+        or (model in SHARDED_MODELS) == (related_model in SHARDED_MODELS)
+
+
+class ShardRouter:
+    """Issues and comments are read and written in the shard of their
+    project, other models are left to the next router"""
+
+    @staticmethod
+    def db_for_model(model, instance):
+        if model not in SHARDED_MODELS or instance is None \
+                or not is_enabled():
+            return None
+        alias = shard_of(instance)
+        # 'default' lets the next router spread reads on replicas
+        return alias if alias in routers.shard_aliases() else None
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_model(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_model(model, hints.get('instance'))
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # shards only hold issues and comments
+        if db in routers.shard_aliases():
+            return app_label == 'restAPI' \
+                and model_name in ('issue', 'comment')
+        return None
+
+
+def copy_rows(model, queryset, target, chunk_size):
+    """insert rows of queryset in target, chunk_size rows at a time,
+    ids are kept and no signal is sent"""
+    rows = []
+    for instance in queryset.order_by('pk').iterator(chunk_size=chunk_size):
+        rows.append(instance)
+        if len(rows) == chunk_size:
+            model.objects.using(target).bulk_create(rows)
+            rows = []
+    model.objects.using(target).bulk_create(rows)
+
+
+def move_project(project: Project, target, chunk_size=2000):
+    """move the issues and comments of project to the target database,
+    rows are copied then deleted in the source, in a transaction on each
+    database. Ids are kept, search index and change feed are unchanged.
+    The project should not be written while it is moved : a request
+    which has read its former shard would write there"""
+    source = project.shard
+    if source == target:
+        return
+    issues = Issue.all_objects.using(source).filter(project=project)
+    comments = Comment.objects.using(source).filter(issue__project=project)
+
+    with routers.atomic(source, target, DEFAULT_DB_ALIAS):
+        copy_rows(Issue, issues, target, chunk_size)
+        copy_rows(Comment, comments, target, chunk_size)
+        Project.objects.filter(pk=project.pk).update(shard=target)
+        # no cascade nor signal : rows still exist in target
+        with connections[source].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Comment._meta.db_table} WHERE issue_id IN '
+                f'(SELECT id FROM {Issue._meta.db_table} '
+                f'WHERE project_id = %s)', [project.pk])
+            cursor.execute(f'DELETE FROM {Issue._meta.db_table} '
+                           f'WHERE project_id = %s', [project.pk])
+    project.shard = target
+
+
+def project_sizes() -> dict:
+    """number of issues and comments of each project, by database"""
+    sizes = {alias: {} for alias in (DEFAULT_DB_ALIAS,
+                                     *routers.shard_aliases())}
+    for alias, projects in sizes.items():
+        rows = Issue.objects.using(alias).order_by() \
+            .values_list('project_id') \
+            .annotate(rows=Count('pk') + Sum('comment_count'))
+        projects.update(rows)
+    # projects without issues are placed too, those being deleted
+    # are not moved
+    shards = dict(Project.objects.values_list('pk', 'shard'))
+    for alias, projects in sizes.items():
+        for project_id in projects.keys() - shards.keys():
+            del projects[project_id]
+    for project_id, shard in shards.items():
+        sizes.setdefault(shard, {}).setdefault(project_id, 0)
+    return sizes
+
+
+def rebalance(sizes: dict) -> list:
+    """return the moves (project id, source, target) spreading issues
+    and comments evenly on the shards : projects of 'default' are moved
+    first, then a project of the largest shard goes to the smallest one
+    while it reduces their gap"""
+    shards = routers.shard_aliases()
+    loads = {alias: sum(sizes.get(alias, {}).values()) for alias in shards}
+    placed = {alias: dict(sizes.get(alias, {})) for alias in shards}
+    moves = []
+
+    def move(project_id, size, source, target):
+        moves.append((project_id, source, target))
+        placed[target][project_id] = size
+        loads[target] += size
+        if source in placed:
+            del placed[source][project_id]
+            loads[source] -= size
+
+    others = {alias: projects for alias, projects in sizes.items()
+              if alias not in shards}
+    for alias, projects in others.items():
+        for project_id, size in sorted(projects.items(),
+                                       key=lambda item: -item[1]):
+            move(project_id, size, alias, min(loads, key=loads.get))
+
+    while True:
+        largest = max(loads, key=loads.get)
+        smallest = min(loads, key=loads.get)
+        gap = loads[largest] - loads[smallest]
+        # a project smaller than the gap reduces it, the best one is
+        # the closest to half of the gap
+        candidates = [(project_id, size) for project_id, size
+                      in placed[largest].items() if 0 < size < gap]
+        if not candidates:
+            return moves
+        project_id, size = min(candidates,
+                               key=lambda item: abs(gap / 2 - item[1]))
+        move(project_id, size, largest, smallest)
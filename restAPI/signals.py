@@ -0,0 +1,151 @@
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from authentication.models import User
+from restAPI import changes, membership, response_cache, search
+from restAPI.models import Project, Contributor, Issue, Comment, Change, \
+    contributors_changed, counters_changed
+from softDesk import routers
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_rows(sender, instance: User, **kwargs):
+    """the cascade of a user only reaches the issues and comments of
+    'default', those of the shards are deleted in each shard"""
+    for alias in routers.shard_aliases():
+        with routers.atomic(alias):
+            Comment.objects.using(alias) \
+                .filter(author_user=instance).delete()
+            Issue.all_objects.using(alias) \
+                .filter(Q(author_user=instance)
+                        | Q(assignee_user=instance)).delete()
+
+
+@receiver(post_save, sender=Issue)
+def count_issue(sender, instance: Issue, created, **kwargs):
+    """move the counters of the project by the status of the issue,
+    from its saved project and status if one of them has changed"""
+    saved = (getattr(instance, '_saved_project_id', None),
+             getattr(instance, '_saved_status', None))
+    if created:
+        Issue.update_project_counters(instance.project_id,
+                                      {instance.status: 1})
+    elif None not in saved and saved != (instance.project_id,
+                                         instance.status):
+        Issue.update_project_counters(saved[0], {saved[1]: -1})
+        Issue.update_project_counters(instance.project_id,
+                                      {instance.status: 1})
+    instance.remember_saved()
+
+
+@receiver(post_delete, sender=Issue)
+def uncount_issue(sender, instance: Issue, **kwargs):
+    """deletions of cascades and querysets included, an issue being
+    deleted in background has left the counters when it was hidden"""
+    if not instance.deleting:
+        Issue.update_project_counters(
+            getattr(instance, '_saved_project_id', None)
+            or instance.project_id,
+            {getattr(instance, '_saved_status', None)
+             or instance.status: -1})
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance: Comment, created, using, **kwargs):
+    """move the comment counters, and touch the last activity of the
+    issue"""
+    saved = getattr(instance, '_saved_issue_id', None)
+    if not created and saved is not None and saved != instance.issue_id:
+        Comment.update_issue_counter(saved, -1, using)
+        Comment.update_issue_counter(instance.issue_id, 1, using)
+    else:
+        Comment.update_issue_counter(instance.issue_id,
+                                     1 if created else 0, using)
+    instance.remember_saved()
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance: Comment, using, **kwargs):
+    Comment.update_issue_counter(
+        getattr(instance, '_saved_issue_id', None) or instance.issue_id,
+        -1, using)
+
+
+@receiver([post_save, post_delete], sender=Contributor)
+def invalidate_membership(sender, instance: Contributor, **kwargs):
+    """any change of a Contributor drops the cached role, those of
+    Project.add_contributors and remove_contributors in sync_contributors"""
+    membership.invalidate(instance.user_id, instance.project_id)
+
+
+@receiver([post_save, post_delete], sender=Contributor)
+def touch_project(sender, instance: Contributor, **kwargs):
+    """contributors are part of the project representation,
+    its updated_time gives its ETag"""
+    Project.objects.filter(pk=instance.project_id) \
+        .update(updated_time=timezone.now())
+
+
+@receiver(contributors_changed, sender=Contributor)
+def sync_contributors(sender, project: Project, contributors, action,
+                      using, **kwargs):
+    """contributors added or removed together, without post_save nor
+    post_delete : what the receivers of a Contributor do, once for all"""
+    for contributor in contributors:
+        membership.invalidate(contributor.user_id, project.pk)
+    Project.objects.filter(pk=project.pk).update(updated_time=timezone.now())
+    response_cache.bump(project.pk, using)
+    changes.record(contributors, action)
+
+
+@receiver([post_save, post_delete], sender=Project)
+@receiver([post_save, post_delete], sender=Contributor)
+@receiver([post_save, post_delete], sender=Issue)
+@receiver([post_save, post_delete], sender=Comment)
+def bump_project_version(sender, instance, using, **kwargs):
+    """cached list pages of the project are outdated"""
+    response_cache.bump(response_cache.project_of(instance), using)
+
+
+@receiver(post_save, sender=Issue)
+def index_issue(sender, instance: Issue, **kwargs):
+    search.index_issues([instance])
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance: Comment, **kwargs):
+    search.index_comments([instance], instance.issue.project_id)
+
+
+@receiver(post_delete, sender=Issue)
+def unindex_issue(sender, instance: Issue, **kwargs):
+    search.remove_issues([instance.id])
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance: Comment, **kwargs):
+    search.remove_comments([instance.id])
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Contributor)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Comment)
+def record_upsert(sender, instance, **kwargs):
+    changes.record([instance])
+
+
+@receiver(counters_changed, sender=Project)
+@receiver(counters_changed, sender=Issue)
+def record_counters(sender, pk, using, **kwargs):
+    changes.record_counters(sender, pk, using)
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Contributor)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Comment)
+def record_delete(sender, instance, **kwargs):
+    changes.record([instance], Change.Action.DELETE)
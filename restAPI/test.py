@@ -1,15 +1,65 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import copy_context
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+
+from asgiref.sync import SyncToAsync, async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.db.models import F, Value
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
 from authentication.models import User
-from .models import Project, Issue, Comment, Contributor
+from . import changes, deletion, membership, response_cache
+from .jsonlib import BACKENDS
+from .models import Project, Issue, Comment, Contributor, Change, \
+    IdSequence
+from .pagination import KeysetPagination
+from .serializers import IssueSerializer
+from .renderers import FastJSONRenderer, msgpack
+from .sharding import move_project, rebalance
+from .views.generics_views import GenericAPIViewForSoftDesk
+from softDesk import instrumentation, profiling, routers
 
 
 def format_datetime(value):
     return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
 
+@contextmanager
+def capture_queries(*aliases):
+    """queries run on each database given (once)"""
+    with ExitStack() as stack:
+        yield [stack.enter_context(CaptureQueriesContext(connections[alias]))
+               for alias in dict.fromkeys(aliases)]
+
+
+class SoftDeskTestCase(APITestCase):
+    """issues and comments may be written in shards
+    (DATABASE_SHARDS)"""
+    databases = {'default', *settings.DATABASE_SHARD_ALIASES}
+
+
 class InitializeServer:
     user_to_create = {"first_name": "Emmanuel",
                       "last_name": "Albisser",
@@ -44,6 +94,12 @@ class InitializeServer:
     }
 
     def __init__(self, client):
+        # database is rolled back between tests, caches are not,
+        # nor the ids reserved for shards
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        IdSequence.reserved.clear()
+
         self.user = self.create_user(self.user_to_create)
         self.user2 = self.create_user(self.other_user)
         self.project = self.create_project(self.user)
@@ -53,14 +109,20 @@ class InitializeServer:
 
         self.client.force_authenticate(user=self.user)
 
-    @staticmethod
-    def issue_count() -> int:
-        issues = Issue.objects.filter(project=1)
+    def issues(self):
+        """issues of the shard of the project"""
+        return Issue.objects.in_shard_of(self.project)
+
+    def comments(self):
+        """comments of the shard of the project"""
+        return Comment.objects.in_shard_of(self.project)
+
+    def issue_count(self) -> int:
+        issues = self.issues().filter(project=1)
         return len(issues)
 
-    @staticmethod
-    def comment_count() -> int:
-        comments = Comment.objects.filter(issue=1)
+    def comment_count(self) -> int:
+        comments = self.comments().filter(issue=1)
         return len(comments)
 
     @classmethod
@@ -91,7 +153,7 @@ class InitializeServer:
         return comment
 
 
-class TestProjects(APITestCase):
+class TestProjects(SoftDeskTestCase):
     """for URI 3 to 7"""
     basename_url = "projects"
 
@@ -109,7 +171,10 @@ class TestProjects(APITestCase):
             {
                 'id': project.pk,
                 'title': project.title,
-                'type': project.type
+                'type': project.type,
+                'todo_issue_count': 1,
+                'on_going_issue_count': 0,
+                'done_issue_count': 0
             }
         ]
         self.assertEqual(expected, response.json()['results'])
@@ -157,7 +222,12 @@ class TestProjects(APITestCase):
             'issues': [1],
             'description': project.description,
             'type': str(project.type),
-            'contributors': [1]
+            'contributors': [1],
+            'todo_issue_count': 1,
+            'on_going_issue_count': 0,
+            'done_issue_count': 0,
+            'updated_time': format_datetime(
+                Project.objects.get(id=1).updated_time)
         }
 
         self.assertEqual(expected, response.json())
@@ -170,6 +240,8 @@ class TestProjects(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         expected["title"] = "Nouveau titre"
+        expected["updated_time"] = format_datetime(
+            Project.objects.get(id=1).updated_time)
 
         response = self.client.get(url)
 
@@ -178,7 +250,7 @@ class TestProjects(APITestCase):
         self.assertEqual(expected, response.json())
 
 
-class TestUser(APITestCase):
+class TestUser(SoftDeskTestCase):
     """for URI 8 to 10"""
 
     def test(self):
@@ -230,10 +302,10 @@ class TestUser(APITestCase):
             'last_name': db.user2.last_name
             }]
 
-        self.assertEqual(response.json(), expected)
+        self.assertEqual(response.json()['results'], expected)
 
 
-class TestIssue(APITestCase):
+class TestIssue(SoftDeskTestCase):
     """Class to test all Issue related URIs (from 11 to 14)"""
 
     def test_get(self):
@@ -246,6 +318,8 @@ class TestIssue(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # last activity has been updated by the comment
+        issue = db.issues().get(id=1)
         expected = {
             'assignee_user': db.issue.assignee_user.id,
             'author_user': db.issue.author_user.id,
@@ -256,10 +330,13 @@ class TestIssue(APITestCase):
             'project': 1,
             'status': db.issue.status.value,
             'tag': db.issue.tag.value,
-            'title': db.issue.title
+            'title': db.issue.title,
+            'comment_count': 1,
+            'last_activity': format_datetime(issue.last_activity),
+            'updated_time': format_datetime(issue.updated_time)
         }
 
-        self.assertEqual(response.json(), [expected])
+        self.assertEqual(response.json()['results'], [expected])
 
     def test_post(self):
         """POST Issue List (URI 12)"""
@@ -275,7 +352,7 @@ class TestIssue(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
-        issue = Issue.objects.get(id=2)
+        issue = db.issues().get(id=2)
 
         self.assertEqual(issue.title,
                          InitializeServer.issue_to_create['title'])
@@ -294,7 +371,8 @@ class TestIssue(APITestCase):
 
         response = self.client.delete(url)
 
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # hidden at once, deleted in background
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
 
         self.assertEqual(db.issue_count(), 0)
 
@@ -302,7 +380,7 @@ class TestIssue(APITestCase):
         """test PUT on URI 13"""
         db = InitializeServer(self.client)
 
-        issue = Issue.objects.get(id=1)
+        issue = db.issues().get(id=1)
 
         self.assertEqual(issue.title,
                          InitializeServer.issue_to_create['title'])
@@ -315,13 +393,13 @@ class TestIssue(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        issue = Issue.objects.get(id=1)
+        issue = db.issues().get(id=1)
 
         self.assertEqual(issue.title,
                          InitializeServer.issue_to_modify['title'])
 
 
-class TestComment(APITestCase):
+class TestComment(SoftDeskTestCase):
     """Class to test all Comment related URIs (from 15 to 20)"""
 
     def test_get_on_list(self):
@@ -340,10 +418,11 @@ class TestComment(APITestCase):
             "description": db.comment.description,
             "author_user": db.comment.author_user.id,
             "created_time": format_datetime(db.comment.created_time),
-            "issue": db.comment.issue.id
+            "issue": db.comment.issue.id,
+            "updated_time": format_datetime(db.comment.updated_time)
         }
 
-        self.assertEqual(response.json(), [expected])
+        self.assertEqual(response.json()['results'], [expected])
 
     def test_post(self):
         """POST Comment List (URI 15)"""
@@ -361,7 +440,7 @@ class TestComment(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
-        comment = Comment.objects.get(id=2)
+        comment = db.comments().get(id=2)
 
         self.assertEqual(comment.description,
                          InitializeServer.comment_to_create['description'])
@@ -389,7 +468,7 @@ class TestComment(APITestCase):
         """test PUT on URI 17"""
         db = InitializeServer(self.client)
 
-        comment = Comment.objects.get(id=1)
+        comment = db.comments().get(id=1)
 
         self.assertEqual(comment.description,
                          InitializeServer.comment_to_create['description'])
@@ -403,7 +482,7 @@ class TestComment(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        comment = Comment.objects.get(id=1)
+        comment = db.comments().get(id=1)
 
         self.assertEqual(comment.description,
                          InitializeServer.comment_to_modify['description'])
@@ -426,12 +505,1878 @@ class TestComment(APITestCase):
             "description": db.comment.description,
             "created_time": format_datetime(db.comment.created_time),
             "author_user": db.comment.author_user.id,
-            "issue": db.comment.issue.id
+            "issue": db.comment.issue.id,
+            "updated_time": format_datetime(db.comment.updated_time)
         }
         self.assertEqual(response.json(),
                          expected)
 
 
+class TestScopedLookup(SoftDeskTestCase):
+    """Class to test the project -> issue -> comment chain resolution"""
+
+    def test_single_query(self):
+        """the whole chain and the membership are checked in one query"""
+        InitializeServer(self.client)
+
+        url = reverse_lazy('comment-from-issues-from-project',
+                           kwargs={'project_id': 1,
+                                   'issue_id': 1,
+                                   'comment_id': 1})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_chain_mismatch(self):
+        """an issue or a comment out of the chain gives an ERROR 404"""
+        db = InitializeServer(self.client)
+
+        other_project = db.create_project(db.user)
+        other_issue = db.create_issue(other_project, db.user)
+
+        # issue exists but belongs to another project
+        url = reverse_lazy('issue-from-project',
+                           kwargs={'project_id': 1,
+                                   'issue_id': other_issue.id})
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # comment exists but belongs to another issue
+        url = reverse_lazy('comment-from-issues-from-project',
+                           kwargs={'project_id': other_project.id,
+                                   'issue_id': other_issue.id,
+                                   'comment_id': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.assertEqual(db.issue_count(), 1)
+
+    def test_not_contributor(self):
+        """a user who doesn't contribute to the project gets ERROR 404"""
+        db = InitializeServer(self.client)
+        self.client.force_authenticate(user=db.user2)
+
+        url = reverse_lazy('issues-from-project',
+                           kwargs={'project_id': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestKeysetPagination(SoftDeskTestCase):
+    """Class to test cursor pagination on nested lists and projects"""
+
+    def test_issues(self):
+        """walk through the issues of a project, 3 by 3"""
+        db = InitializeServer(self.client)
+        for _ in range(6):
+            db.create_issue(db.project, db.user)
+
+        url = reverse_lazy('issues-from-project',
+                           kwargs={'project_id': 1})
+        response = self.client.get(url, data={'page_size': 3})
+
+        ids = []
+        pages = 0
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [issue['id'] for issue in response.json()['results']]
+            pages += 1
+            if response.json()['next'] is None:
+                break
+            response = self.client.get(response.json()['next'])
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, list(range(1, 8)))
+
+    def test_invalid_cursor(self):
+        """a cursor which can't be decoded gives ERROR 404"""
+        InitializeServer(self.client)
+
+        url = reverse_lazy('comments-from-issues-from-project',
+                           kwargs={'project_id': 1,
+                                   'issue_id': 1})
+        response = self.client.get(url, data={'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # well formed, with an id out of the range of the database
+        cursor = KeysetPagination.encode_cursor(['2020-01-01T00:00:00Z',
+                                                 10 ** 30])
+        response = self.client.get(url, data={'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_projects(self):
+        """projects use keyset pagination when a cursor is given"""
+        db = InitializeServer(self.client)
+        for _ in range(6):
+            db.create_project(db.user)
+
+        url = reverse_lazy('projects-list')
+        response = self.client.get(url, data={'cursor': ''})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([project['id']
+                          for project in response.json()['results']],
+                         list(range(1, 6)))
+
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([project['id']
+                          for project in response.json()['results']],
+                         [6, 7])
+        self.assertIsNone(response.json()['next'])
+
+
+class TestExport(SoftDeskTestCase):
+    """Class to test the streaming export of a project"""
+
+    def test_ndjson(self):
+        """NDJSON export gives one line per object"""
+        db = InitializeServer(self.client)
+        db.project.add_contributor(db.user2)
+
+        url = reverse_lazy('export-project', kwargs={'project_id': 1})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type']
+                        .startswith('application/x-ndjson'))
+
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['model'] for row in rows],
+                         ['project', 'contributor', 'contributor',
+                          'issue', 'comment'])
+        self.assertEqual(rows[-1]['description'], db.comment.description)
+
+    def test_csv(self):
+        """CSV export gives a header then one line per object"""
+        InitializeServer(self.client)
+
+        url = reverse_lazy('export-project', kwargs={'project_id': 1})
+        response = self.client.get(url, data={'format': 'csv'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('model,id,project,issue'))
+        self.assertEqual(len(lines), 5)
+
+
+class TestMembershipCache(SoftDeskTestCase):
+    """Class to test the cache of users roles in projects"""
+
+    def test_cached_membership(self):
+        """once known, membership costs no SQL on nested urls"""
+        db = InitializeServer(self.client)
+
+        url = reverse_lazy('issue-from-project',
+                           kwargs={'project_id': 1, 'issue_id': 1})
+        self.client.put(url, data=db.issue_to_modify)
+
+        # only the issue chain, without contributors, then its update
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url, data=db.issue_to_modify)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('restapi_contributor', queries[0]['sql'])
+
+    def test_invalidation(self):
+        """adding or removing a contributor updates its membership"""
+        db = InitializeServer(self.client)
+        self.client.force_authenticate(user=db.user2)
+
+        url = reverse_lazy('issues-from-project',
+                           kwargs={'project_id': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        db.project.add_contributor(db.user2)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        db.project.delete_contributor(db.user2)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_stale_entry(self):
+        """a role cached before the contributors changed, by another
+        process or read back while they changed, is not used"""
+        db = InitializeServer(self.client)
+        db.project.add_contributor(db.user2)
+        self.client.force_authenticate(user=db.user2)
+        url = reverse_lazy('issues-from-project', kwargs={'project_id': 1})
+        self.assertEqual(self.client.get(url).status_code,
+                         status.HTTP_200_OK)
+        entry = membership.get_entry(db.user2.pk, 1)
+
+        db.project.delete_contributor(db.user2)
+        # still cached by the process which hasn't seen the change
+        membership.get_cache().set(membership.cache_key(db.user2.pk, 1),
+                                   entry)
+        self.assertEqual(self.client.get(url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(membership.get_entry(db.user2.pk, 1)[0],
+                         membership.NOT_A_CONTRIBUTOR)
+
+    def test_author_permission(self):
+        """only the author of a project can modify it"""
+        db = InitializeServer(self.client)
+        db.project.add_contributor(db.user2)
+        self.client.force_authenticate(user=db.user2)
+
+        url = reverse_lazy('projects-detail', kwargs={'pk': 1})
+        response = self.client.put(url, data=db.project_to_create)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=db.user)
+        response = self.client.put(url, data=db.project_to_create)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TestIndexes(SoftDeskTestCase):
+    """Class to check with EXPLAIN that hot queries use their index"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        # ordering must come from the index, not from a sort
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_issues_of_project(self):
+        db = InitializeServer(self.client)
+        queryset = Issue.objects.filter(project=db.project) \
+            .order_by('created_time', 'id')
+        self.assertUsesIndex(queryset, 'issue_project_created_idx')
+
+        # next page of keyset pagination seeks on created_time
+        position = [db.issue.created_time, db.issue.id]
+        queryset = queryset.filter(KeysetPagination().after(position))
+        self.assertUsesIndex(queryset, 'issue_project_created_idx')
+        self.assertIn('(project_id=? AND created_time>?)',
+                      queryset.explain())
+
+    def test_issues_triage(self):
+        db = InitializeServer(self.client)
+        queryset = Issue.objects.filter(project=db.project,
+                                        status=Issue.Status.TODO,
+                                        priority=Issue.Priority.ELEVEE)
+        self.assertUsesIndex(queryset, 'issue_project_triage_idx')
+
+    def test_comments_of_issue(self):
+        db = InitializeServer(self.client)
+        queryset = Comment.objects.filter(issue=db.issue) \
+            .order_by('created_time', 'id')
+        self.assertUsesIndex(queryset, 'comment_issue_created_idx')
+
+    def test_author_of_project(self):
+        db = InitializeServer(self.client)
+        queryset = Contributor.objects.filter(project=db.project,
+                                              role=Contributor.Role.author)
+        self.assertUsesIndex(queryset, 'contributor_project_role_idx')
+
+
+class TestCounters(SoftDeskTestCase):
+    """Class to test issue counters of projects
+    and comment counters of issues"""
+
+    def test_issue_counters(self):
+        """counters follow creation, status change and deletion"""
+        db = InitializeServer(self.client)
+
+        url = reverse_lazy('issue-from-project',
+                           kwargs={'project_id': 1, 'issue_id': 1})
+        self.client.put(url, data={'status': Issue.Status.DONE})
 
+        db.project.refresh_from_db()
+        self.assertEqual(db.project.todo_issue_count, 0)
+        self.assertEqual(db.project.done_issue_count, 1)
 
+        self.client.delete(url)
 
+        db.project.refresh_from_db()
+        self.assertEqual(db.project.done_issue_count, 0)
+
+    def test_comment_counter(self):
+        """comment counter follows creation and deletion"""
+        db = InitializeServer(self.client)
+
+        url = reverse_lazy('comments-from-issues-from-project',
+                           kwargs={'project_id': 1, 'issue_id': 1})
+        self.client.post(url, data=db.comment_to_create)
+
+        db.issue.refresh_from_db()
+        self.assertEqual(db.issue.comment_count, 2)
+        last_activity = db.issue.last_activity
+
+        db.comment.delete()
+
+        db.issue.refresh_from_db()
+        self.assertEqual(db.issue.comment_count, 1)
+        self.assertGreater(db.issue.last_activity, last_activity)
+
+    def test_cascade(self):
+        """counters follow deletions by cascade and by querysets"""
+        db = InitializeServer(self.client)
+        other = db.create_issue(db.project, db.user2)
+        db.create_comment(db.issue, db.user2)
+        db.create_comment(other, db.user)
+
+        db.user2.delete()
+
+        db.project.refresh_from_db()
+        db.issue.refresh_from_db()
+        self.assertEqual(db.project.todo_issue_count, 1)
+        self.assertEqual(db.issue.comment_count, 1)
+
+        db.comments().filter(issue=db.issue).delete()
+        db.issues().filter(project=db.project).delete()
+        db.project.refresh_from_db()
+        self.assertEqual(db.project.todo_issue_count, 0)
+
+    def test_moves(self):
+        """an issue or a comment saved elsewhere moves the counters,
+        a stale instance doesn't overwrite them"""
+        db = InitializeServer(self.client)
+        # issues and comments move inside the shard of their project
+        project = Project.objects.create(**db.project_to_create,
+                                         shard=db.project.shard)
+        issue = db.create_issue(project, db.user)
+
+        # loaded before its comment is added
+        stale = Issue.objects.in_shard_of(project).get(pk=issue.pk)
+        db.comment.issue = issue
+        db.comment.save()
+        stale.save()
+
+        db.issue.project = project
+        db.issue.status = Issue.Status.DONE
+        db.issue.save()
+
+        for instance in (db.project, project, db.issue, issue):
+            instance.refresh_from_db()
+        self.assertEqual((db.project.todo_issue_count,
+                          db.project.done_issue_count), (0, 0))
+        self.assertEqual((project.todo_issue_count,
+                          project.done_issue_count), (1, 1))
+        self.assertEqual((db.issue.comment_count, issue.comment_count),
+                         (0, 1))
+
+    def test_rebuild(self):
+        """rebuild_counters command recomputes counters in bulk"""
+        db = InitializeServer(self.client)
+        Project.objects.update(todo_issue_count=10)
+        Issue.objects.update(comment_count=10)
+
+        call_command('rebuild_counters', stdout=StringIO())
+
+        db.project.refresh_from_db()
+        db.issue.refresh_from_db()
+        self.assertEqual(db.project.todo_issue_count, 1)
+        self.assertEqual(db.issue.comment_count, 1)
+        self.assertEqual(db.issue.last_activity, db.comment.created_time)
+
+
+class TestBulkIssues(SoftDeskTestCase):
+    """Class to test creation, update and deletion of lists of issues"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.url = reverse_lazy('bulk-issues-from-project',
+                                kwargs={'project_id': 1})
+
+    def test_create(self):
+        """a list of issues is created with counters up to date"""
+        issues = [{**InitializeServer.issue_to_create, 'title': str(i)}
+                  for i in range(20)]
+        issues[0]['status'] = Issue.Status.DONE
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data=issues,
+                                        format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()), 20)
+        self.assertEqual(self.db.issue_count(), 21)
+        self.assertLessEqual(len(queries), 10)
+
+        self.db.project.refresh_from_db()
+        self.assertEqual(self.db.project.todo_issue_count, 20)
+        self.assertEqual(self.db.project.done_issue_count, 1)
+
+    def test_create_errors(self):
+        """nothing is created if an item is wrong"""
+        issues = [InitializeServer.issue_to_create,
+                  {**InitializeServer.issue_to_create, 'tag': 'Unknown'}]
+
+        response = self.client.post(self.url, data=issues, format='json')
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn('tag', response.json()[1])
+        self.assertEqual(self.db.issue_count(), 1)
+
+    def test_create_given_relations(self):
+        """project and author of the items are those of the request"""
+        other = self.db.create_project(self.db.user2)
+        response = self.client.post(
+            self.url,
+            data=[{**InitializeServer.issue_to_create,
+                   'project': other.id,
+                   'author_user': self.db.user2.id,
+                   'assignee_user': self.db.user2.id}],
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        issue = self.db.issues().get(id=response.json()[0]['id'])
+        self.assertEqual((issue.project_id, issue.author_user_id,
+                          issue.assignee_user_id),
+                         (1, self.db.user.id, self.db.user.id))
+
+    def test_update(self):
+        """a list of issues is partially updated"""
+        other = self.db.create_issue(self.db.project, self.db.user)
+
+        response = self.client.patch(
+            self.url,
+            data=[{'id': 1, 'status': Issue.Status.ON_GOING},
+                  {'id': other.id, 'title': 'Nouveau titre'}],
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.db.issues().get(id=1).status,
+                         Issue.Status.ON_GOING)
+        self.assertEqual(self.db.issues().get(id=other.id).title,
+                         'Nouveau titre')
+        self.db.project.refresh_from_db()
+        self.assertEqual(self.db.project.on_going_issue_count, 1)
+
+    def test_update_read_only(self):
+        """an issue keeps its project and its author"""
+        other = self.db.create_project(self.db.user2)
+
+        response = self.client.patch(
+            self.url,
+            data=[{'id': 1, 'project': other.id,
+                   'author_user': self.db.user2.id}],
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        issue = self.db.issues().get(id=1)
+        self.assertEqual((issue.project_id, issue.author_user_id),
+                         (1, self.db.user.id))
+        other.refresh_from_db()
+        self.assertEqual(other.todo_issue_count, 0)
+
+    def test_update_errors(self):
+        """issues not found or not authored are reported"""
+        other = self.db.create_issue(self.db.project, self.db.user2)
+
+        response = self.client.patch(
+            self.url,
+            data=[{'id': 1, 'title': 'Nouveau titre'},
+                  {'id': other.id, 'title': 'Nouveau titre'},
+                  {'id': 1000, 'title': 'Nouveau titre'},
+                  {'id': True, 'title': 'Nouveau titre'}],
+            format='json')
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn('id', errors[1])
+        self.assertIn('id', errors[2])
+        self.assertIn('id', errors[3])
+        self.assertEqual(self.db.issues().get(id=1).title,
+                         InitializeServer.issue_to_create['title'])
+
+    def test_delete(self):
+        """a list of issues is deleted"""
+        other = self.db.create_issue(self.db.project, self.db.user)
+
+        response = self.client.delete(self.url, data=[1, other.id],
+                                      format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.db.issue_count(), 0)
+        self.db.project.refresh_from_db()
+        self.assertEqual(self.db.project.todo_issue_count, 0)
+
+    def test_duplicates(self):
+        """an issue given twice is reported, nothing is written"""
+        response = self.client.delete(self.url, data=[1, 1], format='json')
+        self.assertEqual(response.status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn('id', response.json()[1])
+        self.assertEqual(self.db.issue_count(), 1)
+
+        response = self.client.patch(
+            self.url, data=[{'id': 1, 'title': 'a'}, {'id': 1, 'title': 'b'}],
+            format='json')
+        self.assertEqual(response.status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', response.json()[1])
+        self.assertEqual(self.db.issues().get(id=1).title,
+                         InitializeServer.issue_to_create['title'])
+
+
+class TestSearch(SoftDeskTestCase):
+    """Class to test full-text search in issues and comments"""
+
+    def search(self, query, project_id=1):
+        url = reverse_lazy('search-project',
+                           kwargs={'project_id': project_id})
+        return self.client.get(url, data={'q': query})
+
+    def test_search(self):
+        """issues and comments are found by their words"""
+        db = InitializeServer(self.client)
+
+        response = self.search('connecter')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([(result['type'], result['id'])
+                          for result in results], [('issue', 1)])
+        self.assertIn('[connecter]', results[0]['snippet'])
+
+        # diacritics are ignored
+        results = self.search('CA pas bien').json()['results']
+        self.assertEqual([(result['type'], result['id'], result['issue'])
+                          for result in results], [('comment', 1, 1)])
+
+        # index follows modifications and deletions
+        db.comment.description = 'Bravo'
+        db.comment.save()
+        self.assertEqual(self.search('bien').json()['results'], [])
+        self.assertEqual(len(self.search('bravo').json()['results']), 1)
+
+        db.issue.delete()
+        self.assertEqual(self.search('bravo').json()['results'], [])
+
+    def test_snippet(self):
+        """the snippet is from the text holding the words found,
+        even with brackets in the title"""
+        db = InitializeServer(self.client)
+        db.issue.title = '[Android] Connexion'
+        db.issue.save()
+
+        snippet = self.search('connecter').json()['results'][0]['snippet']
+        self.assertEqual(snippet, 'Impossible de se [connecter]')
+
+    def test_scope(self):
+        """only the project given in the url is searched"""
+        db = InitializeServer(self.client)
+        other_project = db.create_project(db.user2)
+        db.create_issue(other_project, db.user2)
+
+        self.assertEqual(len(self.search('connecter').json()['results']),
+                         1)
+        self.assertEqual(self.search('connecter', other_project.id)
+                         .status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuild(self):
+        """rebuild_search_index command indexes existing rows again"""
+        InitializeServer(self.client)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM restapi_search')
+        self.assertEqual(self.search('connecter').json()['results'], [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        self.assertEqual(len(self.search('connecter').json()['results']),
+                         1)
+
+
+class TestConditionalGet(SoftDeskTestCase):
+    """Class to test ETag and Last-Modified on projects, issues
+    and comments"""
+
+    def assertNotModifiedUntilChange(self, url, change):
+        """second GET with ETag gets a 304, until change is done"""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        change()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_projects(self):
+        db = InitializeServer(self.client)
+        self.assertNotModifiedUntilChange(
+            reverse_lazy('projects-list'),
+            lambda: db.create_issue(db.project, db.user))
+        self.assertNotModifiedUntilChange(
+            reverse_lazy('projects-detail', kwargs={'pk': 1}),
+            lambda: db.project.add_contributor(db.user2))
+
+    def test_issues(self):
+        db = InitializeServer(self.client)
+        url = reverse_lazy('issues-from-project', kwargs={'project_id': 1})
+
+        def change():
+            db.issue.title = 'Nouveau titre'
+            db.issue.save()
+
+        self.assertNotModifiedUntilChange(url, change)
+
+        # an issue deleted changes the count
+        self.assertNotModifiedUntilChange(url, db.issue.delete)
+
+    def test_comments(self):
+        db = InitializeServer(self.client)
+        kwargs = {'project_id': 1, 'issue_id': 1}
+        self.assertNotModifiedUntilChange(
+            reverse_lazy('comments-from-issues-from-project',
+                         kwargs=kwargs),
+            lambda: db.create_comment(db.issue, db.user))
+
+        def change():
+            db.comment.description = 'Nouvelle description'
+            db.comment.save()
+
+        self.assertNotModifiedUntilChange(
+            reverse_lazy('comment-from-issues-from-project',
+                         kwargs={**kwargs, 'comment_id': 1}),
+            change)
+
+    def test_expand(self):
+        """expanded relations are not covered by validators, changes of
+        an expanded issue or user are given"""
+        db = InitializeServer(self.client)
+        project_url = reverse_lazy('projects-detail', kwargs={'pk': 1})
+        issues_url = reverse_lazy('issues-from-project',
+                                  kwargs={'project_id': 1})
+        urls = [f'{project_url}?expand=issues',
+                f'{issues_url}?expand=author_user']
+        for url in urls:
+            response = self.client.get(url)
+            self.assertFalse(response.has_header('ETag'))
+            self.assertFalse(response.has_header('Last-Modified'))
+
+        db.issue.title = 'Nouveau titre'
+        db.issue.save()
+        db.user.last_name = 'Nouveau'
+        db.user.save()
+        response = self.client.get(urls[0], HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.json()['issues'][0]['title'],
+                         'Nouveau titre')
+        response = self.client.get(urls[1], HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.json()['results'][0]['author_user']
+                         ['last_name'], 'Nouveau')
+
+    def test_project_fields(self):
+        """updated_time of the validators is read with the project"""
+        InitializeServer(self.client)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse_lazy('projects-detail', kwargs={'pk': 1}),
+                data={'fields': 'id,title'})
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_if_modified_since(self):
+        """only a single resource has a Last-Modified, a deletion in
+        a collection doesn't move its last updated_time"""
+        db = InitializeServer(self.client)
+        url = reverse_lazy('comment-from-issues-from-project',
+                           kwargs={'project_id': 1, 'issue_id': 1,
+                                   'comment_id': 1})
+        response = self.client.get(url)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        url = reverse_lazy('issues-from-project', kwargs={'project_id': 1})
+        db.create_issue(db.project, db.user)
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        db.issue.delete()
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class TestChangeFeed(SoftDeskTestCase):
+    """Class to test the changes of a project since a cursor"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.url = reverse_lazy('changes-from-project',
+                                kwargs={'project_id': 1})
+
+    def changes(self, cursor, **params):
+        response = self.client.get(self.url, data={'since': cursor,
+                                                   **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_changes(self):
+        """only the last change of each object, deletions included"""
+        cursor = self.client.get(self.url).json()['cursor']
+        self.assertEqual(self.changes(cursor)['changes'], [])
+
+        self.db.comment.description = 'Nouvelle description'
+        self.db.comment.save()
+        issue = self.db.create_issue(self.db.project, self.db.user)
+        issue.title = 'Nouveau titre'
+        issue.save()
+        self.db.project.add_contributor(self.db.user2)
+        self.db.comment.delete()
+
+        result = self.changes(cursor)
+        self.assertFalse(result['more'])
+        # counters moved by the issue and the comment are given
+        self.assertEqual([(change['type'], change['id'], change['action'])
+                          for change in result['changes']],
+                         [('project', 1, 'upsert'),
+                          ('issue', 2, 'upsert'),
+                          ('contributor', 2, 'upsert'),
+                          ('issue', 1, 'upsert'),
+                          ('comment', 1, 'delete')])
+        self.assertEqual(result['changes'][0]['data']['todo_issue_count'],
+                         2)
+        self.assertEqual(result['changes'][1]['data']['title'],
+                         'Nouveau titre')
+        self.assertEqual(result['changes'][3]['data']['comment_count'], 0)
+        self.assertNotIn('data', result['changes'][4])
+
+        # next poll starts after these changes
+        self.assertEqual(self.changes(result['cursor'])['changes'], [])
+
+    def test_bulk_and_limit(self):
+        """bulk writes are logged, a poll is limited"""
+        cursor = self.client.get(self.url).json()['cursor']
+        self.client.post(reverse_lazy('bulk-issues-from-project',
+                                      kwargs={'project_id': 1}),
+                         data=[InitializeServer.issue_to_create] * 5,
+                         format='json')
+
+        # the counters of the project, then the issues
+        result = self.changes(cursor, limit=3)
+        self.assertTrue(result['more'])
+        self.assertEqual([(change['type'], change['id'])
+                          for change in result['changes']],
+                         [('project', 1), ('issue', 2), ('issue', 3)])
+        result = self.changes(result['cursor'], limit=3)
+        self.assertFalse(result['more'])
+        self.assertEqual([change['id'] for change in result['changes']],
+                         [4, 5, 6])
+
+    def test_scope_and_cursor(self):
+        """changes of other projects are not given, bad cursors neither"""
+        cursor = self.client.get(self.url).json()['cursor']
+        other_project = self.db.create_project(self.db.user2)
+        self.db.create_issue(other_project, self.db.user2)
+        self.assertEqual(self.changes(cursor)['changes'], [])
+
+        response = self.client.get(self.url, data={'since': 'abc'})
+        self.assertEqual(response.status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        expired = changes.encode_cursor(0)
+        with self.settings(CHANGE_FEED_RETENTION_DAYS=-1):
+            response = self.client.get(self.url, data={'since': expired})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_compact(self):
+        """compact_changes keeps the last change of each object"""
+        for description in ('a', 'b', 'c'):
+            self.db.comment.description = description
+            self.db.comment.save()
+        self.db.issue.delete()
+
+        call_command('compact_changes', stdout=StringIO())
+        self.assertEqual(
+            Change.objects.filter(model='comment').count(), 1)
+
+        call_command('compact_changes', days=0,
+                     stdout=StringIO())
+        self.assertFalse(
+            Change.objects.filter(action=Change.Action.DELETE).exists())
+        self.assertTrue(Change.objects.filter(model='project').exists())
+
+
+class TestFieldsets(SoftDeskTestCase):
+    """Class to test ?fields= and ?expand= on responses"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.issues_url = reverse_lazy('issues-from-project',
+                                       kwargs={'project_id': 1})
+
+    def test_fields(self):
+        """only requested fields are given and read from database"""
+        with CaptureQueriesContext(
+                connections[self.db.project.shard]) as queries:
+            response = self.client.get(self.issues_url,
+                                       data={'fields': 'id,title'})
+
+        self.assertEqual(response.json()['results'],
+                         [{'id': 1, 'title': self.db.issue.title}])
+        select = [query['sql'] for query in queries
+                  if 'FROM "restAPI_issue"' in query['sql']][-1]
+        self.assertNotIn('"desc"', select)
+
+        # a write is answered with the whole representation
+        response = self.client.post(f'{self.issues_url}?fields=id',
+                                    data=InitializeServer.issue_to_create)
+        self.assertIn('desc', response.json())
+
+    def test_expand(self):
+        """expanded relations are loaded with the same number of queries
+        whatever the number of elements"""
+        def get():
+            # the role is read with the chain
+            membership.get_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    self.issues_url, data={'expand': 'author_user'})
+            return response.json()['results'], len(queries)
+
+        results, nb_queries = get()
+        self.assertEqual(results[0]['author_user'],
+                         {'first_name': self.db.user.first_name,
+                          'last_name': self.db.user.last_name})
+
+        for _ in range(4):
+            self.db.create_issue(self.db.project, self.db.user2)
+        results, more_queries = get()
+        self.assertEqual(len(results), 5)
+        self.assertEqual(nb_queries, more_queries)
+
+    def test_project_issues(self):
+        """issues of a project are only read if they are given"""
+        url = reverse_lazy('projects-detail', kwargs={'pk': 1})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'fields': 'id,title'})
+        self.assertEqual(set(response.json()), {'id', 'title'})
+        self.assertFalse([query for query in queries
+                          if 'FROM "restAPI_issue"' in query['sql']])
+
+        response = self.client.get(url, data={'expand': 'issues'})
+        self.assertEqual(response.json()['issues'][0]['title'],
+                         self.db.issue.title)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['issues'], [1])
+
+
+class TestFastJSON(SoftDeskTestCase):
+    """Class to test JSON backends of renderer and parser"""
+
+    def test_same_document(self):
+        """every backend renders what DRF JSONRenderer renders"""
+        db = InitializeServer(self.client)
+        data = {'issues': IssueSerializer([db.issue], many=True).data,
+                'status': Issue.Status.ON_GOING,
+                'time': timezone.now(),
+                'lazy': gettext_lazy('Description'),
+                'price': Decimal('1.50'),
+                'text': 'éà ',
+                'none': None}
+        expected = JSONRenderer().render(data)
+
+        for name in BACKENDS:
+            with self.subTest(backend=name):
+                renderer = FastJSONRenderer()
+                renderer.backend = name
+                self.assertEqual(renderer.render(data), expected)
+
+    def test_parse_error(self):
+        InitializeServer(self.client)
+        response = self.client.post(
+            reverse_lazy('bulk-issues-from-project',
+                         kwargs={'project_id': 1}),
+            data='[{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+
+@skipUnless(msgpack, 'msgpack is not installed')
+class TestMessagePack(SoftDeskTestCase):
+    """Class to test application/msgpack responses and requests"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.url = reverse_lazy('issues-from-project',
+                                kwargs={'project_id': 1})
+
+    def test_render(self):
+        """same content as JSON, with native timestamps"""
+        response = self.client.get(self.url,
+                                   HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        issue = msgpack.unpackb(response.content,
+                                timestamp=3)['results'][0]
+        self.assertEqual(issue['created_time'], self.db.issue.created_time)
+
+        expected = self.client.get(self.url).json()['results'][0]
+        self.assertEqual(issue.keys(), expected.keys())
+        for field, value in expected.items():
+            if not field.endswith(('_time', 'last_activity')):
+                self.assertEqual(issue[field], value)
+
+    def test_parse(self):
+        """an issue can be posted in MessagePack"""
+        response = self.client.post(
+            self.url,
+            data=msgpack.packb(InitializeServer.issue_to_create),
+            content_type='application/msgpack',
+            HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(msgpack.unpackb(response.content)['title'],
+                         InitializeServer.issue_to_create['title'])
+        self.assertEqual(self.db.issue_count(), 2)
+
+        response = self.client.post(self.url, data=b'\xc1',
+                                    content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestAsyncViews(SoftDeskTestCase):
+    """Class to test async variants of read views"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+
+    def assertSameResponse(self, name, data=None, **kwargs):
+        response = self.client.get(reverse_lazy(f'async-{name}',
+                                                kwargs=kwargs), data=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # links to next page only differ by their prefix
+        self.assertEqual(response.content.replace(b'/async/', b'/'),
+                         self.client.get(reverse_lazy(name, kwargs=kwargs),
+                                         data=data).content)
+
+    def test_same_responses(self):
+        """async views answer as sync ones"""
+        for _ in range(6):
+            self.db.create_issue(self.db.project, self.db.user)
+        self.db.project.add_contributor(self.db.user2)
+
+        self.assertSameResponse('users-from-project', project_id=1)
+        self.assertSameResponse('issues-from-project', project_id=1)
+        self.assertSameResponse('comments-from-issues-from-project',
+                                project_id=1, issue_id=1)
+        self.assertSameResponse('comment-from-issues-from-project',
+                                project_id=1, issue_id=1, comment_id=1)
+
+    def test_expand(self):
+        """expanded relations are read before serializing"""
+        expand = {'expand': 'author_user'}
+        self.assertSameResponse('issues-from-project', expand,
+                                project_id=1)
+        self.assertSameResponse('comments-from-issues-from-project', expand,
+                                project_id=1, issue_id=1)
+        self.assertSameResponse('comment-from-issues-from-project', expand,
+                                project_id=1, issue_id=1, comment_id=1)
+
+    def test_errors(self):
+        url = reverse_lazy('async-issues-from-project',
+                           kwargs={'project_id': 1})
+
+        self.client.force_authenticate(user=self.db.user2)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('detail', response.json())
+
+
+@skipUnless(connection.settings_dict.get('TRANSACTION_MODE'),
+            'SQLite tuning is disabled')
+class TestSQLiteTuning(SoftDeskTestCase):
+    """Class to test pragmas and transaction mode of SQLite connections"""
+
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            for name, value in (('busy_timeout', 5000),
+                                ('synchronous', 1),
+                                ('cache_size', -64 * 1024)):
+                cursor.execute(f'PRAGMA {name}')
+                self.assertEqual(cursor.fetchone()[0], value, name)
+
+    def test_begin_immediate(self):
+        """the write lock is taken when a transaction begins"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+            wrapper = type(connections['default'])(
+                {**connection.settings_dict, 'NAME': path}, alias='tuning')
+            wrapper.connect()
+            try:
+                wrapper._start_transaction_under_autocommit()
+
+                other = sqlite3.connect(path, timeout=0)
+                with self.assertRaises(sqlite3.OperationalError):
+                    other.execute('BEGIN IMMEDIATE')
+                other.close()
+            finally:
+                wrapper.close()
+
+
+class TestReadReplicas(SoftDeskTestCase):
+    """Class to test routing of reads on replicas,
+    the fixtures are written before 'replica' is declared"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.replicas = override_settings(DATABASE_REPLICA_ALIASES=['replica'])
+
+    @staticmethod
+    def db_for_read_during(method) -> str:
+        """database given to reads by a request through the middleware"""
+        middleware = routers.ReadReplicaMiddleware(
+            lambda request: router.db_for_read(Issue))
+        request = getattr(RequestFactory(), method)('/')
+        return copy_context().run(middleware, request)
+
+    @staticmethod
+    def db_for_read_during_async(method) -> str:
+        async def view(request):
+            return router.db_for_read(Issue)
+
+        middleware = routers.ReadReplicaMiddleware(view)
+        request = getattr(RequestFactory(), method)('/')
+        return async_to_sync(middleware)(request)
+
+    def test_routing(self):
+        with self.replicas:
+            self.assertEqual(router.db_for_read(Issue), 'replica')
+            self.assertEqual(router.db_for_write(Issue), 'default')
+            self.assertEqual(self.db_for_read_during('get'), 'replica')
+            # reads of a write request see the rows it writes
+            for method in ('post', 'put', 'delete'):
+                self.assertEqual(self.db_for_read_during(method), 'default')
+        self.assertEqual(router.db_for_read(Issue), 'default')
+
+    def test_middleware(self):
+        """the middleware is only used with replicas, and doesn't make
+        async views run in a thread under ASGI"""
+        with self.assertRaises(MiddlewareNotUsed):
+            routers.ReadReplicaMiddleware(lambda request: None)
+        self.assertNotIsInstance(ASGIHandler()._middleware_chain,
+                                 SyncToAsync)
+
+        with self.replicas:
+            self.assertNotIsInstance(ASGIHandler()._middleware_chain,
+                                     SyncToAsync)
+            self.assertEqual(self.db_for_read_during_async('get'),
+                             'replica')
+            self.assertEqual(self.db_for_read_during_async('post'),
+                             'default')
+
+    def test_read_your_writes(self):
+        """a user who has written reads from the primary for a while,
+        whichever process serves them : the response carries it"""
+        def pinned(user, cookies) -> bool:
+            request = RequestFactory().get('/')
+            request.COOKIES.update(cookies)
+            request.user = user
+            routers.pin_for(request)
+            return routers.use_primary.get()
+
+        with self.replicas:
+            # the middleware is only loaded with replicas
+            self.client.handler.load_middleware()
+            response = self.client.post(
+                reverse_lazy('issues-from-project', kwargs={'project_id': 1}),
+                data=self.db.issue_to_create)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            cookies = {name: cookie.value
+                       for name, cookie in response.cookies.items()}
+            # nothing is kept by the process which served the write
+            for alias in settings.CACHES:
+                caches[alias].clear()
+
+            self.assertTrue(copy_context().run(pinned, self.db.user,
+                                               cookies))
+            self.assertFalse(copy_context().run(pinned, self.db.user2,
+                                                cookies))
+            self.assertFalse(copy_context().run(
+                pinned, self.db.user,
+                {routers.STICKY_COOKIE: str(self.db.user.pk)}))
+            # the pin is reset after the request
+            self.assertFalse(routers.use_primary.get())
+
+            with override_settings(REPLICA_STICKINESS=0):
+                time.sleep(1)
+                self.assertFalse(copy_context().run(pinned, self.db.user,
+                                                    cookies))
+
+    def test_membership_cache(self):
+        """roles read on a replica are not cached, it may lag"""
+        element = Project.objects.annotate(
+            member_role=Value(Contributor.Role.contributor)).get(id=1)
+        element._state.db = 'replica'
+        GenericAPIViewForSoftDesk.check_membership(element, self.db.user2,
+                                                   None)
+        self.assertIsNone(membership.get_entry(self.db.user2.pk, 1))
+
+
+@skipUnless(settings.DATABASE_SHARD_ALIASES,
+            'DATABASE_SHARDS is not configured')
+class TestSharding(SoftDeskTestCase):
+    """Class to test issues and comments stored in shards,
+    run with 2 shards at least, for instance
+    DATABASE_SHARDS=shard1.sqlite3,shard2.sqlite3"""
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.shard = self.db.project.shard
+
+    def test_placement(self):
+        """issues and comments go in the shard of their project,
+        with ids unique across shards"""
+        self.assertIn(self.shard, settings.DATABASE_SHARD_ALIASES)
+        other = InitializeServer.create_project(self.db.user)
+        self.assertNotEqual(other.shard, self.shard)
+
+        response = self.client.post(
+            reverse_lazy('issues-from-project',
+                         kwargs={'project_id': other.id}),
+            data=self.db.issue_to_create)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        issue_id = response.data['id']
+        self.assertNotEqual(issue_id, self.db.issue.id)
+        self.assertTrue(Issue.objects.using(other.shard)
+                        .filter(id=issue_id, project=other).exists())
+        self.assertFalse(Issue.objects.using(self.shard)
+                         .filter(id=issue_id).exists())
+        self.assertFalse(Issue.objects.filter(id=issue_id).exists())
+
+        response = self.client.post(
+            reverse_lazy('comments-from-issues-from-project',
+                         kwargs={'project_id': other.id,
+                                 'issue_id': issue_id}),
+            data=self.db.comment_to_create)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        issue = Issue.objects.using(other.shard).get(id=issue_id)
+        self.assertEqual(issue.comment_count, 1)
+        self.assertEqual(Project.objects.get(id=other.id).todo_issue_count,
+                         1)
+
+    def test_user_cascade(self):
+        """issues and comments of a deleted user are deleted
+        in every shard"""
+        other = InitializeServer.create_project(self.db.user)
+        issue = InitializeServer.create_issue(other, self.db.user2)
+        InitializeServer.create_comment(self.db.issue, self.db.user2)
+        InitializeServer.create_comment(issue, self.db.user)
+
+        self.db.user2.delete()
+
+        self.assertFalse(Issue.objects.using(other.shard).exists())
+        self.assertFalse(Comment.objects.using(other.shard).exists())
+        self.assertEqual(list(Comment.objects.using(self.shard)),
+                         [self.db.comment])
+        self.assertEqual(Project.objects.get(pk=other.pk).todo_issue_count,
+                         0)
+
+    def test_single_shard_chain(self):
+        """the chain of a comment reads the project then its shard"""
+        url = reverse_lazy('comment-from-issues-from-project',
+                           kwargs={'project_id': 1,
+                                   'issue_id': self.db.issue.id,
+                                   'comment_id': self.db.comment.id})
+        contexts = {alias: CaptureQueriesContext(connections[alias])
+                    for alias in self.databases}
+        for context in contexts.values():
+            context.__enter__()
+        response = self.client.get(url)
+        for context in contexts.values():
+            context.__exit__(None, None, None)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['description'],
+                         self.db.comment.description)
+        for alias, context in contexts.items():
+            self.assertEqual(len(context), 0 if alias not in
+                             ('default', self.shard) else 1, alias)
+
+    def test_lists(self):
+        for name, kwargs in (('issues-from-project', {'project_id': 1}),
+                             ('comments-from-issues-from-project',
+                              {'project_id': 1,
+                               'issue_id': self.db.issue.id})):
+            response = self.client.get(reverse_lazy(name, kwargs=kwargs),
+                                       data={'expand': 'author_user'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['results']), 1)
+            self.assertEqual(
+                response.data['results'][0]['author_user']['last_name'],
+                self.db.user.last_name)
+
+    def test_move_project(self):
+        target = next(alias for alias in settings.DATABASE_SHARD_ALIASES
+                      if alias != self.shard)
+        move_project(self.db.project, target)
+
+        self.assertEqual(Project.objects.get(id=1).shard, target)
+        self.assertFalse(Issue.objects.using(self.shard).exists())
+        self.assertFalse(Comment.objects.using(self.shard).exists())
+        response = self.client.get(
+            reverse_lazy('comment-from-issues-from-project',
+                         kwargs={'project_id': 1,
+                                 'issue_id': self.db.issue.id,
+                                 'comment_id': self.db.comment.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.client.get(
+            reverse_lazy('search-project', kwargs={'project_id': 1}),
+            data={'q': 'connecter'})
+        self.assertEqual([match['id'] for match
+                          in response.data['results']],
+                         [self.db.issue.id])
+
+    def test_rebalance(self):
+        first, second = settings.DATABASE_SHARD_ALIASES[:2]
+        sizes = {'default': {1: 5},
+                 first: {2: 10, 3: 4},
+                 second: {}}
+        moves = rebalance(sizes)
+        self.assertEqual(moves, [(1, 'default', second),
+                                 (3, first, second)])
+
+    @override_settings(DELETION_EAGER=True)
+    def test_delete_project(self):
+        response = self.client.delete(
+            reverse_lazy('projects-detail', kwargs={'pk': 1}))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Issue.objects.using(self.shard).exists())
+        self.assertFalse(Comment.objects.using(self.shard).exists())
+
+
+class TestBackgroundDeletion(SoftDeskTestCase):
+    """Class to test projects and issues hidden at once
+    and deleted in background"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.project_url = reverse_lazy('projects-detail', kwargs={'pk': 1})
+        self.issue_url = reverse_lazy('issue-from-project',
+                                      kwargs={'project_id': 1,
+                                              'issue_id': 1})
+
+    def test_project_hidden(self):
+        """a project being deleted is in no view, its rows are deleted
+        once the transaction is committed"""
+        # the worker is given the project once committed
+        with self.captureOnCommitCallbacks():
+            response = self.client.delete(self.project_url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        self.assertEqual(self.client.get(reverse_lazy('projects-list'))
+                         .json()['count'], 0)
+        self.assertEqual(self.client.get(self.project_url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.issue_url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertTrue(Project.all_objects.get(pk=1).deleting)
+        self.assertEqual(self.db.comments().count(), 1)
+
+        deletion.purge_project(Project.all_objects.get(pk=1))
+        self.assertFalse(Project.all_objects.exists())
+        self.assertFalse(Issue.all_objects.in_shard_of(self.db.project)
+                         .exists())
+        self.assertFalse(self.db.comments().exists())
+        self.assertFalse(Contributor.objects.exists())
+        # tombstones of the change feed
+        self.assertEqual(set(Change.objects.filter(action='delete')
+                                   .values_list('model', 'project_id')),
+                         {('project', 1), ('contributor', 1),
+                          ('issue', 1), ('comment', 1)})
+
+    def test_issue_hidden(self):
+        """an issue being deleted and its comments are in no view,
+        counters of its project are updated at once"""
+        response = self.client.delete(self.issue_url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        issues_url = reverse_lazy('issues-from-project',
+                                  kwargs={'project_id': 1})
+        self.assertEqual(self.client.get(issues_url).json()['results'], [])
+        comment_url = reverse_lazy('comment-from-issues-from-project',
+                                   kwargs={'project_id': 1, 'issue_id': 1,
+                                           'comment_id': self.db.comment.id})
+        self.assertEqual(self.client.get(comment_url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        search_url = reverse_lazy('search-project', kwargs={'project_id': 1})
+        self.assertEqual(self.client.get(search_url, data={'q': 'bien'})
+                         .json()['results'], [])
+        self.db.project.refresh_from_db()
+        self.assertEqual(self.db.project.todo_issue_count, 0)
+
+        # a second deletion doesn't find it
+        self.assertEqual(self.client.delete(self.issue_url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        self.assertEqual(deletion.purge_pending(), (0, 1))
+        self.assertFalse(Issue.all_objects.in_shard_of(self.db.project)
+                         .exists())
+        self.assertFalse(self.db.comments().exists())
+
+    @override_settings(DELETION_EAGER=True, DELETION_BATCH_SIZE=2)
+    def test_batches(self):
+        """children are deleted a batch at a time"""
+        for _ in range(4):
+            self.db.create_comment(self.db.issue, self.db.user)
+
+        with CaptureQueriesContext(
+                connections[self.db.project.shard]) as queries:
+            self.client.delete(self.project_url)
+        # 5 comments : 3 batches, then an empty one
+        batches = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT "restAPI_comment"."id"')
+                   and 'LIMIT 2' in query['sql']]
+        self.assertEqual(len(batches), 4)
+        self.assertFalse(Project.all_objects.exists())
+        self.assertFalse(self.db.comments().exists())
+
+    def test_side_effects_by_batch(self):
+        """children are deleted with the same queries whatever their
+        number, without moving counters of parents being deleted"""
+        def purge_queries(comments) -> int:
+            project = self.db.create_project(self.db.user)
+            issue = self.db.create_issue(project, self.db.user)
+            for _ in range(comments):
+                self.db.create_comment(issue, self.db.user)
+            # counters drifted, they are not read again
+            Issue.all_objects.in_shard_of(project).filter(pk=issue.pk) \
+                .update(comment_count=0)
+            deletion.delete_project(project)
+            with capture_queries('default', project.shard) as queries:
+                deletion.purge_project(project, batch_size=100)
+            self.assertFalse(Comment.objects.in_shard_of(project)
+                             .filter(issue=issue).exists())
+            self.assertEqual(Change.objects.filter(
+                project_id=project.pk, model='comment',
+                action='delete').count(), comments)
+            return sum(map(len, queries))
+
+        with override_settings(DELETION_EAGER=False):
+            self.assertEqual(purge_queries(2), purge_queries(20))
+
+    def test_issues_unindexed_at_once(self):
+        """search rows of the issues deleted together are removed by one
+        query"""
+        issues = [self.db.create_issue(self.db.project, self.db.user)
+                  for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            deletion.delete_issues(self.db.project, issues)
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if 'restapi_search' in query['sql']]), 1)
+        search_url = reverse_lazy('search-project', kwargs={'project_id': 1})
+        self.assertEqual([result['issue'] for result in self.client.get(
+            search_url, data={'q': 'bien'}).json()['results']],
+            [self.db.issue.id])
+
+    def test_purge_command(self):
+        """purge_deleted command deletes what is left deleting"""
+        with self.captureOnCommitCallbacks():
+            self.client.delete(self.project_url)
+
+        call_command('purge_deleted', stdout=StringIO())
+        self.assertFalse(Project.all_objects.exists())
+        self.assertFalse(Issue.all_objects.in_shard_of(self.db.project)
+                         .exists())
+
+
+class TestInstrumentation(SoftDeskTestCase):
+    """Class to test the measures of each request"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.url = reverse_lazy('issues-from-project',
+                                kwargs={'project_id': 1})
+
+    def test_server_timing(self):
+        """phases are given in Server-Timing, with the number of queries"""
+        with capture_queries('default', self.db.project.shard) as queries:
+            response = self.client.get(self.url)
+
+        metrics = {metric.split(';')[0]: metric.split(';')[1:]
+                   for metric in response['Server-Timing'].split(', ')}
+        self.assertEqual(list(metrics),
+                         ['db', 'serializer', 'render', 'total'])
+        self.assertEqual(metrics['db'][1],
+                         f'desc="{sum(map(len, queries))} queries"')
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_sampled_log(self):
+        """a sampled request is logged as JSON with its view"""
+        with self.assertLogs('softDesk.instrumentation', 'INFO') as logs:
+            self.client.get(self.url)
+            self.client.get(reverse_lazy('projects-list'))
+
+        entries = [json.loads(record.getMessage())
+                   for record in logs.records]
+        self.assertEqual([entry['view'] for entry in entries],
+                         ['IssuesFromProjectAPIView', 'ProjectViewSet.list'])
+        self.assertEqual(entries[0]['status'], status.HTTP_200_OK)
+        self.assertNotIn('duplicates', entries[0])
+
+    @override_settings(DUPLICATE_QUERY_THRESHOLD=3)
+    def test_duplicates(self):
+        """a statement run for each row (N+1) is logged as a warning"""
+        def view(request):
+            for issue in self.db.issues():
+                list(User.objects.filter(pk=issue.author_user_id))
+            return HttpResponse()
+
+        for _ in range(2):
+            self.db.create_issue(self.db.project, self.db.user)
+        middleware = instrumentation.InstrumentationMiddleware(view)
+        with self.assertLogs('softDesk.instrumentation', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+
+        duplicates = json.loads(logs.records[0].getMessage())['duplicates']
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0]['count'], 3)
+        self.assertIn('FROM "authentication_user"', duplicates[0]['sql'])
+
+
+    def test_async(self):
+        """queries of an async view are counted, without a thread held
+        for the request"""
+        async def view(request):
+            await Issue.objects.acount()
+            return HttpResponse()
+
+        middleware = instrumentation.InstrumentationMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+class TestProfiling(SoftDeskTestCase):
+    """Class to test profiles of slow or asked requests"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(PROFILE_DIRECTORY=directory.name,
+                                          PROFILE_TOKEN='secret')
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.url = reverse_lazy('comment-from-issues-from-project',
+                                kwargs={'project_id': 1, 'issue_id': 1,
+                                        'comment_id': self.db.comment.id})
+
+    def test_asked(self):
+        """a request with the token in its header is profiled"""
+        self.client.get(self.url, HTTP_X_PROFILE='wrong')
+        self.assertEqual(profiling.load_profiles(), [])
+
+        self.client.get(self.url, HTTP_X_PROFILE='secret')
+        profiles = profiling.load_profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['view'],
+                         'ManageCommentsFromIssueFromProjectAPIView')
+        self.assertEqual(profiles[0]['kind'], 'cprofile')
+        self.assertTrue(any('(get)' in name and 'views.py' in name
+                            for name in profiles[0]['functions']))
+
+    @override_settings(PROFILE_SLOW_REQUEST_MS=20,
+                       PROFILE_SAMPLE_INTERVAL=0.001)
+    def test_slow_request(self):
+        """only samples of requests over the threshold are kept"""
+        def slow_view(request):
+            time.sleep(0.05)
+            return HttpResponse()
+
+        middleware = profiling.ProfilingMiddleware(lambda request:
+                                                   HttpResponse())
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(profiling.load_profiles(), [])
+
+        middleware = profiling.ProfilingMiddleware(slow_view)
+        middleware(RequestFactory().get('/'))
+        profile, = profiling.load_profiles()
+        self.assertEqual(profile['kind'], 'sampling')
+        name, = [name for name in profile['functions']
+                 if name.endswith('(slow_view)')]
+        # sleeping in the view itself
+        self.assertGreater(profile['functions'][name][0], 0.02)
+
+    @override_settings(PROFILE_KEEP=2)
+    def test_rotation(self):
+        """only the newest profiles are kept"""
+        for _ in range(3):
+            self.client.get(self.url, HTTP_X_PROFILE='secret')
+        self.client.get(reverse_lazy('projects-list'),
+                        HTTP_X_PROFILE='secret')
+        self.assertEqual([profile['view']
+                          for profile in profiling.load_profiles()],
+                         ['ManageCommentsFromIssueFromProjectAPIView',
+                          'ProjectViewSet.list'])
+
+    def test_command(self):
+        """profiles command lists profiles of a view and their functions"""
+        self.client.get(self.url, HTTP_X_PROFILE='secret')
+        self.client.get(reverse_lazy('projects-list'),
+                        HTTP_X_PROFILE='secret')
+
+        output = StringIO()
+        call_command('profiles', view='ProjectViewSet', sort='cumulative',
+                     top=100, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len([line for line in lines
+                              if line.endswith(' ms')]), 1)
+        self.assertIn('GET /projects/ 200', lines[0])
+        self.assertTrue(any('(list)' in line for line in lines))
+
+
+class TestResponseCache(SoftDeskTestCase):
+    """Class to test the cache of list pages"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.db.project.add_contributor(self.db.user2)
+        self.url = reverse_lazy('issues-from-project',
+                                kwargs={'project_id': 1})
+
+    def get(self, url, user=None, **kwargs):
+        self.client.force_authenticate(user=user or self.db.user)
+        return self.client.get(url, **kwargs)
+
+    def test_shared(self):
+        """a page is computed once for all contributors, and only them"""
+        first = self.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+
+        second = self.get(self.url, self.db.user2)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+        stranger = User.objects.create_user(email='stranger@gmail.com',
+                                            password='test')
+        self.assertEqual(self.get(self.url, stranger).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_variants(self):
+        """query string and media type give other pages"""
+        self.get(self.url)
+        self.assertEqual(self.get(self.url, data={'fields': 'id'})
+                         ['X-Cache'], 'MISS')
+        self.assertEqual(self.get(self.url, data={'fields': 'id'})
+                         .json()['results'], [{'id': 1}])
+        if msgpack is not None:
+            self.assertEqual(self.get(self.url,
+                                      HTTP_ACCEPT='application/msgpack')
+                             ['X-Cache'], 'MISS')
+
+    def test_invalidation(self):
+        """any write of the project gives new pages"""
+        comments_url = reverse_lazy('comments-from-issues-from-project',
+                                    kwargs={'project_id': 1, 'issue_id': 1})
+        writes = [
+            lambda: self.client.post(comments_url,
+                                     data=self.db.comment_to_create),
+            lambda: self.db.project.add_contributor(
+                User.objects.create_user(email='new@gmail.com',
+                                         password='test')),
+            lambda: self.client.post(
+                reverse_lazy('bulk-issues-from-project',
+                             kwargs={'project_id': 1}),
+                data=[self.db.issue_to_create], format='json'),
+            lambda: self.client.delete(
+                reverse_lazy('issue-from-project',
+                             kwargs={'project_id': 1, 'issue_id': 1})),
+        ]
+        for write in writes:
+            self.get(self.url)
+            self.assertEqual(self.get(self.url)['X-Cache'], 'HIT')
+            write()
+            self.assertEqual(self.get(self.url)['X-Cache'], 'MISS')
+
+        # other projects are still cached
+        other = self.db.create_project(self.db.user)
+        other_url = reverse_lazy('issues-from-project',
+                                 kwargs={'project_id': other.id})
+        self.get(other_url)
+        self.db.create_issue(self.db.project, self.db.user)
+        self.assertEqual(self.get(other_url)['X-Cache'], 'HIT')
+
+    def test_version_in_database(self):
+        """the version is read from the project, a write of another
+        process gives new pages"""
+        self.get(self.url)
+        self.assertEqual(self.get(self.url)['X-Cache'], 'HIT')
+        Project.objects.filter(pk=1).update(version=F('version') + 1)
+        self.assertEqual(self.get(self.url)['X-Cache'], 'MISS')
+
+    def test_expand(self):
+        """pages with expanded users are not cached,
+        a user is written without a new version of their projects"""
+        expand = {'expand': 'author_user'}
+        self.get(self.url, data=expand)
+        self.assertNotIn('X-Cache', self.get(self.url, data=expand))
+
+        self.db.user.first_name = 'Emma'
+        self.db.user.save()
+        author = self.get(self.url, data=expand).json()['results'][0] \
+            ['author_user']
+        self.assertEqual(author['first_name'], 'Emma')
+
+    def test_browsable_api(self):
+        """pages of the browsable API show the user, they are not cached"""
+        self.get(self.url, HTTP_ACCEPT='text/html')
+        response = self.get(self.url, self.db.user2, HTTP_ACCEPT='text/html')
+        self.assertNotIn('X-Cache', response)
+        self.assertContains(response, str(self.db.user2))
+        self.assertNotContains(response, str(self.db.user))
+
+        url = reverse_lazy('projects-list')
+        self.get(url, HTTP_ACCEPT='text/html')
+        self.assertNotIn('X-Cache', self.get(url, HTTP_ACCEPT='text/html'))
+
+    def test_not_modified(self):
+        """a cached page gives a 304 to a client having it"""
+        etag = self.get(self.url)['ETag']
+        response = self.get(self.url, self.db.user2, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_projects(self):
+        """projects of a user are cached until one of them changes"""
+        url = reverse_lazy('projects-list')
+        self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+        # user2 has the same projects, not the same list
+        self.assertEqual(self.get(url, self.db.user2)['X-Cache'], 'MISS')
+
+        self.db.create_issue(self.db.project, self.db.user)
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['todo_issue_count'],
+                         2)
+
+        self.db.create_project(self.db.user)
+        self.assertEqual(self.get(url).json()['count'], 2)
+
+    def test_statistics(self):
+        """hits and misses are given to staff users"""
+        url = reverse_lazy('response-cache-stats')
+        before = response_cache.statistics()
+        self.get(self.url)
+        self.get(self.url)
+
+        self.assertEqual(self.get(url).status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.db.user.is_staff = True
+        self.db.user.save()
+        statistics = self.get(url).json()
+        self.assertEqual(statistics['hits'] - before['hits'], 1)
+        self.assertEqual(statistics['misses'] - before['misses'], 1)
+
+
+class TestRelatedLoading(SoftDeskTestCase):
+    """Class to test that views and admin lists read related data in the
+    same number of queries whatever the number of rows"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.admin = User.objects.create_superuser(email='admin@gmail.com',
+                                                   password='test')
+
+    def add_rows(self):
+        """a contributor, a project, an issue and a comment more"""
+        user = User.objects.create_user(
+            email=f'user{User.objects.count()}@gmail.com', password='test')
+        self.db.project.add_contributor(user)
+        self.db.create_project(self.db.user)
+        self.db.create_issue(self.db.project, user)
+        self.db.create_comment(self.db.issue, user)
+
+    def assertConstantQueries(self, urls, login=None):
+        """urls need the same number of queries with more rows"""
+        def count_queries():
+            counts = {}
+            for url in urls:
+                if login is None:
+                    self.client.force_authenticate(user=self.db.user)
+                else:
+                    self.client.force_login(login)
+                # the role is read with the chain
+                membership.get_cache().clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK,
+                                 url)
+                counts[url] = len(queries)
+            return counts
+
+        before = count_queries()
+        for _ in range(3):
+            self.add_rows()
+        self.assertEqual(count_queries(), before)
+
+    def test_views(self):
+        """lists and details, with their expanded relations"""
+        issues_url = reverse_lazy('issues-from-project',
+                                  kwargs={'project_id': 1})
+        comments_url = reverse_lazy('comments-from-issues-from-project',
+                                    kwargs={'project_id': 1, 'issue_id': 1})
+        self.assertConstantQueries([
+            reverse_lazy('projects-list'),
+            f"{reverse_lazy('projects-detail', kwargs={'pk': 1})}"
+            f"?expand=issues,contributors",
+            reverse_lazy('users-from-project', kwargs={'project_id': 1}),
+            issues_url,
+            f'{issues_url}?expand=author_user,assignee_user,project',
+            comments_url,
+            f'{comments_url}?expand=author_user,issue',
+        ])
+
+    def test_change_feed(self):
+        """objects of the change feed are read with their expanded
+        relations in one query by model"""
+        url = reverse_lazy('changes-from-project', kwargs={'project_id': 1})
+        cursor = self.client.get(url).json()['cursor']
+        # a change of each model
+        self.add_rows()
+        self.assertConstantQueries([
+            f'{url}?since={cursor}&expand=author_user,user,issue'])
+
+    def test_admin(self):
+        """relations shown in admin lists are joined"""
+        self.assertConstantQueries(['/admin/restAPI/project/',
+                                    '/admin/restAPI/contributor/',
+                                    '/admin/restAPI/issue/',
+                                    '/admin/restAPI/comment/',
+                                    '/admin/authentication/user/'],
+                                   login=self.admin)
+
+
+class TestContributorWrites(SoftDeskTestCase):
+    """Class to test adding and removing contributors with one statement,
+    one by one or in batch"""
+
+    def setUp(self):
+        self.db = InitializeServer(self.client)
+        self.url = reverse_lazy('bulk-users-from-project',
+                                kwargs={'project_id': 1})
+
+    def create_users(self, number) -> list:
+        return [User.objects.create_user(email=f'user{index}@gmail.com',
+                                         password='test')
+                for index in range(number)]
+
+    def test_single_statement(self):
+        """a contributor is added or removed by one statement,
+        a second time changes nothing"""
+        def contributor_queries(write):
+            with CaptureQueriesContext(connection) as queries:
+                result = write()
+            return result, [query['sql'] for query in queries
+                            if 'restAPI_contributor' in query['sql']
+                            and 'restAPI_change' not in query['sql']]
+
+        for write, expected in ((self.db.project.add_contributor, True),
+                                (self.db.project.add_contributor, False),
+                                (self.db.project.delete_contributor, True),
+                                (self.db.project.delete_contributor,
+                                 False)):
+            result, queries = contributor_queries(
+                lambda: write(self.db.user2))
+            self.assertEqual(result, expected)
+            self.assertEqual(len(queries), 1)
+
+    def test_bulk_add(self):
+        """users are added at once, those already contributors are
+        left as they are"""
+        users = self.create_users(3)
+        issues_url = reverse_lazy('issues-from-project',
+                                  kwargs={'project_id': 1})
+        self.client.force_authenticate(user=users[0])
+        self.assertEqual(self.client.get(issues_url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.db.user)
+        cursor = self.client.get(reverse_lazy('changes-from-project',
+                                              kwargs={'project_id': 1})) \
+            .json()['cursor']
+        ids = [self.db.user.id, *(user.id for user in users)]
+
+        response = self.client.post(self.url, data=ids, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.json()['added']), ids[1:])
+        self.assertEqual(
+            Contributor.objects.get(project=1, user=self.db.user).role,
+            Contributor.Role.author)
+
+        # their membership and the change feed are up to date
+        self.client.force_authenticate(user=users[0])
+        self.assertEqual(self.client.get(issues_url).status_code,
+                         status.HTTP_200_OK)
+        response = self.client.get(reverse_lazy('changes-from-project',
+                                                kwargs={'project_id': 1}),
+                                   data={'since': cursor})
+        self.assertEqual(
+            sorted(change['data']['user']
+                   for change in response.json()['changes']
+                   if change['type'] == 'contributor'), ids[1:])
+
+        response = self.client.post(self.url, data=ids, format='json')
+        self.assertEqual(response.json()['added'], [])
+
+    def test_bulk_errors(self):
+        """nothing is written if a user is not found"""
+        user, = self.create_users(1)
+        response = self.client.post(self.url, data=[user.id, 999],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(),
+                         [{}, {'id': ['User not found']}])
+        self.assertFalse(Contributor.objects.filter(user=user).exists())
+
+        for data in ({'user_id': user.id}, ['a'], [True], [1] * 1001):
+            response = self.client.delete(self.url, data=data,
+                                          format='json')
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_remove(self):
+        """users are removed at once, with the same number of queries
+        whatever their number"""
+        def remove(users):
+            self.db.project.add_contributors(users)
+            # the role of the author is read with the chain again
+            membership.get_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.delete(
+                    self.url, data=[user.id for user in users],
+                    format='json')
+            self.assertEqual(sorted(response.json()['removed']),
+                             [user.id for user in users])
+            return len(queries)
+
+        users = self.create_users(10)
+        self.assertEqual(remove(users[:2]), remove(users))
+        self.assertEqual(self.db.project.contributors.count(), 1)
+
+        # removed users lose their access, even once known
+        issues_url = reverse_lazy('issues-from-project',
+                                  kwargs={'project_id': 1})
+        self.db.project.add_contributors(users)
+        self.client.force_authenticate(user=users[0])
+        self.assertEqual(self.client.get(issues_url).status_code,
+                         status.HTTP_200_OK)
+        self.db.project.remove_contributors(users)
+        self.assertEqual(self.client.get(issues_url).status_code,
+                         status.HTTP_404_NOT_FOUND)
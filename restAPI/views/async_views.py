@@ -0,0 +1,151 @@
+"""Async variants of the GET views of the nested project urls,
+served under async/ : under ASGI they run on the event loop, so a slow
+client doesn't hold a worker thread while its response is sent.
+DRF views are sync only, these ones are Django views reusing
+the authentication, the chain checks, the serializers and the pagination
+of GenericAPIViewForSoftDesk family"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.serializers import ModelSerializer
+from rest_framework.settings import api_settings
+
+from authentication.models import User
+from authentication.serializers import UserSerializer
+from restAPI import sharding
+from restAPI.models import Issue, Comment
+from restAPI.pagination import KeysetPagination
+from restAPI.renderers import FastJSONRenderer
+from restAPI.serializers import IssueSerializer, CommentSerializer
+from softDesk import routers
+from .generics_views import GenericAPIViewForSoftDesk
+
+
+class AsyncGenericViewForSoftDesk(View):
+    """Async counterpart of GenericAPIViewForSoftDesk :
+    authenticate the request and load the project -> issue -> comment
+    chain given in the url with an async query"""
+    serializer: ModelSerializer = None
+    renderer_class = FastJSONRenderer
+    project = None
+    issue = None
+    comment = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        """errors are given as DRF would, in JSON"""
+        self.request = Request(
+            request,
+            authenticators=[authentication() for authentication
+                            in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        self.request.accepted_renderer = self.renderer_class()
+        self.request.accepted_media_type = self.renderer_class.media_type
+        try:
+            # authenticators may read the database
+            user = await sync_to_async(lambda: self.request.user)()
+            if not user.is_authenticated:
+                raise exceptions.NotAuthenticated()
+            routers.pin_for(self.request)
+            await self.resolve_objects(user, **kwargs)
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.render({'detail': exc.detail}, exc.status_code)
+        except Http404:
+            return self.render({'detail': 'Not found.'},
+                               status.HTTP_404_NOT_FOUND)
+
+    async def resolve_objects(self, user, project_id=None, issue_id=None,
+                              comment_id=None, **kwargs):
+        """GenericAPIViewForSoftDesk.resolve_objects with async query,
+        raise Http404 if any link of the chain doesn't match"""
+        sharded = sharding.is_enabled()
+        # with shards, the project then its issue and comment in its shard
+        queryset, project_ref = GenericAPIViewForSoftDesk.chain_query(
+            project_id, *(() if sharded else (issue_id, comment_id)))
+        queryset, entry = GenericAPIViewForSoftDesk.membership_query(
+            queryset, user, project_id, project_ref)
+        try:
+            element = await queryset.aget()
+            # the role is read again if the project has changed
+            await sync_to_async(GenericAPIViewForSoftDesk.check_membership)(
+                element, user, entry)
+            project = None
+            if sharded:
+                project = element
+                if issue_id is not None:
+                    element = await GenericAPIViewForSoftDesk \
+                        .shard_chain_query(project, issue_id, comment_id) \
+                        .aget()
+        except ObjectDoesNotExist:
+            raise Http404
+        self.project, self.issue, self.comment = \
+            GenericAPIViewForSoftDesk.split_chain(element, project)
+
+    def render(self, data, status_code=status.HTTP_200_OK) -> HttpResponse:
+        renderer = self.request.accepted_renderer
+        return HttpResponse(renderer.render(data),
+                            status=status_code,
+                            content_type=renderer.media_type)
+
+
+class AsyncAccessGenericViewForSoftDesk(AsyncGenericViewForSoftDesk):
+    """Async counterpart of AccessGenericAPIViewForSoftDesk GET"""
+    model_class = None
+    pagination_class = KeysetPagination
+    ordering = ('created_time', 'id')
+
+    def get_queryset(self):
+        return self.model_class.objects.filter(project=self.project.id)
+
+    async def get(self, *args, **kwargs):
+        """give a paginated list of instances from get_queryset,
+        rows are read with async iteration"""
+        queryset = self.serializer.optimize_queryset(self.get_queryset(),
+                                                     self.request,
+                                                     keep=self.ordering)
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(queryset, self.request,
+                                                  view=self)
+        # every field read is loaded, serializing doesn't query
+        serializer = self.serializer(page, many=True,
+                                     context={'request': self.request})
+        return self.render(paginator.get_paginated_data(serializer.data))
+
+
+class AsyncUsersFromProjectView(AsyncAccessGenericViewForSoftDesk):
+    serializer = UserSerializer
+    model_class = User
+    ordering = ('id',)
+
+
+class AsyncIssuesFromProjectView(AsyncAccessGenericViewForSoftDesk):
+    serializer = IssueSerializer
+    model_class = Issue
+
+    def get_queryset(self):
+        return self.model_class.objects.in_shard_of(self.project) \
+            .filter(project=self.project.id)
+
+
+class AsyncCommentsFromIssueFromProjectView(
+                                    AsyncAccessGenericViewForSoftDesk):
+    serializer = CommentSerializer
+    model_class = Comment
+
+    def get_queryset(self):
+        return self.model_class.objects.in_shard_of(self.project) \
+            .filter(issue=self.issue.id)
+
+
+class AsyncCommentFromIssueFromProjectView(AsyncGenericViewForSoftDesk):
+    serializer = CommentSerializer
+
+    async def get(self, *args, **kwargs):
+        """relations expanded may not be loaded with the chain
+        (from another database with shards), they are read
+        while serializing"""
+        serializer = self.serializer(self.comment,
+                                     context={'request': self.request})
+        return self.render(await sync_to_async(lambda: serializer.data)())
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import OuterRef, Subquery
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 
@@ -6,7 +8,11 @@ from rest_framework.serializers import ModelSerializer
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
-from restAPI.models import Project, Issue, Comment
+from restAPI import conditional, deletion, membership, response_cache, \
+    sharding
+from softDesk import routers
+from restAPI.models import Project, Issue, Comment, Contributor
+from restAPI.pagination import KeysetPagination
 
 from authentication.models import User
 
@@ -22,44 +28,188 @@ class GenericAPIViewForSoftDesk(APIView):
     comment: Comment = None
     user_to_add_or_delete: User = None
 
-    def dispatch(self, request, *args, **kwargs):
-        """Method to collect generics data and return ERROR 404
-        if data slug are not correct"""
-        project_id = kwargs.get('project_id', None)
-        issue_id = kwargs.get('issue_id', None)
-        comment_id = kwargs.get('comment_id', None)
-        user_id = kwargs.get('user_id', None)
+    def initial(self, request, *args, **kwargs):
+        """Once the request is authenticated, collect generics data
+        and return ERROR 404 if data slug are not correct"""
+        super().initial(request, *args, **kwargs)
+        # a user who has just written reads their writes from the primary
+        routers.pin_for(request)
+        self.resolve_objects(request.user, **kwargs)
 
-        req = self.initialize_request(request, *args, **kwargs)
+    def resolve_objects(self, user, project_id=None, issue_id=None,
+                        comment_id=None, user_id=None, **kwargs):
+        """Load the project -> issue -> comment chain given in the url
+        with a single joined query, which also checks that user
+        is a contributor of the project (unless it is already known
+        from membership cache).
+        Raise Http404 if any link of the chain doesn't match"""
+        if sharding.is_enabled():
+            # the project then its issue and comment in its shard,
+            # never a join across databases
+            queryset, project_ref = self.chain_query(project_id)
+            project = self.get_chain_element(queryset, user, project_id,
+                                              project_ref)
+            element = project if issue_id is None else get_object_or_404(
+                self.shard_chain_query(project, issue_id, comment_id))
+            self.project, self.issue, self.comment = self.split_chain(
+                element, project)
+        else:
+            queryset, project_ref = self.chain_query(project_id, issue_id,
+                                                     comment_id)
+            self.project, self.issue, self.comment = self.split_chain(
+                self.get_chain_element(queryset, user, project_id,
+                                       project_ref))
 
-        # project must have been given, request.user must be a contributor
-        self.project = get_object_or_404(Project,
-                                         id=project_id,
-                                         contributors=req.user,
-                                         )
+        # user is not part of the chain, it can be any registered user
+        self.user_to_add_or_delete = None
+        if user_id is not None:
+            self.user_to_add_or_delete = get_object_or_404(User, id=user_id)
 
-        # other data are optional
-        if issue_id is not None:
-            self.issue = get_object_or_404(Issue, id=issue_id)
+    @staticmethod
+    def chain_query(project_id=None, issue_id=None, comment_id=None):
+        """return the queryset of the deepest element of the chain,
+        with its parents loaded by select_related,
+        and the path from this element to its project"""
+        if comment_id is not None:
+            return (Comment.objects.select_related('author_user',
+                                                   'issue__author_user',
+                                                   'issue__project')
+                                   .filter(id=comment_id,
+                                           issue_id=issue_id,
+                                           issue__project_id=project_id,
+                                           issue__deleting=False,
+                                           issue__project__deleting=False),
+                    'issue__project')
+        elif issue_id is not None:
+            return (Issue.objects.select_related('author_user', 'project')
+                                 .filter(id=issue_id,
+                                         project_id=project_id,
+                                         project__deleting=False),
+                    'project')
+        else:
+            # project must have been given
+            return Project.objects.filter(id=project_id), 'pk'
 
+    @staticmethod
+    def shard_chain_query(project, issue_id, comment_id=None):
+        """return the queryset of the deepest element of the chain under
+        project, read from the shard of project"""
         if comment_id is not None:
-            self.comment = get_object_or_404(Comment, id=comment_id)
+            return (Comment.objects.in_shard_of(project)
+                                   .select_related('issue')
+                                   .filter(id=comment_id,
+                                           issue_id=issue_id,
+                                           issue__project_id=project.id,
+                                           issue__deleting=False))
+        return Issue.objects.in_shard_of(project).filter(id=issue_id,
+                                                         project_id=project.id)
 
-        if user_id is not None:
-            self.user_to_add_or_delete = get_object_or_404(User, id=user_id)
+    @staticmethod
+    def split_chain(element, project=None):
+        """return (project, issue, comment) from the deepest element,
+        project is given when it has been read apart"""
+        comment = issue = None
+        if isinstance(element, Comment):
+            comment = element
+            element = element.issue
+        if isinstance(element, Issue):
+            issue = element
+            if project is not None:
+                issue.project = project
+            element = issue.project
+        return element, issue, comment
 
-        return super().dispatch(request, *args, **kwargs)
+    @classmethod
+    def get_chain_element(cls, queryset, user, project_id, project_ref):
+        """Return the only element of queryset if user is a contributor of
+        its project (reached with project_ref), else raise Http404.
+        The role of user is read from membership cache, on cache miss it
+        is fetched by the same query and cached"""
+        queryset, entry = cls.membership_query(queryset, user, project_id,
+                                               project_ref)
+        return cls.check_membership(get_object_or_404(queryset), user,
+                                    entry)
+
+    @staticmethod
+    def membership_query(queryset, user, project_id, project_ref):
+        """return queryset, annotated with the role of user if it is not
+        in membership cache, and the cached entry"""
+        entry = membership.get_entry(user.pk, project_id)
+        if entry is None:
+            queryset = queryset.annotate(member_role=Subquery(
+                Contributor.objects.filter(project=OuterRef(project_ref),
+                                           user=user)
+                                   .values('role')[:1]))
+        return queryset, entry
+
+    @classmethod
+    def check_membership(cls, element, user, entry):
+        """cache the role fetched with element if it was not cached,
+        return element or raise Http404 if user is not a contributor.
+        A cached role is checked against the project read with element,
+        it is read again if the project has changed since"""
+        project = cls.split_chain(element)[0]
+        if entry is None:
+            role = element.member_role
+            # a replica may lag, only the primary database is cached
+            if element._state.db == DEFAULT_DB_ALIAS:
+                membership.set_role(user.pk, project, role)
+        else:
+            role = membership.role_of(entry, project)
+            if role is None:
+                role = membership.get_role(user.pk, project)
+        if not role:
+            raise Http404
+        return element
 
 
 class AccessGenericAPIViewForSoftDesk(GenericAPIViewForSoftDesk):
     """This class implements generics GET and POST methods"""
+    pagination_class = KeysetPagination
+    ordering = ('created_time', 'id')
+    # model_class has an updated_time to compute the ETag
+    conditional = True
+    # pages are cached for every contributor (needs conditional),
+    # see restAPI/response_cache.py
+    cached = False
 
-    def get(self, *args, **kwargs):
-        """give a list of instances from a class linked to a project
+    def get_queryset(self):
+        """give the instances from a class linked to a project
         can be Users, Issues..."""
-        queryset = self.model_class.objects.filter(project=self.project.id)
-        serializer = self.serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.model_class.objects.filter(project=self.project.id)
+
+    def get(self, *args, **kwargs):
+        """give a paginated list of instances from get_queryset,
+        or HTTP_304_NOT_MODIFIED if the client version is still valid"""
+        key = None
+        if self.cached and response_cache.is_cacheable(self.request):
+            key = response_cache.page_key(self.request, self.project.version)
+            if response := response_cache.get_response(self.request, key):
+                return response
+
+        validators = None
+        if self.conditional:
+            validators = conditional.collection_validators(
+                self.request, self.get_queryset())
+            if response := conditional.not_modified(self.request,
+                                                    *validators):
+                return response
+
+        # only what ?fields= and ?expand= need is read
+        queryset = self.serializer.optimize_queryset(self.get_queryset(),
+                                                     self.request,
+                                                     keep=self.ordering)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = self.serializer(page, many=True,
+                                     context={'request': self.request})
+        response = paginator.get_paginated_response(serializer.data)
+
+        if validators:
+            conditional.set_validators(response, *validators)
+        if key is not None:
+            response_cache.store_on_render(response, key, *validators)
+        return response
 
     def post(self, *args, **kwargs):
         """with a POST request, add a issue/comment in a project
@@ -67,7 +217,8 @@ class AccessGenericAPIViewForSoftDesk(GenericAPIViewForSoftDesk):
         HTTP_200_OK : Object added
         HTTP_400_BAD_REQUEST : project_id or user_id are missing"""
         serializer = self.serializer(data=self.request.data,
-                                     context={'user': self.request.user,
+                                     context={'request': self.request,
+                                              'user': self.request.user,
                                               'issue': self.issue,
                                               'project': self.project},
                                      partial=True)
@@ -84,9 +235,11 @@ class ManagingGenericAPIViewForSoftDesk(GenericAPIViewForSoftDesk):
     """This class implements generics DELETE and PUT method"""
 
     def delete(self, *args, **kwargs):
-        """with a delete, remove the last element of the tree
+        """with a delete, remove the last element of the tree,
+        an issue is hidden at once and deleted in background
         Response can be :
-        HTTP_200_OK : deletion done
+        HTTP_204_NO_CONTENT : deletion done
+        HTTP_202_ACCEPTED : issue is being deleted
         HTTP_304_NOT_MODIFIED : user was not a contributor
         """
         element_to_delete = None
@@ -98,6 +251,10 @@ class ManagingGenericAPIViewForSoftDesk(GenericAPIViewForSoftDesk):
                 return Response(f"You are not the Author of this element, "
                                 f"you can't delete it.",
                                 status=status.HTTP_403_FORBIDDEN)
+            elif element_to_delete is self.issue:
+                deletion.delete_issues(self.project, [self.issue])
+                return Response(f'{self.issue} is being deleted',
+                                status=status.HTTP_202_ACCEPTED)
             else:
                 element_to_delete.delete()
 
@@ -127,7 +284,8 @@ class ManagingGenericAPIViewForSoftDesk(GenericAPIViewForSoftDesk):
 
         serializer = self.serializer(instance=element_to_modify,
                                      data=self.request.data,
-                                     partial=True)
+                                     partial=True,
+                                     context={'request': self.request})
 
         if serializer.is_valid():
             serializer.save()
@@ -1,24 +1,53 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status, permissions
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
+from restAPI.pagination import KeysetPagination
 from restAPI.permissions import IsOwnerOrReadOnly
+from restAPI.renderers import NDJSONRenderer, CSVRenderer
 from authentication.models import User
 from authentication.serializers import UserSerializer
-from restAPI.models import Project, Issue, Comment
+from restAPI.export import export_project, EXPORT_COLUMNS
+from restAPI import changes, conditional, deletion, response_cache, \
+    search, sharding
+from restAPI.models import Project, Contributor, Issue, Comment, Change
+from softDesk import routers
 from restAPI.serializers import ProjectListSerializer, \
     ProjectDetailSerializer, IssueSerializer, \
-    CommentSerializer
+    CommentSerializer, ProjectChangeSerializer, ContributorSerializer
 from .generics_views import ManagingGenericAPIViewForSoftDesk, \
-    AccessGenericAPIViewForSoftDesk
+    AccessGenericAPIViewForSoftDesk, GenericAPIViewForSoftDesk
+
+
+def is_id(value) -> bool:
+    """a primary key given in a request body, JSON true and false
+    are ints for Python but not ids"""
+    return isinstance(value, int) and not isinstance(value, bool)
 
 
 class ProjectViewSet(ModelViewSet):
     serializer_class = ProjectDetailSerializer
     list_serializer_class = ProjectListSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    ordering = ('id',)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # a user who has just written reads their writes from the primary
+        routers.pin_for(request)
+
+    @property
+    def paginator(self):
+        """keyset pagination if a cursor is given (an empty one gives
+        the first page), else the default limit/offset pagination"""
+        if KeysetPagination.cursor_query_param in self.request.query_params:
+            self.pagination_class = KeysetPagination
+        return super().paginator
 
     def get_queryset(self):
         queryset = Project.objects.all()
@@ -26,7 +55,10 @@ class ProjectViewSet(ModelViewSet):
 
         queryset = queryset.filter(contributors=user)
 
-        return queryset
+        # only what ?fields= and ?expand= need is read, updated_time
+        # gives the validators of the detail
+        return self.get_serializer_class().optimize_queryset(
+            queryset, self.request, keep=(*self.ordering, 'updated_time'))
 
     def get_serializer_class(self):
         # return list serializer if list asked
@@ -35,11 +67,60 @@ class ProjectViewSet(ModelViewSet):
         else:
             return super().get_serializer_class()
 
+    def list(self, request, *args, **kwargs):
+        """list of projects, from the cache while none of them changes,
+        or HTTP_304_NOT_MODIFIED if the client version is still valid"""
+        key = None
+        if response_cache.is_cacheable(request):
+            versions = response_cache.get_versions(
+                Contributor.objects.filter(user=request.user)
+                                   .values('project_id'))
+            key = response_cache.page_key(request, request.user.pk,
+                                          *sorted(versions.items()))
+            if response := response_cache.get_response(request, key):
+                return response
+
+        # list depends on request.user
+        validators = conditional.collection_validators(
+            request, self.get_queryset(), request.user.pk)
+        if response := conditional.not_modified(request, *validators):
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        conditional.set_validators(response, *validators)
+        if key is not None:
+            response_cache.store_on_render(response, key, *validators)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        """detail of a project, or HTTP_304_NOT_MODIFIED
+        if the client version is still valid"""
+        instance = self.get_object()
+        validators = conditional.make_validators(request,
+                                                 instance.updated_time)
+        if response := conditional.not_modified(request, *validators):
+            return response
+
+        serializer = self.get_serializer(instance)
+        return conditional.set_validators(Response(serializer.data),
+                                          *validators)
+
+    def destroy(self, request, *args, **kwargs):
+        """the project is hidden at once, its issues, comments and
+        contributors are deleted in background
+        Response : HTTP_202_ACCEPTED"""
+        instance = self.get_object()
+        deletion.delete_project(instance)
+        return Response(f'{instance} is being deleted',
+                        status=status.HTTP_202_ACCEPTED)
+
 
 class UsersFromProjectAPIView(AccessGenericAPIViewForSoftDesk):
     """This class gives actions POST and GET on '/projects/{id}/users urls"""
     serializer = UserSerializer
     model_class = User
+    ordering = ('id',)
+    conditional = False
 
     def post(self, *args, **kwargs):
         """with a post, add a user in a project
@@ -69,6 +150,55 @@ class UsersFromProjectAPIView(AccessGenericAPIViewForSoftDesk):
                             status=status.HTTP_304_NOT_MODIFIED)
 
 
+class BulkUsersFromProjectAPIView(GenericAPIViewForSoftDesk):
+    """GenericAPIViewForSoftDesk class adding (POST) or removing (DELETE)
+    a list of users, given by their ids, to a project with one statement.
+    Users already in the project (or not in it) are left unchanged"""
+    max_items = 1000
+
+    def get_items(self):
+        """return the list of ids given in request body
+        or raise a 400 error"""
+        items = self.request.data
+        if not isinstance(items, list):
+            raise ValidationError('A list is expected')
+        if len(items) > self.max_items:
+            raise ValidationError(f'{self.max_items} items at most '
+                                  f'can be given')
+        if not all(is_id(item) for item in items):
+            raise ValidationError('A list of user ids is expected')
+        return items
+
+    def post(self, *args, **kwargs):
+        """with a POST of a list of user ids, add them to the project
+        Response can be :
+        HTTP_200_OK : ids of the users added
+        HTTP_400_BAD_REQUEST : errors of each item"""
+        user_ids = self.get_items()
+        users = set(User.objects.filter(pk__in=user_ids)
+                                .values_list('pk', flat=True))
+        errors = [{} if user_id in users else {'id': ['User not found']}
+                  for user_id in user_ids]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        added = self.project.add_contributors(user_ids)
+        return Response({'added': [contributor.user_id
+                                   for contributor in added]},
+                        status=status.HTTP_200_OK)
+
+    def delete(self, *args, **kwargs):
+        """with a DELETE of a list of user ids, remove them
+        from the project
+        Response can be :
+        HTTP_200_OK : ids of the users removed
+        HTTP_400_BAD_REQUEST : a list of ids is expected"""
+        removed = self.project.remove_contributors(self.get_items())
+        return Response({'removed': [contributor.user_id
+                                     for contributor in removed]},
+                        status=status.HTTP_200_OK)
+
+
 class ManageUserFromProjectAPIView(ManagingGenericAPIViewForSoftDesk):
     """a class to delete a user with project-id and user-id in the slug"""
 
@@ -93,6 +223,12 @@ class IssuesFromProjectAPIView(AccessGenericAPIViewForSoftDesk):
     or adding a Issue to a Project with POST"""
     serializer = IssueSerializer
     model_class = Issue
+    cached = True
+
+    def get_queryset(self):
+        """give the issues of the project, from its shard"""
+        return self.model_class.objects.in_shard_of(self.project) \
+            .filter(project=self.project.id)
 
 
 class ManageIssuesFromProjectAPIView(ManagingGenericAPIViewForSoftDesk):
@@ -100,16 +236,121 @@ class ManageIssuesFromProjectAPIView(ManagingGenericAPIViewForSoftDesk):
     model_class = Issue
 
 
+class BulkIssuesFromProjectAPIView(GenericAPIViewForSoftDesk):
+    """GenericAPIViewForSoftDesk class creating (POST), modifying (PATCH)
+    or deleting (DELETE) a list of issues of a project in one transaction.
+    Nothing is written if one item is not correct, errors are then
+    given for each item, in the order of the request"""
+    serializer = IssueSerializer
+    model_class = Issue
+    max_items = 1000
+
+    def get_items(self):
+        """return the list given in request body or raise a 400 error"""
+        items = self.request.data
+        if not isinstance(items, list):
+            raise ValidationError('A list is expected')
+        if len(items) > self.max_items:
+            raise ValidationError(f'{self.max_items} items at most '
+                                  f'can be given')
+        return items
+
+    def get_own_issues(self, ids):
+        """return issues of the project given by ids, in the same order,
+        and errors for those not found, given twice or not authored by
+        request.user"""
+        issues = Issue.objects.in_shard_of(self.project) \
+            .filter(project=self.project) \
+            .in_bulk([issue_id for issue_id in ids
+                      if is_id(issue_id)])
+        instances, errors = [], []
+        seen = set()
+        for issue_id in ids:
+            issue = issues.get(issue_id) if is_id(issue_id) \
+                else None
+            if issue is None:
+                errors.append({'id': ['Issue not found in this project']})
+            elif issue_id in seen:
+                errors.append({'id': ['Issue given more than once']})
+            elif issue.author_user_id != self.request.user.pk:
+                errors.append({'id': ["You are not the Author of this "
+                                      "element, you can't modify it."]})
+            else:
+                errors.append({})
+            seen.add(issue_id)
+            instances.append(issue)
+        return instances, errors
+
+    def post(self, *args, **kwargs):
+        """with a POST of a list, add issues in a project
+        Response can be :
+        HTTP_201_CREATED : all issues added
+        HTTP_400_BAD_REQUEST : errors of each item"""
+        serializer = self.serializer(data=self.get_items(),
+                                     many=True,
+                                     context={'request': self.request,
+                                              'user': self.request.user,
+                                              'project': self.project})
+
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        else:
+            return Response(serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    def patch(self, *args, **kwargs):
+        """with a PATCH of a list of partial issues with their id,
+        update them
+        Response can be :
+        HTTP_200_OK : all issues modified
+        HTTP_400_BAD_REQUEST : errors of each item"""
+        items = self.get_items()
+        instances, errors = self.get_own_issues(
+            [item.get('id') if isinstance(item, dict) else None
+             for item in items])
+
+        serializer = self.serializer(instance=instances,
+                                     data=items,
+                                     many=True,
+                                     partial=True,
+                                     context={'request': self.request,
+                                              'project': self.project})
+
+        # both lists of errors must be empty
+        if serializer.is_valid() and not any(errors):
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        else:
+            errors = [{**item_errors, **serializer_errors}
+                      for item_errors, serializer_errors
+                      in zip(errors, serializer.errors or [{}] * len(items))]
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def delete(self, *args, **kwargs):
+        """with a DELETE of a list of ids, remove these issues,
+        they are hidden at once and deleted in background
+        Response can be :
+        HTTP_202_ACCEPTED : all issues are being deleted
+        HTTP_400_BAD_REQUEST : errors of each item"""
+        instances, errors = self.get_own_issues(self.get_items())
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        deleted = deletion.delete_issues(self.project, instances)
+        return Response(f'{len(deleted)} issues are being deleted',
+                        status=status.HTTP_202_ACCEPTED)
+
+
 class CommentsFromIssueFromProjectAPIView(AccessGenericAPIViewForSoftDesk):
     serializer = CommentSerializer
     model_class = Comment
+    cached = True
 
-    def get(self, *args, **kwargs):
-        """give a list of instances from a class linked to a project
-        can be Users, Issues..."""
-        queryset = self.model_class.objects.filter(issue=self.issue.id)
-        serializer = self.serializer(queryset, many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        """give the comments linked to the issue, from its shard"""
+        return self.model_class.objects.in_shard_of(self.project) \
+            .filter(issue=self.issue.id)
 
 
 class ManageCommentsFromIssueFromProjectAPIView(
@@ -118,6 +359,153 @@ class ManageCommentsFromIssueFromProjectAPIView(
     model_class = Comment
 
     def get(self, *args, **kwargs):
-        """give detail view on 1 comment corresponding to id furnished"""
-        serializer = self.serializer(self.comment)
-        return Response(serializer.data)
+        """give detail view on 1 comment corresponding to id furnished,
+        or HTTP_304_NOT_MODIFIED if the client version is still valid"""
+        validators = conditional.make_validators(self.request,
+                                                 self.comment.updated_time)
+        if response := conditional.not_modified(self.request,
+                                                *validators):
+            return response
+
+        serializer = self.serializer(self.comment,
+                                     context={'request': self.request})
+        return conditional.set_validators(Response(serializer.data),
+                                          *validators)
+
+
+class ExportProjectAPIView(GenericAPIViewForSoftDesk):
+    """Stream a whole project (contributors, issues and comments)
+    as NDJSON (default) or CSV, chosen with Accept header or ?format="""
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    chunk_size = 2000
+
+    def get(self, *args, **kwargs):
+        """rows are encoded and sent while they are read from database"""
+        renderer = self.request.accepted_renderer
+        rows = export_project(self.project, chunk_size=self.chunk_size)
+        response = StreamingHttpResponse(
+            renderer.stream(rows, EXPORT_COLUMNS),
+            content_type=f'{renderer.media_type}; '
+                         f'charset={renderer.charset}')
+        response['Content-Disposition'] = \
+            f'attachment; filename="project-{self.project.id}.' \
+            f'{renderer.format}"'
+        return response
+
+
+class SearchProjectAPIView(GenericAPIViewForSoftDesk):
+    """Full-text search of words (?q=) in titles and descriptions
+    of the issues and comments of a project, best matches first"""
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, *args, **kwargs):
+        """Response can be :
+        HTTP_200_OK : list of matches, with a snippet of the text
+        HTTP_400_BAD_REQUEST : q is missing"""
+        query = self.request.query_params.get('q', '')
+        if not query.strip():
+            return Response({'You should give words to search with q'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(self.request.query_params.get('limit',
+                                                      self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        limit = max(1, min(limit, self.max_limit))
+
+        return Response({'results': search.search(query,
+                                                  self.project.id,
+                                                  limit)})
+
+
+class ChangesFromProjectAPIView(GenericAPIViewForSoftDesk):
+    """Change feed of a project : what has changed since a cursor (?since=),
+    the last change of each object only, with the object for an upsert
+    and only its id for a deletion"""
+    serializers = {'project': (Project, ProjectChangeSerializer),
+                   'contributor': (Contributor, ContributorSerializer),
+                   'issue': (Issue, IssueSerializer),
+                   'comment': (Comment, CommentSerializer)}
+    default_limit = 500
+    max_limit = 1000
+
+    def get(self, *args, **kwargs):
+        """without since, only the current cursor is given, to be used
+        after a full download of the project
+        Response can be :
+        HTTP_200_OK : changes, next cursor and if there are more changes
+        HTTP_400_BAD_REQUEST : invalid cursor
+        HTTP_410_GONE : changes since the cursor are not kept anymore"""
+        since = self.request.query_params.get('since')
+        if not since:
+            return Response({
+                'cursor': changes.encode_cursor(
+                    changes.last_change_id(self.project.id)),
+                'more': False,
+                'changes': []})
+
+        try:
+            change_id, timestamp = changes.decode_cursor(since)
+        except ValueError:
+            return Response({'Invalid cursor'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if changes.is_expired(timestamp):
+            return Response({'Cursor has expired, '
+                             'the project must be downloaded again'},
+                            status=status.HTTP_410_GONE)
+
+        try:
+            limit = int(self.request.query_params.get('limit',
+                                                      self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        limit = max(1, min(limit, self.max_limit))
+
+        rows, last_id, more = changes.changes_since(self.project.id,
+                                                    change_id, limit)
+        return Response({'cursor': changes.encode_cursor(last_id),
+                         'more': more,
+                         'changes': self.serialize(rows)})
+
+    def serialize(self, rows):
+        """one query and one serializer for the objects of each model,
+        with the relations they expand, an object deleted since
+        its upsert gives a tombstone"""
+        ids = {}
+        for change in rows:
+            if change.action == Change.Action.UPSERT:
+                ids.setdefault(change.model, []).append(change.object_id)
+        data = {}
+        for model, pks in ids.items():
+            model_class, serializer = self.serializers[model]
+            queryset = model_class.objects.all()
+            if model_class in sharding.SHARDED_MODELS:
+                queryset = queryset.in_shard_of(self.project)
+            queryset = serializer.optimize_queryset(queryset, self.request)
+            instances = queryset.in_bulk(pks).values()
+            data[model] = {item['id']: item for item
+                           in serializer(instances, many=True,
+                                         context={'request': self.request})
+                           .data}
+
+        deltas = []
+        for change in rows:
+            item = data.get(change.model, {}).get(change.object_id)
+            delta = {'type': change.model, 'id': change.object_id}
+            if item is None:
+                delta['action'] = Change.Action.DELETE
+            else:
+                delta['action'] = Change.Action.UPSERT
+                delta['data'] = item
+            deltas.append(delta)
+        return deltas
+
+
+class ResponseCacheStatsAPIView(APIView):
+    """Hits and misses of the cache of list pages in this process,
+    for monitoring, staff users only"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, *args, **kwargs):
+        return Response(response_cache.statistics())
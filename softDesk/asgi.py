@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'softDesk.settings')
+# each request runs its queries in a new thread, a persistent connection
+# would be left open by each of them (see CONN_MAX_AGE in settings.py)
+os.environ.setdefault('CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
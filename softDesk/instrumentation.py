@@ -0,0 +1,187 @@
+"""Measures of each request, without DEBUG : InstrumentationMiddleware
+counts the SQL queries of every database with an execute_wrapper and
+times the phases of the response :
+- db : time spent in SQL queries,
+- serializer : to_representation of the response serializers
+  (restAPI/fieldsets.py), their own queries excluded,
+- render : rendering of the response by its renderer,
+- total : the whole request, in this middleware.
+They are given to the client in a Server-Timing header (SERVER_TIMING)
+and logged as JSON for INSTRUMENTATION_SAMPLE_RATE of the requests.
+A statement run DUPLICATE_QUERY_THRESHOLD times or more in a request
+(N+1 queries) is always logged, as a warning.
+Each query only costs two clock reads and a counter increment.
+The middleware is async capable : under ASGI the queries of a request
+run in its thread of sync_to_async calls, the wrappers are set there"""
+import asyncio
+import json
+import logging
+import random
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('db', 'serializer', 'render')
+
+current = ContextVar('instrumentation', default=None)
+
+
+class RequestStats:
+    """measures of one request, times in seconds"""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.times = dict.fromkeys(PHASES, 0.0)
+        # number of runs of each statement, parameters apart
+        self.statements = Counter()
+        self.view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper of the connections"""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.times['db'] += perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def duplicates(self) -> dict:
+        """statements run DUPLICATE_QUERY_THRESHOLD times or more"""
+        threshold = settings.DUPLICATE_QUERY_THRESHOLD
+        return {sql: count for sql, count in self.statements.items()
+                if count >= threshold}
+
+    def server_timing(self, total) -> str:
+        metrics = [f'db;dur={self.times["db"] * 1000:.2f};'
+                   f'desc="{self.queries} queries"']
+        metrics += [f'{name};dur={self.times[name] * 1000:.2f}'
+                    for name in PHASES[1:]]
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(metrics)
+
+
+@contextmanager
+def phase(name):
+    """add the time of the block to the phase name of the current
+    request, without the queries run inside"""
+    stats = current.get()
+    if stats is None:
+        yield
+        return
+    start, db_time = perf_counter(), stats.times['db']
+    try:
+        yield
+    finally:
+        stats.times[name] += perf_counter() - start \
+            - (stats.times['db'] - db_time)
+
+
+def view_name(view_func, method) -> str:
+    """class of an API view, with the action of a viewset"""
+    view_class = getattr(view_func, 'cls', None) \
+        or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', repr(view_func))
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    return f'{view_class.__name__}.{action}' if action \
+        else view_class.__name__
+
+
+class InstrumentationMiddleware:
+    """Measure each request, should be the first middleware
+    so that total covers the others"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # awaited by the handler when the next middleware is async
+        self._is_coroutine = asyncio.coroutines._is_coroutine \
+            if asyncio.iscoroutinefunction(get_response) else None
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current.set(stats)
+        try:
+            with self.wrap_connections(stats):
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        try:
+            # connections belong to the thread running the queries
+            stack = await sync_to_async(self.wrap_connections)(stats)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            current.reset(token)
+        return self.finish(request, response, stats)
+
+    @staticmethod
+    def wrap_connections(stats) -> ExitStack:
+        """count the queries of every database in stats, until the
+        returned stack is closed"""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        return stack
+
+    def finish(self, request, response, stats):
+        total = perf_counter() - stats.start
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = stats.server_timing(total)
+        self.log(request, response, stats, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current.get().view = view_name(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        """time the rendering, done by the handler after this call"""
+        stats = current.get()
+        start, db_time = perf_counter(), stats.times['db']
+
+        def rendered(response):
+            stats.times['render'] += perf_counter() - start \
+                - (stats.times['db'] - db_time)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def log(request, response, stats, total):
+        duplicates = stats.duplicates()
+        if not duplicates \
+                and random.random() >= settings.INSTRUMENTATION_SAMPLE_RATE:
+            return
+        entry = {'view': stats.view,
+                 'method': request.method,
+                 'path': request.path,
+                 'status': response.status_code,
+                 'queries': stats.queries,
+                 **{f'{name}_ms': round(stats.times[name] * 1000, 2)
+                    for name in PHASES},
+                 'total_ms': round(total * 1000, 2)}
+        if duplicates:
+            entry['duplicates'] = [{'sql': sql, 'count': count}
+                                   for sql, count in duplicates.items()]
+            logger.warning(json.dumps(entry))
+        else:
+            logger.info(json.dumps(entry))
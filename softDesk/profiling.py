@@ -0,0 +1,198 @@
+"""Profiles of requests, opt-in : ProfilingMiddleware is only used
+when PROFILE_SLOW_REQUEST_MS or PROFILE_TOKEN is set.
+- A request giving PROFILE_TOKEN in its X-Profile header is profiled
+  with cProfile (every call, slower).
+- With PROFILE_SLOW_REQUEST_MS, the stack of each request is sampled
+  every PROFILE_SAMPLE_INTERVAL seconds by a thread, and the samples
+  of requests longer than the threshold are kept.
+Profiles are stored as JSON files in PROFILE_DIRECTORY, the newest
+PROFILE_KEEP only, with the time spent in each function : own time
+(in the function itself) and cumulative time (with its callees).
+They are listed and summed by the profiles command.
+Under ASGI, async views run out of the sampled thread, use the header"""
+import cProfile
+import hmac
+import json
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from softDesk.instrumentation import view_name
+
+HEADER = 'X-Profile'
+
+
+def function_name(code) -> str:
+    # same as pstats
+    return f'{code.co_filename}:{code.co_firstlineno}({code.co_name})'
+
+
+class Sampler:
+    """a daemon thread sampling the stacks of the threads registered,
+    started on first use"""
+
+    def __init__(self):
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self, ident) -> Counter:
+        """sample thread ident until stop(), return its samples
+        (stack of function names -> number of samples)"""
+        samples = Counter()
+        with self.lock:
+            self.threads[ident] = samples
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run,
+                                               name='sampler', daemon=True)
+                self.thread.start()
+        return samples
+
+    def stop(self, ident):
+        with self.lock:
+            del self.threads[ident]
+
+    def run(self):
+        while True:
+            time.sleep(settings.PROFILE_SAMPLE_INTERVAL)
+            with self.lock:
+                frames = sys._current_frames()
+                for ident, samples in self.threads.items():
+                    frame, stack = frames.get(ident), []
+                    while frame is not None:
+                        stack.append(function_name(frame.f_code))
+                        frame = frame.f_back
+                    # from the outermost call
+                    samples[tuple(reversed(stack))] += 1
+
+
+sampler = Sampler()
+
+
+def sampled_functions(samples: Counter, interval) -> dict:
+    """function name -> [own time, cumulative time] from samples"""
+    functions = {}
+    for stack, count in samples.items():
+        for name in set(stack):
+            functions.setdefault(name, [0.0, 0.0])[1] += count * interval
+        if stack:
+            functions[stack[-1]][0] += count * interval
+    return functions
+
+
+def profiled_functions(profile: cProfile.Profile) -> dict:
+    """function name -> [own time, cumulative time] from cProfile"""
+    return {pstats.func_std_string(function): [own, cumulative]
+            for function, (_, _, own, cumulative, _)
+            in pstats.Stats(profile).stats.items()}
+
+
+def directory() -> Path:
+    return Path(settings.PROFILE_DIRECTORY)
+
+
+def store(profile: dict):
+    """write a profile, and remove the oldest ones over PROFILE_KEEP"""
+    path = directory()
+    path.mkdir(parents=True, exist_ok=True)
+    # names are ordered by time
+    name = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{profile["view"]}.json'
+    (path / name).write_text(json.dumps(profile))
+    for old in sorted(path.glob('*.json'))[:-settings.PROFILE_KEEP]:
+        old.unlink(missing_ok=True)
+
+
+def load_profiles(view=None) -> list:
+    """stored profiles, oldest first, of view only if given"""
+    profiles = []
+    for path in sorted(directory().glob('*.json')):
+        try:
+            profile = json.loads(path.read_text())
+        except (OSError, ValueError):
+            # removed or being written
+            continue
+        if view is None or profile['view'].split('.')[0] == view:
+            profiles.append({**profile, 'file': path.name})
+    return profiles
+
+
+def top_functions(profiles, key='own', limit=20) -> list:
+    """(function name, own time, cumulative time) summed over profiles,
+    largest first"""
+    totals = {}
+    for profile in profiles:
+        for name, times in profile['functions'].items():
+            total = totals.setdefault(name, [0.0, 0.0])
+            total[0] += times[0]
+            total[1] += times[1]
+    index = 0 if key == 'own' else 1
+    return [(name, *times) for name, times
+            in sorted(totals.items(), key=lambda item: -item[1][index])
+            [:limit]]
+
+
+class ProfilingMiddleware:
+    """Profile a request asked by its header, or sample every request
+    and keep those slower than PROFILE_SLOW_REQUEST_MS"""
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_SLOW_REQUEST_MS \
+                and not settings.PROFILE_TOKEN:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    @staticmethod
+    def is_asked(request) -> bool:
+        token = request.headers.get(HEADER)
+        return bool(settings.PROFILE_TOKEN) and token is not None \
+            and hmac.compare_digest(token.encode(),
+                                    settings.PROFILE_TOKEN.encode())
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        profile = samples = None
+        if self.is_asked(request):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+        elif settings.PROFILE_SLOW_REQUEST_MS:
+            ident = threading.get_ident()
+            samples = sampler.start(ident)
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop(ident)
+        else:
+            return self.get_response(request)
+
+        duration = (time.perf_counter() - start) * 1000
+        if profile is not None:
+            kind, functions = 'cprofile', profiled_functions(profile)
+        elif duration >= settings.PROFILE_SLOW_REQUEST_MS:
+            kind, functions = 'sampling', sampled_functions(
+                samples, settings.PROFILE_SAMPLE_INTERVAL)
+        else:
+            return response
+
+        store({'view': getattr(request, 'profiled_view', 'unknown'),
+               'method': request.method,
+               'path': request.path,
+               'status': response.status_code,
+               'duration_ms': round(duration, 2),
+               'time': datetime.now().isoformat(),
+               'kind': kind,
+               'functions': functions})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.profiled_view = view_name(view_func, request.method)
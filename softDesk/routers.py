@@ -0,0 +1,148 @@
+"""Database routing on read replicas : writes go to the primary database
+('default'), reads are spread on the DATABASE_REPLICA_ALIASES.
+
+Replicas may lag behind the primary, so reads go to the primary :
+- during a write request (POST, PUT, PATCH, DELETE),
+- for a user during REPLICA_STICKINESS seconds after a write request
+  of this user (read-your-writes), views pin them with pin_for(request).
+  The response to a write carries a signed cookie with the user and its
+  time, so that any process serving the next requests can tell.
+ReadReplicaMiddleware sets and resets the pin for each request, it is
+only used with DATABASE_REPLICAS.
+
+Issues and comments may also be stored in shards, see restAPI/sharding.py"""
+import asyncio
+import random
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.permissions import SAFE_METHODS
+
+use_primary = ContextVar('use_primary', default=False)
+
+
+def replica_aliases() -> list:
+    return getattr(settings, 'DATABASE_REPLICA_ALIASES', [])
+
+
+def shard_aliases() -> list:
+    return getattr(settings, 'DATABASE_SHARD_ALIASES', [])
+
+
+@contextmanager
+def atomic(*aliases):
+    """a transaction on each database given (once), for writes spread
+    on several databases, they are committed one after the other"""
+    with ExitStack() as stack:
+        for alias in dict.fromkeys(aliases):
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+@contextmanager
+def primary():
+    """read from the primary inside the block, for work done out of
+    a request (background threads, commands)"""
+    token = use_primary.set(True)
+    try:
+        yield
+    finally:
+        use_primary.reset(token)
+
+
+STICKY_COOKIE = 'primary'
+
+
+def stick_to_primary(response, user_id):
+    """read from the primary for user during REPLICA_STICKINESS seconds"""
+    if replica_aliases():
+        response.set_signed_cookie(STICKY_COOKIE, user_id,
+                                   salt=STICKY_COOKIE,
+                                   max_age=settings.REPLICA_STICKINESS,
+                                   httponly=True, samesite='Lax')
+
+
+def pin_for(request):
+    """read from the primary for the rest of the request
+    if its user has written recently"""
+    if replica_aliases() and not use_primary.get():
+        # the signature is dated, an older cookie is ignored
+        user_id = request.get_signed_cookie(
+            STICKY_COOKIE, default=None, salt=STICKY_COOKIE,
+            max_age=settings.REPLICA_STICKINESS)
+        if user_id is not None and user_id == str(request.user.pk):
+            use_primary.set(True)
+
+
+class ReadReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas or use_primary.get():
+            return DEFAULT_DB_ALIAS
+        # relations of an instance are read where it has been read
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in replicas:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary, not migrated on their own
+        return db not in replica_aliases()
+
+
+class ReadReplicaMiddleware:
+    """Pin reads of a write request to the primary, and make its user
+    stick to the primary for the next requests"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # awaited by the handler when the next middleware is async
+        self._is_coroutine = asyncio.coroutines._is_coroutine \
+            if asyncio.iscoroutinefunction(get_response) else None
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        is_write = request.method not in SAFE_METHODS
+        token = use_primary.set(is_write)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_primary.reset(token)
+        return self.stick(request, response, is_write)
+
+    async def __acall__(self, request):
+        is_write = request.method not in SAFE_METHODS
+        token = use_primary.set(is_write)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_primary.reset(token)
+        if not is_write:
+            return response
+        # the user of the session may be read from the database
+        return await sync_to_async(self.stick)(request, response, is_write)
+
+    @staticmethod
+    def stick(request, response, is_write):
+        # user authenticated by DRF is also given to the django request
+        user = getattr(request, 'user', None)
+        if is_write and user is not None and user.is_authenticated:
+            stick_to_primary(response, user.pk)
+        return response
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 from datetime import timedelta
+from importlib.util import find_spec
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
+
+from softDesk.sqlite_backend.pragmas import DEFAULT_PRAGMAS
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,24 +49,53 @@ INSTALLED_APPS = [
     'restAPI'
 ]
 
+# build request.user from token claims, without reading the users table
+STATELESS_JWT = config('STATELESS_JWT', default=False, cast=bool)
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 5,
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'authentication.authentication.ClaimsJWTAuthentication'
+        if STATELESS_JWT else
         'rest_framework_simplejwt.authentication.JWTAuthentication',),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # encoding with JSON_BACKEND, see restAPI/jsonlib.py
+    'DEFAULT_RENDERER_CLASSES': [
+        'restAPI.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'restAPI.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# application/msgpack is negotiated when msgpack is installed
+if find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append(
+        'restAPI.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append(
+        'restAPI.parsers.MessagePackParser')
+
+# 'orjson', 'json' (stdlib) or 'auto' for the fastest installed
+JSON_BACKEND = config('JSON_BACKEND', default='auto')
+
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=20),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=20),
+    'TOKEN_OBTAIN_SERIALIZER':
+        'authentication.serializers.ClaimsTokenObtainPairSerializer',
 }
 
 MIDDLEWARE = [
+    'softDesk.instrumentation.InstrumentationMiddleware',
+    'softDesk.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,6 +103,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'softDesk.routers.ReadReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'softDesk.urls'
@@ -97,13 +130,142 @@ WSGI_APPLICATION = 'softDesk.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# WAL, pragmas and BEGIN IMMEDIATE for concurrent writers,
+# see softDesk/sqlite_backend
+SQLITE_TUNING = config('SQLITE_TUNING', default=True, cast=bool)
+
+# pragmas are set once per connection, connections are kept CONN_MAX_AGE
+# seconds. Not under ASGI, where each request runs its queries in a new
+# thread whose connection is never reused : softDesk/asgi.py sets it to 0
+CONN_MAX_AGE = config('CONN_MAX_AGE', default=60 if SQLITE_TUNING else 0,
+                      cast=int)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'softDesk.sqlite_backend'
+        if SQLITE_TUNING else 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'PRAGMAS': DEFAULT_PRAGMAS if SQLITE_TUNING else {},
+        'TRANSACTION_MODE': 'IMMEDIATE' if SQLITE_TUNING else None,
+        'CONN_MAX_AGE': CONN_MAX_AGE,
     }
 }
 
+# read replicas of the default database (paths of SQLite files kept up
+# to date by an external replication), reads are spread on them and
+# writes go to default, see softDesk/routers.py
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+
+DATABASE_REPLICA_ALIASES = []
+for number, name in enumerate(DATABASE_REPLICAS, start=1):
+    alias = f'replica{number}'
+    DATABASE_REPLICA_ALIASES.append(alias)
+    DATABASES[alias] = {**DATABASES['default'],
+                        'NAME': name,
+                        'TRANSACTION_MODE': None,
+                        # tests read the default test database
+                        'TEST': {'MIRROR': 'default'}}
+
+# shards of issues and comments (paths of SQLite files), projects are
+# spread on them, see restAPI/sharding.py. Their foreign keys reference
+# projects and users of the default database and can't be checked
+DATABASE_SHARDS = config('DATABASE_SHARDS', default='', cast=Csv())
+
+DATABASE_SHARD_ALIASES = []
+for number, name in enumerate(DATABASE_SHARDS, start=1):
+    alias = f'shard{number}'
+    DATABASE_SHARD_ALIASES.append(alias)
+    DATABASES[alias] = {**DATABASES['default'],
+                        'ENGINE': 'softDesk.sqlite_backend',
+                        'NAME': name,
+                        'PRAGMAS': {**DATABASES['default']['PRAGMAS'],
+                                    'foreign_keys': 'OFF'},
+                        'SHARD': True}
+
+# ids of issues and comments reserved at once by a process
+SHARD_ID_BLOCK = 100
+
+DATABASE_ROUTERS = ['restAPI.sharding.ShardRouter',
+                    'softDesk.routers.ReadReplicaRouter']
+
+# seconds during which a user who has written reads from default
+REPLICA_STICKINESS = config('REPLICA_STICKINESS', default=5, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # roles of users in projects, see restAPI/membership.py
+    'membership': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'membership',
+        'TIMEOUT': 600,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # rendered list pages, see restAPI/response_cache.py : per process
+    # (their key is the version of the project, read from the database),
+    # least recently used pages are removed past MAX_ENTRIES
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 60,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+MEMBERSHIP_CACHE = 'membership'
+RESPONSE_CACHE = 'responses'
+
+# current token version of users, see authentication/authentication.py
+TOKEN_VERSION_CACHE = 'default'
+TOKEN_VERSION_CACHE_TIMEOUT = 60
+
+# changes kept for the change feed, see restAPI/changes.py,
+# older cursors must do a full sync again
+CHANGE_FEED_RETENTION_DAYS = 30
+
+# projects and issues are deleted in background, DELETION_BATCH_SIZE rows
+# per transaction, see restAPI/deletion.py.
+# With DELETION_EAGER, they are deleted during the request (tests)
+DELETION_BATCH_SIZE = config('DELETION_BATCH_SIZE', default=500, cast=int)
+DELETION_EAGER = config('DELETION_EAGER', default=False, cast=bool)
+
+# measures of each request, see softDesk/instrumentation.py :
+# Server-Timing header, share of the requests logged (none by default),
+# and number of runs of a statement in a request logged as N+1 queries
+SERVER_TIMING = config('SERVER_TIMING', default=True, cast=bool)
+INSTRUMENTATION_SAMPLE_RATE = config('INSTRUMENTATION_SAMPLE_RATE',
+                                     default=0.0, cast=float)
+DUPLICATE_QUERY_THRESHOLD = config('DUPLICATE_QUERY_THRESHOLD',
+                                   default=10, cast=int)
+
+# profiles of requests, see softDesk/profiling.py : requests longer than
+# PROFILE_SLOW_REQUEST_MS (0 : none) are sampled, those with the
+# X-Profile: <PROFILE_TOKEN> header are profiled with cProfile
+PROFILE_SLOW_REQUEST_MS = config('PROFILE_SLOW_REQUEST_MS', default=0,
+                                 cast=int)
+PROFILE_TOKEN = config('PROFILE_TOKEN', default='')
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_DIRECTORY = config('PROFILE_DIRECTORY', default=BASE_DIR / 'profiles')
+PROFILE_KEEP = config('PROFILE_KEEP', default=100, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'softDesk.instrumentation': {'handlers': ['console'],
+                                     'level': 'INFO',
+                                     'propagate': False},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -0,0 +1,42 @@
+"""SQLite backend of Django with :
+- PRAGMAS of the database settings applied on every new connection
+  (connection_created signal)
+- TRANSACTION_MODE of the database settings ('IMMEDIATE' or 'EXCLUSIVE')
+  used to begin transactions : the write lock is taken at BEGIN, so two
+  transactions reading then writing can't deadlock into an immediate
+  'database is locked', the second one waits for busy_timeout.
+  It applies to every atomic block, which can't tell if it will write :
+  a block only reading also takes the write lock and waits for writers,
+  so reads are left out of atomic blocks (autocommit reads in WAL
+  never wait)
+- SHARD databases hold rows referencing rows of another database,
+  their foreign keys are never checked (with 'foreign_keys': 'OFF'
+  in PRAGMAS)"""
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+from django.dispatch import receiver
+
+from .pragmas import apply_pragmas
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        """BEGIN of every atomic block, read-only ones included"""
+        mode = self.settings_dict.get('TRANSACTION_MODE')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
+
+    def check_constraints(self, table_names=None):
+        if not self.settings_dict.get('SHARD'):
+            super().check_constraints(table_names)
+
+    def enable_constraint_checking(self):
+        if not self.settings_dict.get('SHARD'):
+            super().enable_constraint_checking()
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection.connection,
+                      connection.settings_dict.get('PRAGMAS', {}))
@@ -0,0 +1,27 @@
+"""PRAGMAs applied on every new SQLite connection.
+Kept free of Django imports, to be used by settings and benchmarks"""
+
+# write-ahead log : readers don't block the writer and the writer
+# doesn't block readers
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # with WAL, fsync on checkpoints only, still safe on application crash
+    'synchronous': 'NORMAL',
+    # 256 MiB of the database file read through memory mapping
+    'mmap_size': 256 * 1024 * 1024,
+    # negative is in KiB : 64 MiB of page cache per connection
+    'cache_size': -64 * 1024,
+    # wait for a lock (in ms) instead of failing at once
+    'busy_timeout': 5000,
+    'foreign_keys': 'ON',
+}
+
+
+def apply_pragmas(connection, pragmas):
+    """apply pragmas on a DB-API sqlite3 connection"""
+    cursor = connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
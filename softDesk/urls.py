@@ -22,11 +22,17 @@ from rest_framework_simplejwt.views \
 
 from authentication.views import RegisterView
 from restAPI.views.views import ProjectViewSet, \
-    UsersFromProjectAPIView, \
+    UsersFromProjectAPIView, BulkUsersFromProjectAPIView, \
     ManageUserFromProjectAPIView, \
     IssuesFromProjectAPIView, ManageIssuesFromProjectAPIView, \
+    BulkIssuesFromProjectAPIView, \
     CommentsFromIssueFromProjectAPIView, \
-    ManageCommentsFromIssueFromProjectAPIView
+    ManageCommentsFromIssueFromProjectAPIView, ExportProjectAPIView, \
+    SearchProjectAPIView, ChangesFromProjectAPIView, \
+    ResponseCacheStatsAPIView
+from restAPI.views.async_views import AsyncUsersFromProjectView, \
+    AsyncIssuesFromProjectView, AsyncCommentsFromIssueFromProjectView, \
+    AsyncCommentFromIssueFromProjectView
 
 # create a router to handle classical uri as projects/ or projects/{id}/
 router = routers.SimpleRouter()
@@ -52,6 +58,9 @@ urlpatterns = [
     path('projects/<int:project_id>/users/',
          UsersFromProjectAPIView.as_view(),
          name='users-from-project'),
+    path('projects/<int:project_id>/users/bulk',
+         BulkUsersFromProjectAPIView.as_view(),
+         name='bulk-users-from-project'),
     path('projects/<int:project_id>/users/<int:user_id>',
          ManageUserFromProjectAPIView.as_view(),
          name='delete-user-from-project'),
@@ -63,6 +72,9 @@ urlpatterns = [
     path('projects/<int:project_id>/issues/<int:issue_id>',
          ManageIssuesFromProjectAPIView.as_view(),
          name='issue-from-project'),
+    path('projects/<int:project_id>/issues/bulk',
+         BulkIssuesFromProjectAPIView.as_view(),
+         name='bulk-issues-from-project'),
 
     # Comment views (URI 15 to 19)
     path('projects/<int:project_id>/issues/<int:issue_id>/comments/',
@@ -73,4 +85,39 @@ urlpatterns = [
          ManageCommentsFromIssueFromProjectAPIView.as_view(),
          name='comment-from-issues-from-project'),
 
+    # Export of a whole project
+    path('projects/<int:project_id>/export',
+         ExportProjectAPIView.as_view(),
+         name='export-project'),
+
+    # Full-text search in a project
+    path('projects/<int:project_id>/search',
+         SearchProjectAPIView.as_view(),
+         name='search-project'),
+
+    # Change feed of a project
+    path('projects/<int:project_id>/changes',
+         ChangesFromProjectAPIView.as_view(),
+         name='changes-from-project'),
+
+    # Hits and misses of the cache of list pages, for monitoring
+    path('monitoring/response-cache',
+         ResponseCacheStatsAPIView.as_view(),
+         name='response-cache-stats'),
+
+    # Async variants of read views, for ASGI servers
+    path('async/projects/<int:project_id>/users/',
+         AsyncUsersFromProjectView.as_view(),
+         name='async-users-from-project'),
+    path('async/projects/<int:project_id>/issues/',
+         AsyncIssuesFromProjectView.as_view(),
+         name='async-issues-from-project'),
+    path('async/projects/<int:project_id>/issues/<int:issue_id>/comments/',
+         AsyncCommentsFromIssueFromProjectView.as_view(),
+         name='async-comments-from-issues-from-project'),
+    path('async/projects/<int:project_id>/issues/'
+         '<int:issue_id>/comments/<int:comment_id>',
+         AsyncCommentFromIssueFromProjectView.as_view(),
+         name='async-comment-from-issues-from-project'),
+
 ]